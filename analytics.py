@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time-bucketed counters per group and per keyword
+Each counted series has a minute, an hour and a day ring. All rings of a
+table live in flat preallocated arrays (bucket-major, one slot per key),
+so memory is fixed by the key capacity and a bucket rollover clears one
+contiguous slice. Counting is a dict lookup plus one increment per ring;
+the current bucket is advanced by a ticker, not per message.
+"""
+
+import asyncio
+import os
+import time
+from array import array
+from operator import add, sub
+
+from metrics import REGISTRY
+
+# (name, bucket width in seconds, buckets kept)
+RESOLUTIONS = (
+    ('minute', 60, 60),
+    ('hour', 3600, 24),
+    ('day', 86400, 7),
+)
+MINUTE, HOUR, DAY = range(len(RESOLUTIONS))
+
+# Keys beyond a table's capacity are counted together under this slot
+OVERFLOW_KEY = 'other'
+
+_SPARKS = '▁▂▃▄▅▆▇█'
+
+
+def sparkline(values) -> str:
+    peak = max(values, default=0)
+    if not peak:
+        return _SPARKS[0] * len(values)
+    return ''.join(_SPARKS[min(len(_SPARKS) - 1, value * len(_SPARKS) // (peak + 1))]
+                   for value in values)
+
+
+class BucketRing:
+    """``length`` buckets of ``width`` seconds for ``slots`` keys, one array"""
+
+    __slots__ = ('slots', 'length', 'width', 'data', 'closed', 'epoch', 'offset', '_zero')
+
+    def __init__(self, slots: int, width: int, length: int, now: float):
+        self.slots = slots
+        self.width = width
+        self.length = length
+        self.data = array('I', bytes(4 * slots * length))
+        self._zero = array('I', bytes(4 * slots))
+        # Per-slot sum of the kept buckets other than the current one,
+        # updated at rollover so totals never walk every bucket
+        self.closed = array('I', bytes(4 * slots))
+        self.epoch = int(now // width)
+        self.offset = (self.epoch % length) * slots
+
+    def advance(self, now: float):
+        """Move to the bucket of ``now``, clearing every bucket skipped over"""
+        epoch = int(now // self.width)
+        if epoch <= self.epoch:
+            return
+        slots = self.slots
+        data = self.data
+        steps = epoch - self.epoch
+        if steps >= self.length:
+            data[:] = array('I', bytes(4 * slots * self.length))
+            self.closed = array('I', bytes(4 * slots))
+            steps = 0
+        for step in range(steps):
+            current = ((self.epoch + step) % self.length) * slots
+            start = ((self.epoch + step + 1) % self.length) * slots
+            # The finished bucket joins the window, the oldest one leaves it
+            self.closed = array('I', map(sub, map(add, self.closed, data[current:current + slots]),
+                                         data[start:start + slots]))
+            data[start:start + slots] = self._zero
+        self.epoch = epoch
+        self.offset = (epoch % self.length) * slots
+
+    def buckets(self):
+        """Bucket start offsets, oldest first"""
+        current = self.epoch % self.length
+        return [((current + 1 + i) % self.length) * self.slots for i in range(self.length)]
+
+    def totals(self):
+        """Sum of all kept buckets for every slot"""
+        offset = self.offset
+        return list(map(add, self.closed, self.data[offset:offset + self.slots]))
+
+    def series(self, slot: int = None):
+        """Per-bucket counts of one slot (or of all slots), oldest first"""
+        slots = self.slots
+        if slot is None:
+            return [sum(self.data[start:start + slots]) for start in self.buckets()]
+        return [self.data[start + slot] for start in self.buckets()]
+
+
+class SeriesTable:
+    """Counters of a bounded set of keys, every field at every resolution"""
+
+    def __init__(self, fields, capacity: int, now: float = None):
+        now = now or time.time()
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._slots = {OVERFLOW_KEY: 0}
+        self.keys = [OVERFLOW_KEY]
+        self.rings = tuple(
+            tuple(BucketRing(capacity, width, length, now) for _, width, length in RESOLUTIONS)
+            for _ in self.fields)
+
+    def slot(self, key) -> int:
+        slot = self._slots.get(key)
+        if slot is None:
+            if len(self.keys) >= self.capacity:
+                return 0
+            slot = self._slots[key] = len(self.keys)
+            self.keys.append(key)
+        return slot
+
+    def add(self, key, field: int = 0, amount: int = 1):
+        slot = self.slot(key)
+        for ring in self.rings[field]:
+            ring.data[ring.offset + slot] += amount
+
+    def advance(self, now: float):
+        for rings in self.rings:
+            for ring in rings:
+                ring.advance(now)
+
+    def totals(self, resolution: int):
+        """{key: (total per field)} over the kept buckets of one resolution"""
+        per_field = [rings[resolution].totals() for rings in self.rings]
+        return {key: tuple(column[slot] for column in per_field)
+                for slot, key in enumerate(self.keys)
+                if any(column[slot] for column in per_field)}
+
+    def memory_bytes(self) -> int:
+        return sum((len(ring.data) + len(ring.closed)) * ring.data.itemsize
+                   for rings in self.rings for ring in rings)
+
+
+class Analytics:
+    """Messages seen and matches per group, matches per keyword"""
+
+    SEEN, MATCHED = 0, 1
+
+    def __init__(self, max_groups: int = 10000, max_keywords: int = 2000,
+                 tick: float = 5.0, metric_groups: int = 20):
+        self.groups = SeriesTable(('seen', 'matched'), max_groups)
+        self.keywords = SeriesTable(('matched',), max_keywords)
+        self.tick = tick
+        self.metric_groups = metric_groups
+        self._task = None
+        self._cache = {}
+
+        REGISTRY.gauge(
+            'userbot_keyword_matches_hour',
+            'Matches per keyword over the last hour',
+            fn=lambda: {key: counts[0] for key, counts in self.totals(self.keywords, MINUTE).items()},
+            label='keyword')
+        REGISTRY.gauge(
+            'userbot_group_messages_hour',
+            'Messages seen over the last hour for the busiest groups',
+            fn=lambda: {key: counts[self.SEEN]
+                        for key, counts in self.top(self.groups, MINUTE, self.SEEN, self.metric_groups)},
+            label='group')
+        REGISTRY.gauge(
+            'userbot_group_matches_hour',
+            'Matches over the last hour for the groups with the most matches',
+            fn=lambda: {key: counts[self.MATCHED]
+                        for key, counts in self.top(self.groups, MINUTE, self.MATCHED, self.metric_groups)
+                        if counts[self.MATCHED]},
+            label='group')
+        REGISTRY.gauge(
+            'userbot_analytics_bytes',
+            'Preallocated memory of the analytics counters',
+            fn=self.memory_bytes)
+
+    @classmethod
+    def from_env(cls):
+        """ANALYTICS_MAX_GROUPS, ANALYTICS_MAX_KEYWORDS and ANALYTICS_METRIC_GROUPS"""
+        return cls(max_groups=int(os.getenv('ANALYTICS_MAX_GROUPS', '10000')),
+                   max_keywords=int(os.getenv('ANALYTICS_MAX_KEYWORDS', '2000')),
+                   metric_groups=int(os.getenv('ANALYTICS_METRIC_GROUPS', '20')))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance(time.time())
+
+    def advance(self, now: float):
+        self.groups.advance(now)
+        self.keywords.advance(now)
+        self._cache.clear()
+
+    def totals(self, table: SeriesTable, resolution: int):
+        """table.totals, computed at most once per tick for scrapes and commands"""
+        key = (id(table), resolution)
+        totals = self._cache.get(key)
+        if totals is None:
+            totals = self._cache[key] = table.totals(resolution)
+        return totals
+
+    def top(self, table: SeriesTable, resolution: int, field: int = 0, limit: int = 10):
+        ranked = sorted(self.totals(table, resolution).items(),
+                        key=lambda item: item[1][field], reverse=True)
+        return ranked[:limit]
+
+    def seen(self, chat_id: int):
+        self.groups.add(chat_id, self.SEEN)
+
+    def matched(self, chat_id: int, keywords):
+        self.groups.add(chat_id, self.MATCHED)
+        for keyword in keywords:
+            self.keywords.add(keyword)
+
+    def memory_bytes(self) -> int:
+        return self.groups.memory_bytes() + self.keywords.memory_bytes()
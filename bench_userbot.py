@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks for the user bot hot path
+Run locally: python bench_userbot.py [--messages 200000] [--replay 10]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from keyword_matcher import KeywordMatcher, TEXTS_CHECKED, PREFILTER_REJECTED
+
+DEFAULT_KEYWORDS = [
+    "يسوي", "يحل", "يساعدني", "ابي شخص", "تعرفون حد",
+    "ابي حد", "محتاج", "اريد", "اطلب", "ممكن حد",
+    "ابغى", "ودي", "عايز", "بدي", "اريد واحد", "محتاج واحد"
+]
+
+# Typical group chatter that does not match any keyword
+FILLER = [
+    "السلام عليكم", "صباح الخير", "الله يعطيك العافية", "تم", "👍", "😂😂",
+    "شكرا لك", "ok", "thanks", "https://t.me/joinchat/abc", "مساء النور",
+    "كم السعر؟", "وينكم", "هلا والله", "جزاك الله خير", "🔥🔥🔥", "نعم",
+    "الحين", "طيب", "ان شاء الله", "مبروك", "1234", "خلاص",
+]
+
+
+def build_corpus(count: int, match_ratio: float = 0.02, seed: int = 7):
+    """Synthetic message stream with roughly match_ratio matching messages"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        words = [rng.choice(FILLER) for _ in range(rng.randint(1, 6))]
+        if rng.random() < match_ratio:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(DEFAULT_KEYWORDS))
+        corpus.append(' '.join(words))
+    return corpus
+
+
+def naive_match(keywords, text):
+    """The original handle_new_message scan, kept as the baseline"""
+    text_lower = text.lower()
+    found_keywords = []
+    for kw in keywords:
+        if kw.lower() in text_lower:
+            found_keywords.append(kw)
+    return found_keywords
+
+
+def _cpu_per_message(fn, corpus):
+    start = time.process_time()
+    for text in corpus:
+        fn(text)
+    elapsed = time.process_time() - start
+    return elapsed / len(corpus) * 1e9
+
+
+def bench_prefilter(corpus, keywords):
+    matcher = KeywordMatcher(keywords)
+    baseline_matches = sum(1 for text in corpus if naive_match(keywords, text))
+    matcher_matches = sum(1 for text in corpus if matcher.match(text))
+    assert baseline_matches == matcher_matches, (baseline_matches, matcher_matches)
+
+    checked_before = TEXTS_CHECKED.value
+    rejected_before = sum(PREFILTER_REJECTED.values.values())
+    naive_ns = _cpu_per_message(lambda text: naive_match(keywords, text), corpus)
+    matcher_ns = _cpu_per_message(matcher.match, corpus)
+    checked = TEXTS_CHECKED.value - checked_before
+    rejected = sum(PREFILTER_REJECTED.values.values()) - rejected_before
+
+    print("== prefilter ==")
+    print(f"messages:            {len(corpus)} ({matcher_matches} matching)")
+    print(f"baseline scan:       {naive_ns:8.0f} ns/message")
+    print(f"prefilter + scan:    {matcher_ns:8.0f} ns/message")
+    print(f"speedup:             {naive_ns / matcher_ns:8.2f}x")
+    print(f"rejection rate:      {rejected / checked:8.1%}")
+    print(f"rejections by reason: {dict(PREFILTER_REJECTED.values)}")
+
+
+def _synthetic_keywords(count: int, seed: int = 11):
+    rng = random.Random(seed)
+    letters = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(5, 8))) for _ in range(count)]
+
+
+def bench_engine(corpus):
+    """Per-message cost of regex and fuzzy entries as their number grows"""
+    print("== regex / fuzzy engine ==")
+    sample = corpus[:20000]
+    for count in (10, 100, 1000):
+        words = _synthetic_keywords(count)
+        fuzzy = KeywordMatcher(DEFAULT_KEYWORDS + ['~' + w for w in words])
+        regex = KeywordMatcher(DEFAULT_KEYWORDS + [f're:{w} (حد|شخص)' for w in words])
+        fuzzy_ns = _cpu_per_message(fuzzy.match, sample)
+        regex_ns = _cpu_per_message(regex.match, sample)
+        print(f"{count:5d} entries:  fuzzy {fuzzy_ns:8.0f} ns/message   regex {regex_ns:8.0f} ns/message")
+
+
+def bench_archive(rows: int):
+    """Batched archive writes and paginated full-text search latency"""
+    from match_archive import MatchArchive
+
+    print("== match archive ==")
+    rng = random.Random(3)
+    corpus = build_corpus(min(rows, 50000), match_ratio=1.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = MatchArchive(os.path.join(tmp, 'bench.db'), batch_size=5000, compact_interval=0)
+        now = time.time()
+        start = time.perf_counter()
+        for i in range(rows):
+            chat_id = rng.randrange(1000)
+            archive.append(chat_id, f"مجموعة {chat_id}", rng.randrange(10 ** 6), "مستخدم",
+                           i, [rng.choice(DEFAULT_KEYWORDS)], corpus[i % len(corpus)],
+                           ts=now - rng.randrange(30 * 86400))
+        archive.close(timeout=600)
+        elapsed = time.perf_counter() - start
+        print(f"rows written:        {rows} in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+
+        archive = MatchArchive(os.path.join(tmp, 'bench.db'), compact_interval=0)
+        queries = [
+            ("keyword", dict(terms=["محتاج"])),
+            ("keyword + chat", dict(terms=["محتاج"], chat=42)),
+            ("keyword + chat + week", dict(terms=["محتاج"], chat=42, since=now - 7 * 86400)),
+            ("keyword, page 50", dict(terms=["محتاج"], offset=500)),
+            ("chat title", dict(chat="مجموعة 7")),
+        ]
+        for name, kwargs in queries:
+            archive.search(**kwargs)
+            start = time.perf_counter()
+            for _ in range(5):
+                total, _ = archive.search(**kwargs)
+            ms = (time.perf_counter() - start) / 5 * 1000
+            print(f"{name:22s} {ms:8.2f} ms   ({total} hits)")
+        archive.close()
+
+
+def bench_import(count: int, chunk_size: int = 128 * 1024):
+    """Streamed import of a large keyword file and the matcher rebuild"""
+    import tracemalloc
+    from keyword_io import KeywordImport
+    from keyword_matcher import KeywordStore
+
+    print("== keyword import ==")
+    words = _synthetic_keywords(count, seed=5)
+    payload = ('\n'.join(f"{w} {i}" for i, w in enumerate(words)) + '\n').encode('utf-8')
+
+    async def chunks():
+        for i in range(0, len(payload), chunk_size):
+            yield payload[i:i + chunk_size]
+
+    def run():
+        imported = asyncio.run(KeywordImport().feed_stream(chunks()))
+        parsed = time.perf_counter()
+        matcher = KeywordMatcher(list(KeywordStore(imported.keywords)))
+        return imported, matcher, parsed
+
+    start = time.perf_counter()
+    imported, matcher, parsed = run()
+    built = time.perf_counter()
+
+    # Second pass only for memory, tracemalloc slows everything down
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"file:                {len(payload) / 1024:,.0f} KB, {imported.lines} lines")
+    print(f"stream + parse:      {(parsed - start) * 1000:8.1f} ms")
+    print(f"store + matcher:     {(built - parsed) * 1000:8.1f} ms ({len(matcher)} entries)")
+    print(f"peak traced memory:  {peak / 1024 / 1024:8.1f} MB")
+
+
+def bench_hot_path(corpus, sample: int = 20000):
+    """Allocations of CloudUserBot.match_message per message (tracemalloc)"""
+    import tracemalloc
+    import types
+    from telethon.tl.types import Message, PeerChannel
+    from cloud_userbot import CloudUserBot
+
+    print("== hot path allocations ==")
+    bot = types.SimpleNamespace(matcher=KeywordMatcher(DEFAULT_KEYWORDS))
+    match_message = CloudUserBot.match_message
+    messages = [Message(id=i, peer_id=PeerChannel(1), date=None, message=text)
+                for i, text in enumerate(corpus[:sample])]
+
+    start = time.perf_counter()
+    for message in messages:
+        match_message(bot, message)
+    elapsed = time.perf_counter() - start
+
+    # Transient bytes: traced peak during the call above the level before it
+    tracemalloc.start()
+    transient = {False: [0, 0], True: [0, 0]}
+    baseline = tracemalloc.get_traced_memory()[0]
+    for message in messages:
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        found = match_message(bot, message)[0]
+        peak = tracemalloc.get_traced_memory()[1]
+        bucket = transient[bool(found)]
+        bucket[0] += peak - current
+        bucket[1] += 1
+        del found
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    for matched, (total, count) in transient.items():
+        if count:
+            label = 'matching' if matched else 'non-matching'
+            print(f"{label + ':':<20} {total / count:8.1f} bytes peak per message ({count} messages)")
+    print(f"retained:            {retained / len(messages):8.2f} bytes per message")
+    print(f"time:                {elapsed / len(messages) * 1e6:8.2f} µs per message")
+
+
+def bench_notifications(count: int = 20000):
+    """CPU per notification: Markdown f-string + parse vs precompiled templates"""
+    from telethon.extensions import markdown
+    from telethon.tl.types import User
+    from notification_templates import TEMPLATES, NotificationRenderer
+
+    print("== notification rendering ==")
+    rng = random.Random(3)
+    senders = [User(id=1000 + i, access_hash=i, first_name=f"مستخدم {i}", username=f"user{i}")
+               for i in range(200)]
+    chats = [(-1000 - i, f"مجموعة البيع والشراء {i}") for i in range(300)]
+    jobs = [(rng.choice(chats), rng.choice(senders), (rng.choice(DEFAULT_KEYWORDS),),
+             ' '.join(rng.choice(FILLER) for _ in range(rng.randint(5, 40))))
+            for _ in range(count)]
+
+    def legacy(job):
+        (chat_id, title), sender, keywords, body = job
+        text = f"""🚨 **كلمة مفتاحية!**
+
+👥 {title}
+👤 {sender.first_name}
+🔑 {', '.join(keywords)}
+📎 نص الرسالة
+⏰ {time.strftime('%H:%M:%S')}
+
+📝 {body[:500]}{'...' if len(body) > 500 else ''}
+
+💬 [تواصل](tg://user?id={sender.id}) {'| @' + sender.username if sender.username else ''}"""
+        return markdown.parse(text)
+
+    start = time.perf_counter()
+    for job in jobs:
+        legacy(job)
+    print(f"{'markdown (before):':<20} {(time.perf_counter() - start) / count * 1e6:8.1f} µs per notification")
+
+    sources = [('text', '')]
+    for variant in TEMPLATES:
+        renderer = NotificationRenderer(variant)
+        start = time.perf_counter()
+        for (chat_id, title), sender, keywords, body in jobs:
+            renderer.render(chat_id=chat_id, chat_title=title, sender=sender, sender_id=sender.id,
+                            keywords=keywords, sources=sources, body=body)
+        print(f"{variant + ':':<20} {(time.perf_counter() - start) / count * 1e6:8.1f} µs per notification")
+
+
+async def _replay(corpus, rate: float, seconds: float, cost_ms: float, controlled: bool):
+    """One replay run: `seconds` at `rate` msg/s, then as long again at a tenth of it
+
+    The controller is fed by a LoopMonitor listener, as in the bot. It
+    also runs when not in control, so its transitions show what it would
+    have done. After the replay the run waits (bounded) for the backlog
+    to drain and the controller to step back down to full.
+    """
+    from loop_monitor import LoopMonitor
+    from notify_pipeline import NotificationPipeline
+    from outbound import OutboundScheduler
+    from overload import FULL, LEVELS, OverloadController
+
+    class Client:
+        async def send_message(self, entity, message=None, **kwargs):
+            await asyncio.sleep(0.02)
+
+    outbound = OutboundScheduler(Client())
+
+    class Delivery:
+        async def deliver(self, text, **kwargs):
+            return await outbound.send('me', text, **kwargs)
+
+    pipeline = NotificationPipeline(Delivery(), outbound)
+    # Telethon with sequential_updates: one queue, one handler at a time
+    updates = asyncio.Queue()
+    depth = lambda: updates.qsize() + outbound.depth + pipeline.pending()
+    overload = OverloadController(depth, cooldown=1.0, low_groups=range(50))
+    monitor = LoopMonitor()
+    monitor.listeners.append(lambda lag: overload.update(lag, depth()))
+    monitor.start()
+    matcher = KeywordMatcher(DEFAULT_KEYWORDS)
+    cost = cost_ms / 1000
+    delays = []
+    counts = {'processed': 0, 'dropped': 0, 'queued': 0}
+
+    async def handle(chat_id, text, received):
+        delays.append(time.monotonic() - received)
+        if controlled and overload.level and not overload.admit(chat_id):
+            counts['dropped'] += 1
+            return
+        # Update decoding, entity handling and rendering the handler pays for
+        end = time.perf_counter() + cost
+        while time.perf_counter() < end:
+            pass
+        counts['processed'] += 1
+        if matcher.match(text) and pipeline.submit(1, received, text):
+            counts['queued'] += 1
+
+    async def consume():
+        while True:
+            await handle(*await updates.get())
+
+    async def produce(rate, duration, offset):
+        start = time.monotonic()
+        for i in range(int(rate * duration)):
+            due = start + i / rate
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text = corpus[(offset + i) % len(corpus)]
+            updates.put_nowait(((offset + i) % 500, text, time.monotonic()))
+        return int(rate * duration)
+
+    consumer = asyncio.create_task(consume())
+    sent = await produce(rate, seconds, 0)
+    flood_backlog = updates.qsize()
+    peak_level = max([level for _, _, level, _ in overload.history], default=0)
+    await produce(rate / 10, seconds, sent)
+    backlog_at_end = updates.qsize()
+    settle = time.monotonic()
+    deadline = settle + len(LEVELS) * overload.cooldown + seconds
+    while (updates.qsize() or overload.level != FULL) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    recovered = updates.qsize() == 0 and overload.level == FULL
+    consumer.cancel()
+    monitor.stop()
+    delays.sort()
+    return {
+        'p99 queue wait': f"{delays[int(len(delays) * 0.99)] * 1000 if delays else 0:.0f} ms",
+        'processed': counts['processed'],
+        'dropped': counts['dropped'],
+        'notifications': counts['queued'],
+        'backlog after flood': flood_backlog,
+        'backlog at end': backlog_at_end,
+        'peak level': LEVELS[peak_level],
+        'back to full': f"{time.monotonic() - settle:.1f}s after the replay" if recovered
+                        else f"no, {LEVELS[overload.level]} with {updates.qsize()} queued",
+        'transitions': ' '.join(LEVELS[level] for _, _, level, _ in overload.history) or '-',
+    }
+
+
+def bench_session(count: int):
+    """Session checkpoints and the entity cache preload across a restart
+
+    Restarts twice: once after the full entities were checkpointed and
+    once after Telethon fed the same entities back as bare InputPeers
+    (hash only), which must neither rewrite rows nor lose names.
+    """
+    from telethon._updates import EntityCache
+    from telethon.utils import get_peer_id
+    from telethon.tl.types import Channel, ChatPhotoEmpty, InputPeerChannel, InputPeerUser, User
+    from session_store import DurableSession
+
+    print("== session checkpoint + preload ==")
+    users = [User(id=1000 + i, access_hash=i + 1, first_name=f"مستخدم {i}", username=f"user{i}")
+             for i in range(count)]
+    channels = [Channel(id=10 ** 9 + i, title=f"مجموعة {i}", photo=ChatPhotoEmpty(), date=None,
+                        access_hash=i + 1, megagroup=True) for i in range(count // 10)]
+    bare = ([InputPeerUser(user.id, user.access_hash) for user in users]
+            + [InputPeerChannel(channel.id, channel.access_hash) for channel in channels])
+
+    def restart(path):
+        session = DurableSession(path)
+        cache = EntityCache()
+        start = time.perf_counter()
+        loaded = session.preload(cache)
+        preload_ms = (time.perf_counter() - start) * 1000
+        named = sum(1 for user in users if session.cached_user(user.id) is not None)
+        titled = sum(1 for channel in channels if session.cached_name(get_peer_id(channel)))
+        print(f"{'restart:':<20} load {session.load_seconds * 1000:7.1f} ms, preload {preload_ms:6.1f} ms, "
+              f"{loaded} hashes, {named}/{len(users)} users named, {titled}/{len(channels)} titles")
+        assert loaded == len(users) + len(channels)
+        assert named == len(users) and titled == len(channels)
+        return session
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.session')
+        session = DurableSession(path)
+        session.set_dc(2, '149.154.167.51', 443)
+        session.process_entities(users + channels)
+        written = asyncio.run(session.checkpoint())
+        print(f"{'first checkpoint:':<20} {written} rows")
+        session.close()
+
+        session = restart(path)
+        session.process_entities(bare)
+        written = asyncio.run(session.checkpoint())
+        print(f"{'bare InputPeers:':<20} {written} rows written")
+        assert written == 0
+        session.close()
+
+        restart(path).close()
+
+
+def bench_replay(corpus, multiplier: float, rate: float = 100, seconds: float = 5, cost_ms: float = 2.0):
+    """Replay the corpus at multiplier x normal load, with and without the overload controller"""
+    print(f"== replay x{multiplier:g}: {rate * multiplier:.0f} msg/s for {seconds:g}s, "
+          f"then {rate * multiplier / 10:.0f} msg/s, {cost_ms:g} ms per message ==")
+    for controlled in (False, True):
+        result = asyncio.run(_replay(corpus, rate * multiplier, seconds, cost_ms, controlled))
+        print(f"-- {'with' if controlled else 'without'} overload control")
+        for name, value in result.items():
+            print(f"{name + ':':<20} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--archive-rows', type=int, default=200000)
+    parser.add_argument('--import-keywords', type=int, default=50000)
+    parser.add_argument('--session-entities', type=int, default=50000)
+    parser.add_argument('--replay', type=float, default=0,
+                        help='replay at this multiple of normal load (e.g. 10)')
+    parser.add_argument('--replay-rate', type=float, default=100, help='normal load, msg/s')
+    parser.add_argument('--replay-seconds', type=float, default=5)
+    parser.add_argument('--replay-cost-ms', type=float, default=2.0, help='handler CPU per message')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages)
+    bench_prefilter(corpus, DEFAULT_KEYWORDS)
+    bench_engine(corpus)
+    bench_hot_path(corpus)
+    bench_notifications()
+    if args.archive_rows:
+        bench_archive(args.archive_rows)
+    if args.import_keywords:
+        bench_import(args.import_keywords)
+    if args.session_entities:
+        bench_session(args.session_entities)
+    if args.replay:
+        bench_replay(corpus, args.replay, args.replay_rate, args.replay_seconds, args.replay_cost_ms)
+
+
+if __name__ == '__main__':
+    main()
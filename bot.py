@@ -12,6 +12,7 @@ from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 import re
+from chat_state import ChatStateStore
 
 # Configure logging
 logging.basicConfig(
@@ -28,7 +29,7 @@ class SaudiBot:
             "يسوي", "يحل", "يساعدني", "ابي شخص", "تعرفون حد", 
             "ابي حد", "محتاج", "اريد", "اطلب", "ممكن حد"
         ]
-        self.monitored_groups = set()
+        self.monitored_groups = ChatStateStore()
         self.load_config()
         
     def load_config(self):
@@ -38,7 +39,7 @@ class SaudiBot:
                 with open('config.json', 'r', encoding='utf-8') as f:
                     config = json.load(f)
                     self.keywords = config.get('keywords', self.keywords)
-                    self.monitored_groups = set(config.get('monitored_groups', []))
+                    self.monitored_groups = ChatStateStore(config.get('monitored_groups', []))
         except Exception as e:
             logger.error(f"Error loading config: {e}")
     
@@ -210,14 +211,6 @@ class SaudiBot:
         """Monitor group messages for keywords"""
         message = update.message
         
-        # Skip if message is from owner or bot
-        if message.from_user.id == self.owner_id or message.from_user.is_bot:
-            return
-            
-        # Only monitor group messages
-        if message.chat.type not in ['group', 'supergroup']:
-            return
-            
         # Add group to monitored groups
         group_id = message.chat.id
         if group_id not in self.monitored_groups:
@@ -299,8 +292,13 @@ def main():
     application.add_handler(CommandHandler("delete_keyword", bot.delete_keyword_command))
     application.add_handler(CallbackQueryHandler(bot.button_handler))
     
-    # Monitor all text messages
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.monitor_messages))
+    # Monitor group text messages from people other than the owner. Bots
+    # never see other bots' messages; the bot-like senders left are
+    # anonymous admins and linked-channel posts, which carry a sender_chat
+    application.add_handler(MessageHandler(
+        filters.TEXT & ~filters.COMMAND & filters.ChatType.GROUPS
+        & ~filters.SenderChat.ALL & ~filters.User(user_id=bot.owner_id),
+        bot.monitor_messages))
     
     # Start the bot
     logger.info("Starting Saudi Bot...")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact per-chat state
+Tracked chat IDs live in one sorted array('q') (8 bytes per chat instead
+of ~60 for a set of ints). Per-chat records use __slots__ with interned
+titles and are kept in an optional LRU tier that spills evicted records
+to SQLite.
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ChatRecord:
+    """State of one chat; titles are interned so repeats share one string"""
+
+    __slots__ = ('chat_id', 'title', 'matches', 'last_seen')
+
+    def __init__(self, chat_id: int, title: str = None, matches: int = 0, last_seen: int = 0):
+        self.chat_id = chat_id
+        self.title = sys.intern(title) if title else None
+        self.matches = matches
+        self.last_seen = last_seen
+
+    def as_row(self):
+        return (self.chat_id, self.title, self.matches, self.last_seen)
+
+
+class SQLiteSpill:
+    """Persistent tier for records evicted from memory
+
+    Evictions are buffered and written in one transaction per
+    ``batch_size`` records, so the event loop never pays a commit per chat.
+    """
+
+    def __init__(self, path: str, batch_size: int = 256):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_state ("
+            "chat_id INTEGER PRIMARY KEY, title TEXT, matches INTEGER, last_seen INTEGER)")
+        self._conn.commit()
+
+    def put(self, record: ChatRecord):
+        self._pending[record.chat_id] = record.as_row()
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def take(self, chat_id: int):
+        """Stored record for chat_id, or None"""
+        row = self._pending.pop(chat_id, None)
+        if row is None:
+            row = self._conn.execute(
+                "SELECT chat_id, title, matches, last_seen FROM chat_state WHERE chat_id = ?",
+                (chat_id,)).fetchone()
+        return ChatRecord(*row) if row else None
+
+    def count(self) -> int:
+        self.flush()
+        return self._conn.execute("SELECT count(*) FROM chat_state").fetchone()[0]
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chat_state (chat_id, title, matches, last_seen) "
+                "VALUES (?, ?, ?, ?)", self._pending.values())
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+class ChatStateStore:
+    """Set-like collection of tracked chat IDs plus per-chat records
+
+    ``in``, ``add``, ``discard``, ``len`` and iteration behave like the
+    set of ints it replaces, so it can be saved with ``list(store)``.
+    """
+
+    def __init__(self, chat_ids=(), max_records: int = 0, spill: SQLiteSpill = None):
+        self._ids = array('q', sorted(set(chat_ids)))
+        self.max_records = max_records
+        self.spill = spill if max_records else None
+        self._records = OrderedDict()
+
+    @classmethod
+    def from_env(cls, chat_ids=()):
+        """CHAT_STATE_MAX bounds in-memory records; evictions go to CHAT_STATE_DB"""
+        max_records = int(os.getenv('CHAT_STATE_MAX', '0'))
+        spill = None
+        if max_records:
+            spill = SQLiteSpill(os.getenv('CHAT_STATE_DB', 'chat_state.db'))
+        return cls(chat_ids, max_records=max_records, spill=spill)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, chat_id):
+        ids = self._ids
+        i = bisect_left(ids, chat_id)
+        return i < len(ids) and ids[i] == chat_id
+
+    def add(self, chat_id: int) -> bool:
+        """Track chat_id; True when it was not tracked before"""
+        ids = self._ids
+        i = bisect_left(ids, chat_id)
+        if i < len(ids) and ids[i] == chat_id:
+            return False
+        ids.insert(i, chat_id)
+        return True
+
+    def discard(self, chat_id: int):
+        ids = self._ids
+        i = bisect_left(ids, chat_id)
+        if i < len(ids) and ids[i] == chat_id:
+            del ids[i]
+        self._records.pop(chat_id, None)
+
+    def sync(self, chat_ids, keep=()):
+        """Make the tracked IDs equal chat_ids in one rebuild; returns (added, removed)
+
+        IDs in ``keep`` are left as they are on either side.
+        """
+        current = set(self._ids)
+        target = set(chat_ids)
+        added = target - current - set(keep)
+        removed = current - target - set(keep)
+        if added or removed:
+            self._ids = array('q', sorted((current | added) - removed))
+            for chat_id in removed:
+                self._records.pop(chat_id, None)
+        return added, removed
+
+    def record(self, chat_id: int) -> ChatRecord:
+        """The chat's record, loaded back from the spill tier if evicted"""
+        records = self._records
+        record = records.get(chat_id)
+        if record is not None:
+            records.move_to_end(chat_id)
+            return record
+        if self.spill is not None:
+            record = self.spill.take(chat_id)
+        if record is None:
+            record = ChatRecord(chat_id)
+        records[chat_id] = record
+        if self.max_records and len(records) > self.max_records:
+            _, evicted = records.popitem(last=False)
+            self.spill.put(evicted)
+        return record
+
+    def touch(self, chat_id: int, title: str = None, matched: bool = False) -> bool:
+        """Track the chat and update its record; True for a newly tracked chat"""
+        is_new = self.add(chat_id)
+        record = self.record(chat_id)
+        if title and title != record.title:
+            record.title = sys.intern(title)
+        if matched:
+            record.matches += 1
+        record.last_seen = int(time.time())
+        return is_new
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+
+    def memory_report(self) -> dict:
+        """Approximate bytes used, per tier and per tracked chat"""
+        ids_bytes = sys.getsizeof(self._ids)
+        records_bytes = sys.getsizeof(self._records)
+        titles = {}
+        for record in self._records.values():
+            records_bytes += sys.getsizeof(record) + sys.getsizeof(record.last_seen)
+            if record.matches > 256:
+                records_bytes += sys.getsizeof(record.matches)
+            if record.title is not None:
+                titles[id(record.title)] = sys.getsizeof(record.title)
+        records_bytes += sum(titles.values())
+        count = len(self._ids)
+        # What the same IDs cost as the set of ints this store replaced
+        set_bytes = sys.getsizeof(set(self._ids)) + count * sys.getsizeof(2 ** 40)
+        return {
+            'chats': count,
+            'ids_bytes': ids_bytes,
+            'records': len(self._records),
+            'records_bytes': records_bytes,
+            'spilled': self.spill.count() if self.spill is not None else 0,
+            'bytes_per_chat': (ids_bytes + records_bytes) / count if count else 0.0,
+            'set_bytes': set_bytes,
+        }
@@ -13,9 +13,31 @@ import signal
 import sys
 import time
 from datetime import datetime
-from telethon import TelegramClient, events
+from startup_profile import STARTUP, format_import_breakdown, import_breakdown
+from telethon import TelegramClient, events, types, utils
 from telethon.sessions import StringSession
-import base64
+from session_store import DurableSession
+from keyword_matcher import (
+    KeywordMatcher, KeywordStore, prefilter_rejection_rate, split_entries, validate_entry
+)
+from message_sources import describe_sources, iter_message_texts
+from edit_tracker import EDITS_SEEN, EditTracker, matched_keywords
+from match_archive import MatchArchive
+from outbound import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, OutboundScheduler
+from config_watcher import CONFIG_RELOADS, ConfigWatcher
+from chat_state import ChatStateStore
+from group_membership import GroupMembership
+from analytics import DAY, HOUR, MINUTE, OVERFLOW_KEY, Analytics, sparkline
+from keyword_feedback import KeywordFeedback, verdict_of
+from sender_reputation import SenderReputation, parse_ids
+from fast_path import FastPathFilter
+from notification_templates import VARIANT_NAMES, NotificationRenderer, message_link
+from delivery import CHANNEL, FORWARD_FALLBACKS, MODE_ALIASES, DeliveryRouter, parse_target
+from loop_monitor import LoopMonitor
+from overload import LEVEL_LABELS, LEVELS, OVERLOAD_DROPPED, OverloadController
+from notify_pipeline import (
+    DEFAULT_TIER, TIER_ALIASES, TIER_LABELS, TIERS, NotificationPipeline, parse_tier
+)
 
 # Configure logging for cloud
 logging.basicConfig(
@@ -27,15 +49,27 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Shared result of match_message for messages without keywords
+_NO_MATCH = ((), (), ())
+
 class CloudUserBot:
     def __init__(self, api_id: int, api_hash: str, session_string: str = None):
         self.api_id = api_id
         self.api_hash = api_hash
         
+        # The session string seeds an on-disk session that keeps the entity
+        # cache and update state across restarts (SESSION_DB, SESSION_KEY)
+        self.session_store = None
+        if session_string:
+            try:
+                self.session_store = DurableSession.from_env(session_string)
+            except Exception as e:
+                logger.error(f"Session database unavailable, using the session string only: {e}")
+        
         # Use string session for cloud deployment with maximum stability
         if session_string:
             self.client = TelegramClient(
-                StringSession(session_string), 
+                self.session_store or StringSession(session_string), 
                 api_id, 
                 api_hash,
                 # Maximum stability settings to prevent disconnections
@@ -45,6 +79,8 @@ class CloudUserBot:
                 retry_delay=5,             # Longer delay between retries
                 auto_reconnect=True,
                 sequential_updates=True,
+                # Room for the preloaded entities of every monitored group
+                entity_cache_limit=int(os.getenv('ENTITY_CACHE_LIMIT', '50000')),
                 # Enhanced connection settings
                 timeout=60,                # Longer timeout
                 use_ipv6=False,
@@ -63,17 +99,80 @@ class CloudUserBot:
             self.client = TelegramClient(StringSession(), api_id, api_hash)
         
         # Default keywords
-        self.keywords = [
+        self.keywords = KeywordStore([
             "يسوي", "يحل", "يساعدني", "ابي شخص", "تعرفون حد", 
             "ابي حد", "محتاج", "اريد", "اطلب", "ممكن حد",
             "ابغى", "ودي", "عايز", "بدي", "اريد واحد", "محتاج واحد"
-        ]
+        ])
+        self.matcher = KeywordMatcher(self.keywords)
+        
+        # Priority tier per keyword (+عاجل: كلمة); unlisted keywords are normal
+        self.keyword_tiers = {}
+        
+        # Notification layout (full / compact / digest), switchable with !قالب
+        self.renderer = NotificationRenderer()
+        try:
+            self.renderer.set_variant(os.getenv('NOTIFY_TEMPLATE', 'full'))
+        except ValueError:
+            logger.warning("Unknown NOTIFY_TEMPLATE, using the full template")
+        
+        self.config_file = os.getenv('CONFIG_FILE', 'user_config.json')
+        self.config_watcher = None
+        self.startup_task = None
+        self.profile_task = None
+        
+        # Every outgoing message is paced by one shared scheduler
+        self.outbound = OutboundScheduler(self.client)
+        self.build_command_table()
         
         # Try to create/find a private channel for notifications
         self.notification_channel = None
         
-        # Monitored groups for performance tracking
-        self.monitored_groups = set()
+        # Where notifications go: a primary target plus mirrors (!توصيل)
+        self.delivery = DeliveryRouter.from_env(self.outbound, self.resolve_target)
+        
+        # Per-tier batching windows, p99 latency targets and load shedding
+        self.pipeline = NotificationPipeline.from_env(self.delivery, self.outbound,
+                                                      on_error=self.send_to_self,
+                                                      on_sent=self.notification_sent)
+        
+        # Owner verdicts on notifications (reply ❌/✅, react 👎/👍) per keyword (!دقة)
+        self.feedback = KeywordFeedback.from_env()
+        
+        # Degrades processing under update floods (!حمل)
+        self.overload = OverloadController.from_env(self.backlog_depth)
+        
+        # Throttles and mutes senders that match too often (!مرسلين, !حظر, !سماح)
+        self.reputation = SenderReputation.from_env()
+        
+        # Channels, bots, Telegram notices, ourselves and ignored chats are
+        # dropped while Telethon filters the update, before any handler runs
+        self.fast_path = FastPathFilter.from_env()
+        
+        # Loop lag and slow callbacks (!حلقة); its lag samples drive the overload levels
+        self.loop_monitor = LoopMonitor.from_env()
+        self.loop_monitor.listeners.append(
+            lambda lag: self.overload.update(lag, self.backlog_depth()))
+        self.loop_report_interval = float(os.getenv('LOOP_REPORT_INTERVAL', '0')) * 60
+        
+        # Groups the account is in (compact, optionally LRU-bounded); kept
+        # from join/leave updates and a background dialog sync
+        self.monitored_groups = ChatStateStore.from_env()
+        self.membership = GroupMembership.from_env(self.monitored_groups)
+        
+        # Minute/hour/day counters per group and keyword (!تحليل)
+        self.analytics = Analytics.from_env()
+        
+        # Fingerprints of recent messages so edits only re-match changed text
+        self.edit_tracker = EditTracker(int(os.getenv('EDIT_CACHE_SIZE', '20000')))
+        
+        # Searchable history of every match (?بحث)
+        self.archive = None
+        if os.getenv('ARCHIVE_ENABLED', '1') != '0':
+            try:
+                self.archive = MatchArchive.from_env()
+            except Exception as e:
+                logger.warning(f"Match archive disabled: {e}")
         
         # Session persistence settings
         self.session_save_interval = 300  # Save session every 5 minutes
@@ -135,17 +234,107 @@ class CloudUserBot:
             await asyncio.sleep(1)
 
     def load_cloud_config(self):
-        """Load configuration from environment variables"""
+        """Load configuration from the saved config file or environment variables"""
         try:
-            # Load keywords from environment
-            keywords_env = os.getenv('KEYWORDS')
-            if keywords_env:
-                self.keywords = [k.strip() for k in keywords_env.split(',')]
-                
+            config = self.read_config()
+            keywords = self.config_keywords(config)
+            if keywords:
+                self.keywords.replace(keywords)
+            self.apply_settings(config)
+            
+            self.rebuild_matcher()
             logger.info(f"Loaded {len(self.keywords)} keywords from config")
         except Exception as e:
             logger.error(f"Error loading cloud config: {e}")
 
+    def read_config(self):
+        """The saved config file as a dict, None when there is no file"""
+        if not os.path.exists(self.config_file):
+            return None
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def config_keywords(self, config):
+        """Keywords from the config file, else from the KEYWORDS seed"""
+        # Keywords edited at runtime win over the KEYWORDS seed. A file that
+        # only holds settings (!قالب, !توصيل, !حظر...) has no keyword list
+        if config is not None and 'keywords' in config:
+            return config['keywords'] or []
+        # Load keywords from environment
+        keywords_env = os.getenv('KEYWORDS')
+        if keywords_env:
+            return [k.strip() for k in keywords_env.split(',') if k.strip()]
+        return []
+
+    def apply_settings(self, config):
+        """Apply the non-keyword settings of a config; True if anything changed"""
+        changed = False
+        config = config or {}
+        delivery = config.get('delivery')
+        if delivery and delivery != self.delivery.as_config():
+            try:
+                self.delivery.configure(delivery['primary'], delivery.get('mirrors', ()),
+                                        delivery.get('mode', 'copy'))
+                changed = True
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Invalid delivery settings {delivery!r}")
+        priorities = config.get('priorities')
+        if priorities is not None:
+            tiers = {kw: TIER_ALIASES[name] for kw, name in priorities.items() if name in TIER_ALIASES}
+            if tiers != self.keyword_tiers:
+                self.keyword_tiers = tiers
+                changed = True
+        low_groups = config.get('low_priority_groups')
+        if low_groups is not None:
+            low_groups = frozenset(int(g) for g in low_groups)
+            if low_groups != self.overload.low_groups:
+                self.overload.low_groups = low_groups
+                changed = True
+        ignored = config.get('ignored_chats')
+        if ignored is not None:
+            ignored = frozenset(parse_ids(ignored))
+            if ignored != self.fast_path.ignored_chats:
+                self.fast_path.ignored_chats = ignored
+                changed = True
+        blocked = config.get('blocked_senders')
+        allowed = config.get('allowed_senders')
+        if blocked is not None or allowed is not None:
+            if self.reputation.configure(parse_ids(blocked) if blocked is not None else None,
+                                         parse_ids(allowed) if allowed is not None else None):
+                changed = True
+        template = config.get('notification_template')
+        if template and VARIANT_NAMES.get(template) != self.renderer.variant:
+            try:
+                self.renderer.set_variant(template)
+                changed = True
+            except ValueError:
+                logger.warning(f"Unknown notification template {template!r}")
+        return changed
+
+    async def reload_config(self):
+        """Apply an edited config file without restarting
+        
+        Called by the config watcher. A file that fails to parse or
+        compile leaves the running matcher untouched.
+        """
+        try:
+            config = await asyncio.to_thread(self.read_config)
+            keywords = self.config_keywords(config)
+            changed = self.apply_settings(config)
+            if keywords and list(KeywordStore(keywords)) != list(self.keywords):
+                await self.swap_keywords(keywords, persist=False)
+                changed = True
+            if not changed:
+                # Our own saves land here too
+                CONFIG_RELOADS.inc(key='unchanged')
+                return
+            CONFIG_RELOADS.inc(key='applied')
+            logger.info(f"🔄 Config reloaded: {len(self.keywords)} keywords, "
+                        f"{self.renderer.variant} notifications")
+        except Exception as e:
+            CONFIG_RELOADS.inc(key='error')
+            logger.error(f"Config reload failed, keeping current keywords: {e}")
+
     async def start_bot(self):
         """Start the user bot with enhanced reconnection"""
         max_retries = 5
@@ -154,23 +343,96 @@ class CloudUserBot:
         while retry_count < max_retries:
             try:
                 logger.info(f"Starting bot (attempt {retry_count + 1}/{max_retries})")
-                await self.client.start()
+                with STARTUP.phase('entity cache preload'):
+                    self.warm_entity_cache()
+                with STARTUP.phase('connect + authorize'):
+                    await self.client.start()
                 
-                # Get user info
-                me = await self.client.get_me()
-                self.my_user_id = me.id
-                logger.info(f"Started as {me.first_name} (ID: {me.id})")
+                # client.start() already fetched our user, this reads the cache
+                me = await self.client.get_me(input_peer=True)
+                self.my_user_id = me.user_id
+                logger.info(f"Authorized as user ID {me.user_id}")
+                return True
                 
-                # Try to create/find notification channel
+            except Exception as e:
+                retry_count += 1
+                logger.error(f"Error starting bot (attempt {retry_count}): {e}")
+                if retry_count < max_retries:
+                    wait_time = retry_count * 10  # Exponential backoff
+                    logger.info(f"Retrying in {wait_time} seconds...")
+                    await asyncio.sleep(wait_time)
+                else:
+                    logger.error("Max retries reached, giving up")
+                    return False
+
+    def warm_entity_cache(self):
+        """Fill Telethon's entity cache from the persisted session in one pass
+        
+        Without it the first update of each group after a restart goes
+        through cold entity resolution.
+        """
+        if self.session_store is None:
+            return
+        started = time.perf_counter()
+        loaded = self.session_store.preload(self.client._mb_entity_cache)
+        elapsed = time.perf_counter() - started
+        logger.info(f"🔥 Entity cache warm: {loaded} entities in {elapsed * 1000:.1f}ms "
+                    f"(read from disk in {self.session_store.load_seconds * 1000:.1f}ms, "
+                    f"~{self.session_store.memory_bytes() / 1024:.0f} KB)")
+
+    def cached_sender(self, message):
+        """The message's sender without a network call when it is known"""
+        sender = message.sender
+        if sender is None and self.session_store is not None:
+            sender = self.session_store.cached_user(message.sender_id)
+        return sender
+
+    def chat_title(self, chat, chat_id):
+        """Chat title from the event, else from the persisted entity cache"""
+        title = getattr(chat, 'title', None)
+        if title is None and self.session_store is not None:
+            title = self.session_store.cached_name(chat_id)
+        return title or 'Unknown'
+
+    async def finish_startup(self):
+        """Deferred startup work, run once handlers are already live"""
+        try:
+            # The channel lookup shares the membership's single dialog pass
+            self.membership.start(self.client)
+            with STARTUP.phase('notification channel'):
                 await self.setup_notification_channel()
-                
-                # Send startup message
-                startup_msg = f"""🤖 **بوت المراقبة السحابي بدأ العمل!**
+            with STARTUP.phase('startup message'):
+                await self.send_to_self(self.startup_message())
+            logger.info("Startup message sent to Saved Messages")
+            STARTUP.mark('startup complete')
+            if self.loop_report_interval:
+                asyncio.create_task(self.loop_report_loop())
+        except Exception as e:
+            logger.warning(f"Deferred startup work failed: {e}")
+
+    async def loop_report_loop(self):
+        """Periodic event-loop report in Saved Messages (LOOP_REPORT_INTERVAL minutes)"""
+        while True:
+            await asyncio.sleep(self.loop_report_interval)
+            try:
+                await self.outbound.send('me', self.loop_report(), parse_mode='markdown',
+                                         priority=PRIORITY_LOW)
+            except Exception as e:
+                logger.warning(f"Loop report not sent: {e}")
+
+    async def mark_first_message(self, event):
+        """One-shot handler timing the first incoming message"""
+        STARTUP.mark('first message')
+        self.client.remove_event_handler(self.mark_first_message)
+
+    def startup_message(self):
+        """Text of the startup message sent to Saved Messages"""
+        return f"""🤖 **بوت المراقبة السحابي بدأ العمل!**
 
 📊 **الإحصائيات:**
 🔑 الكلمات المفتاحية: {len(self.keywords)}
 ☁️ يعمل على الخادم السحابي
-🆔 معرف المستخدم: {me.id}
+🆔 معرف المستخدم: {self.my_user_id}
 
 🛡️ **الحماية المتقدمة نشطة:**
 • حماية من انقطاع الاتصال
@@ -191,24 +453,23 @@ class CloudUserBot:
 • `+كلمة1، كلمة2، كلمة3` - إضافة كلمات متعددة
 • `-كلمة` - حذف كلمة واحدة
 • `-كلمة1، كلمة2، كلمة3` - حذف كلمات متعددة
+• `+re:نمط` - إضافة تعبير نمطي
+• `+~كلمة` - إضافة كلمة بتطابق تقريبي
+• `+عاجل: كلمة` - أولوية الكلمة (عاجل/عادي/منخفض)
 • `#عرض` - عرض جميع الكلمات
-• `!احصائيات` - عرض إحصائيات البوت"""
-                
-                await self.send_to_self(startup_msg)
-                logger.info("Startup message sent to Saved Messages")
-                logger.info("Cloud User bot is running...")
-                return True
-                
-            except Exception as e:
-                retry_count += 1
-                logger.error(f"Error starting bot (attempt {retry_count}): {e}")
-                if retry_count < max_retries:
-                    wait_time = retry_count * 10  # Exponential backoff
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    await asyncio.sleep(wait_time)
-                else:
-                    logger.error("Max retries reached, giving up")
-                    return False
+• `#تصدير` / `#استيراد` - تصدير واستيراد الكلمات كملف
+• `?بحث كلمة` - البحث في المطابقات السابقة (مجموعة:اسم ايام:7 صفحة:2)
+• `!احصائيات` - عرض إحصائيات البوت
+• `!ذاكرة` - استهلاك الذاكرة لكل مجموعة
+• `!قالب مختصر` - شكل الإشعارات (كامل/مختصر/ملخص/أصلي)
+• `!توصيل محفوظة قناة` - وجهات الإشعارات
+• `!حمل` - حالة الضغط ومستوى التخفيف
+• `!حلقة` - تأخر الحلقة والعمليات البطيئة
+• `!تحليل يوم` - الرسائل والمطابقات لكل مجموعة وكلمة (ساعة/يوم/اسبوع)
+• `!دقة` - دقة الكلمات من تقييمك للإشعارات (رد ❌ أو ✅)
+• `!مرسلين` - المرسلون المقيدون والمكتومون
+• `!حظر 123` / `!سماح 123` / `!محايد 123` - قوائم المرسلين
+• `!profile 30` - تشخيص استهلاك المعالج لمدة 30 ثانية"""
 
     async def start(self):
         """Main start method with connection monitoring"""
@@ -217,16 +478,7 @@ class CloudUserBot:
             if not await self.start_bot():
                 return False
             
-            # Register event handlers
-            self.client.add_event_handler(
-                self.handle_new_message, 
-                events.NewMessage(incoming=True)
-            )
-            
-            self.client.add_event_handler(
-                self.handle_command,
-                events.NewMessage(outgoing=True, chats='me')
-            )
+            self.register_handlers()
             
             # Keep the bot running with connection monitoring
             await self.run_with_monitoring()
@@ -235,6 +487,54 @@ class CloudUserBot:
             logger.error(f"Critical error in start(): {e}")
             return False
 
+    def register_handlers(self):
+        """Register event handlers right after authorization, then defer the rest"""
+        self.fast_path.self_id = self.my_user_id
+        self.client.add_event_handler(
+            self.handle_new_message, 
+            events.NewMessage(incoming=True, func=self.fast_path)
+        )
+        
+        self.client.add_event_handler(
+            self.handle_message_edited,
+            events.MessageEdited(incoming=True, func=self.fast_path)
+        )
+        
+        self.client.add_event_handler(
+            self.handle_command,
+            events.NewMessage(outgoing=True, chats='me')
+        )
+        
+        self.membership.register(self.client, self.my_user_id)
+        
+        # Verdicts on notifications: only short replies are looked at
+        self.client.add_event_handler(
+            self.handle_feedback_reply,
+            events.NewMessage(outgoing=True,
+                              func=lambda e: e.is_reply and verdict_of(e.raw_text) is not None)
+        )
+        self.client.add_event_handler(self.handle_feedback_reaction, events.MessageEdited(outgoing=True))
+        self.client.add_event_handler(self.handle_feedback_reaction,
+                                      events.Raw(types.UpdateMessageReactions))
+        
+        # Pick up keyword edits made to the config file while running
+        if os.getenv('CONFIG_WATCH', '1') != '0':
+            self.config_watcher = ConfigWatcher(
+                self.config_file, self.reload_config,
+                poll_interval=float(os.getenv('CONFIG_POLL_INTERVAL', '2')))
+            self.config_watcher.start()
+        
+        self.loop_monitor.start()
+        self.analytics.start()
+        self.reputation.start()
+        
+        STARTUP.mark('handlers registered')
+        logger.info(f"⚡ Handlers ready {STARTUP.elapsed():.2f}s after launch")
+        self.client.add_event_handler(self.mark_first_message, events.NewMessage(incoming=True))
+        
+        # Channel discovery and the startup message do not gate monitoring
+        self.startup_task = asyncio.create_task(self.finish_startup())
+
     async def run_with_monitoring(self):
         """Run bot with aggressive connection monitoring and auto-reconnect"""
         last_heartbeat = time.time()
@@ -270,15 +570,18 @@ class CloudUserBot:
                         
                         last_heartbeat = time.time()
                 
-                # Save session periodically to prevent loss
+                # Checkpoint entities and update state periodically
                 if current_time - self.last_session_save > self.session_save_interval:
                     try:
-                        # Force save session
-                        session_string = self.client.session.save()
+                        rows = await self.checkpoint_session()
                         self.last_session_save = current_time
-                        logger.info("💾 Session saved successfully")
+                        logger.info(f"💾 Session checkpoint: {rows} rows written")
                     except Exception as e:
                         logger.warning(f"Failed to save session: {e}")
+                    try:
+                        await self.save_feedback()
+                    except Exception as e:
+                        logger.warning(f"Failed to save keyword feedback: {e}")
                 
                 # Check for session conflicts and protect against logout
                 if current_time - self.last_session_check > self.session_check_interval:
@@ -402,6 +705,16 @@ class CloudUserBot:
             logger.error(f"Critical error in force_reconnect: {e}")
             return False
 
+    async def checkpoint_session(self):
+        """Write entities and update states changed since the last checkpoint"""
+        if self.session_store is None:
+            return 0
+        # Telethon keeps the freshest access hashes and pts in its update state
+        save_states = getattr(self.client, '_save_states_and_entities', None)
+        if save_states is not None:
+            save_states()
+        return await self.session_store.checkpoint()
+
     async def protect_session(self):
         """Protect session with multi-device support"""
         try:
@@ -491,14 +804,50 @@ class CloudUserBot:
             return await self.force_reconnect()
 
     async def setup_notification_channel(self):
-        """Setup a private notification channel for better push notifications"""
+        """Setup a private notification channel for better push notifications
+        
+        Looked up by the id saved when it was found or created; without one,
+        by title during the membership's dialog sync, so startup fetches the
+        dialogs once.
+        """
+        found = []
+        
+        def find_channel(dialog):
+            if not found and getattr(dialog.entity, 'title', None) == "🔔 Bot Notifications":
+                found.append(dialog.entity)
+        
+        # Listening before the first await, so no dialog of the sync is missed
+        scanned = self.membership.first_sync.is_set()
+        self.membership.dialog_listeners.append(find_channel)
         try:
+            config = await asyncio.to_thread(self.read_config) or {}
+            channel_id = config.get('notification_channel')
+            if channel_id:
+                try:
+                    channel = await self.client.get_entity(types.PeerChannel(channel_id))
+                    if not getattr(channel, 'left', False):
+                        self.notification_channel = channel
+                        logger.info("✅ Found notification channel by its saved id")
+                        return
+                except Exception as e:
+                    logger.info(f"Saved notification channel unavailable: {e}")
+            
             # Try to find existing notification channel
-            async for dialog in self.client.iter_dialogs():
-                if hasattr(dialog.entity, 'title') and dialog.entity.title == "🔔 Bot Notifications":
-                    self.notification_channel = dialog.entity
-                    logger.info("✅ Found existing notification channel")
+            if scanned:
+                # The sync already ran without us: scan once more
+                async for dialog in self.client.iter_dialogs():
+                    find_channel(dialog)
+            else:
+                await self.membership.first_sync.wait()
+                if not found and self.membership.synced_at is None:
+                    # Not every dialog was seen: creating one could duplicate it
+                    logger.warning("Dialog sync failed, notification channel not set up")
                     return
+            if found:
+                self.notification_channel = found[0]
+                await self.save_setting('notification_channel', found[0].id)
+                logger.info("✅ Found existing notification channel")
+                return
             
             # Create new private channel if not found
             try:
@@ -510,6 +859,7 @@ class CloudUserBot:
                 ))
                 
                 self.notification_channel = result.chats[0]
+                await self.save_setting('notification_channel', self.notification_channel.id)
                 logger.info("✅ Created new notification channel successfully")
                 
                 # Send welcome message to channel
@@ -524,6 +874,58 @@ class CloudUserBot:
         except Exception as e:
             logger.warning(f"Error setting up notification channel: {e}")
             self.notification_channel = None
+        finally:
+            self.membership.dialog_listeners.remove(find_channel)
+
+    def build_command_table(self):
+        """Prefix-dispatch table for commands sent to Saved Messages"""
+        # +/- take the rest of the message as argument
+        self.prefix_commands = {
+            '+': self.cmd_add_keywords,
+            '-': self.cmd_remove_keywords,
+        }
+        # #, !, ? are followed by a command name and optional arguments
+        self.named_commands = {
+            '#': {
+                'عرض': self.cmd_show_keywords,
+                'الكلمات': self.cmd_show_keywords,
+                'قائمة': self.cmd_show_keywords,
+                'استيراد': self.cmd_import_keywords,
+                'تصدير': self.cmd_export_keywords,
+            },
+            '!': {
+                'احصائيات': self.cmd_stats,
+                'معلومات': self.cmd_stats,
+                'حالة': self.cmd_stats,
+                'ذاكرة': self.cmd_memory,
+                'قالب': self.cmd_template,
+                'توصيل': self.cmd_delivery,
+                'حمل': self.cmd_load,
+                'حلقة': self.cmd_loop,
+                'تحليل': self.cmd_analytics,
+                'دقة': self.cmd_precision,
+                'مرسلين': self.cmd_senders,
+                'حظر': self.cmd_block_sender,
+                'سماح': self.cmd_allow_sender,
+                'محايد': self.cmd_reset_sender,
+                'profile': self.cmd_profile,
+                'تشخيص': self.cmd_profile,
+            },
+            '?': {
+                'بحث': self.cmd_search,
+            },
+        }
+        self.unknown_command_help = {
+            '#': "• `#عرض` - عرض الكلمات\n• `#تصدير` - تصدير الكلمات كملف\n• `#استيراد` - استيراد ملف txt/csv",
+            '!': "• `!احصائيات` - عرض المعلومات\n• `!ذاكرة` - استهلاك الذاكرة لكل مجموعة\n• `!قالب مختصر` - شكل الإشعارات (كامل/مختصر/ملخص/أصلي)\n• `!توصيل محفوظة قناة` - وجهات الإشعارات\n• `!حمل` - حالة الضغط ومستوى التخفيف\n• `!حلقة` - تأخر الحلقة والعمليات البطيئة\n• `!تحليل يوم` - الرسائل والمطابقات لكل مجموعة وكلمة (ساعة/يوم/اسبوع)\n• `!دقة` - دقة الكلمات من تقييمك للإشعارات (رد ❌ أو ✅)\n• `!مرسلين` - المرسلون المقيدون والمكتومون\n• `!حظر 123` / `!سماح 123` / `!محايد 123` - قوائم المرسلين\n• `!profile 30` - تشخيص استهلاك المعالج لمدة 30 ثانية",
+            '?': "• `?بحث كلمة` - البحث في المطابقات السابقة",
+        }
+
+    async def reply(self, response, **kwargs):
+        """Send a command reply to Saved Messages through the outbound scheduler"""
+        kwargs.setdefault('parse_mode', 'markdown')
+        # Replies jump ahead of queued notifications
+        return await self.outbound.send('me', response, priority=PRIORITY_HIGH, **kwargs)
 
     async def handle_command(self, event):
         """Handle commands in Saved Messages"""
@@ -531,179 +933,190 @@ class CloudUserBot:
             message = event.message
             
             # Skip if no text
-            if not message.text:
+            text = message.message
+            if not text:
                 return
                 
-            text = message.text.strip()
-            
-            # Only process commands that start with +, -, #, !
-            if not text.startswith(('+', '-', '#', '!')):
+            text = text.strip()
+            prefix = text[:1]
+            handler = self.prefix_commands.get(prefix)
+            table = self.named_commands.get(prefix)
+            if handler is None and table is None:
                 return
             
-            logger.info(f"Processing command: {text}")
+            logger.info(f"Processing command: {text[:100]}")
             
-            # Add keyword command: +كلمة
-            if text.startswith('+'):
-                keyword = text[1:].strip()
-                
-                # Check if multiple keywords (separated by comma, semicolon, or newline)
-                if any(sep in keyword for sep in [',', '،', ';', '؛', '\n']):
-                    # Multiple keywords
-                    separators = [',', '،', ';', '؛', '\n']
-                    keywords_to_add = [keyword]
-                    
-                    # Split by all possible separators
-                    for sep in separators:
-                        temp_list = []
-                        for kw in keywords_to_add:
-                            temp_list.extend([k.strip() for k in kw.split(sep) if k.strip()])
-                        keywords_to_add = temp_list
-                    
-                    # Remove duplicates and empty strings
-                    keywords_to_add = list(set([kw for kw in keywords_to_add if kw and kw not in self.keywords]))
-                    
-                    if keywords_to_add:
-                        self.keywords.extend(keywords_to_add)
-                        await self.save_keywords()
-                        
-                        keywords_list = '\n'.join([f"• `{kw}`" for kw in keywords_to_add])
-                        response = f"""✅ **تم إضافة {len(keywords_to_add)} كلمة مفتاحية:**
+            if handler is not None:
+                response = await handler(text[1:].strip(), message)
+            else:
+                name, _, args = text[1:].strip().partition(' ')
+                handler = table.get(name.lower())
+                if handler is not None:
+                    response = await handler(args.strip(), message)
+                else:
+                    response = f"❌ **أمر غير معروف**\n**الأوامر المتاحة:**\n{self.unknown_command_help[prefix]}"
+            
+            if response:
+                await self.reply(response)
+            
+        except Exception as e:
+            logger.error(f"Error handling command: {e}")
+            await self.reply(f"❌ **خطأ في تنفيذ الأمر:** {str(e)}", parse_mode=None)
 
-{keywords_list}
+    async def apply_keyword_changes(self, add=(), remove=(), tier=None):
+        """Apply a bulk change: one matcher rebuild and one persist at most
+        
+        With a tier, every added entry (new or existing) is set to it.
+        Returns (added, removed, retiered).
+        """
+        added = self.keywords.add_many(add)
+        removed = self.keywords.remove_many(remove)
+        for kw in removed:
+            self.keyword_tiers.pop(kw, None)
+        retiered = []
+        if tier is not None:
+            for kw in add:
+                if kw in self.keywords and self.keyword_tier(kw) != tier:
+                    self.set_keyword_tier(kw, tier)
+                    retiered.append(kw)
+        if added or removed:
+            self.rebuild_matcher()
+        if added or removed or retiered:
+            await self.save_keywords()
+        return added, removed, retiered
 
-📊 **العدد الإجمالي:** {len(self.keywords)} كلمة"""
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                        logger.info(f"Added {len(keywords_to_add)} keywords: {keywords_to_add}")
-                    else:
-                        response = "⚠️ **جميع الكلمات موجودة بالفعل أو فارغة**"
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                        
-                else:
-                    # Single keyword (original logic)
-                    if keyword and keyword not in self.keywords:
-                        self.keywords.append(keyword)
-                        await self.save_keywords()
-                        response = f"✅ **تم إضافة الكلمة المفتاحية:**\n`{keyword}`\n\n📊 **العدد الحالي:** {len(self.keywords)} كلمة"
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                        logger.info(f"Added keyword: {keyword}")
-                    elif keyword in self.keywords:
-                        response = f"⚠️ **الكلمة موجودة بالفعل:**\n`{keyword}`"
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                    else:
-                        response = """❌ **خطأ:** يرجى كتابة كلمة صحيحة
+    def keyword_tier(self, keyword) -> int:
+        return self.keyword_tiers.get(keyword, DEFAULT_TIER)
+
+    def set_keyword_tier(self, keyword, tier: int):
+        if tier == DEFAULT_TIER:
+            self.keyword_tiers.pop(keyword, None)
+        else:
+            self.keyword_tiers[keyword] = tier
+
+    def match_tier(self, keywords) -> int:
+        """A match is as urgent as its most urgent keyword"""
+        tiers = self.keyword_tiers
+        if not tiers:
+            return DEFAULT_TIER
+        return min(tiers.get(kw, DEFAULT_TIER) for kw in keywords)
+
+    async def cmd_add_keywords(self, args, message=None):
+        """+كلمة / +كلمة1، كلمة2 / +re:نمط / +~كلمة / +عاجل: كلمة"""
+        tier, args = parse_tier(args)
+        entries = split_entries(args)
+        if not entries:
+            return """❌ **خطأ:** يرجى كتابة كلمة صحيحة
 
 **أمثلة:**
 • `+يساعدني` - إضافة كلمة واحدة
-• `+يساعدني، ابي حد، محتاج` - إضافة كلمات متعددة"""
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-            
-            # Remove keyword command: -كلمة
-            elif text.startswith('-'):
-                keyword = text[1:].strip()
-                
-                # Check if multiple keywords (separated by comma, semicolon, or newline)
-                if any(sep in keyword for sep in [',', '،', ';', '؛', '\n']):
-                    # Multiple keywords
-                    separators = [',', '،', ';', '؛', '\n']
-                    keywords_to_remove = [keyword]
-                    
-                    # Split by all possible separators
-                    for sep in separators:
-                        temp_list = []
-                        for kw in keywords_to_remove:
-                            temp_list.extend([k.strip() for k in kw.split(sep) if k.strip()])
-                        keywords_to_remove = temp_list
-                    
-                    # Filter only existing keywords
-                    existing_keywords = [kw for kw in keywords_to_remove if kw in self.keywords]
-                    
-                    if existing_keywords:
-                        for kw in existing_keywords:
-                            self.keywords.remove(kw)
-                        await self.save_keywords()
-                        
-                        keywords_list = '\n'.join([f"• `{kw}`" for kw in existing_keywords])
-                        response = f"""✅ **تم حذف {len(existing_keywords)} كلمة مفتاحية:**
+• `+يساعدني، ابي حد، محتاج` - إضافة كلمات متعددة
+• `+re:ابي (حد|شخص)` - تعبير نمطي
+• `+~يساعدني` - تطابق تقريبي (خطأ إملائي واحد)
+• `+عاجل: ابي شخص يسوي` - أولوية (عاجل/عادي/منخفض)"""
+        
+        tier_note = f"\n⚡ **الأولوية:** {TIER_LABELS[tier]}" if tier is not None else ""
+        if len(entries) == 1:
+            keyword = entries[0]
+            entry_error = validate_entry(keyword)
+            if entry_error:
+                return f"❌ **خطأ:** {entry_error}\n`{keyword}`"
+            if keyword in self.keywords:
+                if tier is not None:
+                    await self.apply_keyword_changes(add=entries, tier=tier)
+                    return f"✅ **تم تحديث أولوية الكلمة:**\n`{keyword}`{tier_note}"
+                return f"⚠️ **الكلمة موجودة بالفعل:**\n`{keyword}`"
+            await self.apply_keyword_changes(add=entries, tier=tier)
+            logger.info(f"Added keyword: {keyword}")
+            return f"✅ **تم إضافة الكلمة المفتاحية:**\n`{keyword}`{tier_note}\n\n📊 **العدد الحالي:** {len(self.keywords)} كلمة"
+        
+        # Drop unusable entries before touching the store
+        added, _, retiered = await self.apply_keyword_changes(
+            add=[kw for kw in entries if not validate_entry(kw)], tier=tier)
+        if not added and not retiered:
+            return "⚠️ **جميع الكلمات موجودة بالفعل أو فارغة**"
+        updated = [kw for kw in retiered if kw not in added]
+        if not added:
+            return f"""✅ **تم تحديث أولوية {len(updated)} كلمة:**
 
-{keywords_list}
+{self.format_keyword_list(updated)}
+{tier_note}"""
+        logger.info(f"Added {len(added)} keywords")
+        updated_note = f"\n🔁 **تم تحديث أولوية {len(updated)} كلمة موجودة**" if updated else ""
+        return f"""✅ **تم إضافة {len(added)} كلمة مفتاحية:**
 
+{self.format_keyword_list(added)}
+{tier_note}{updated_note}
 📊 **العدد الإجمالي:** {len(self.keywords)} كلمة"""
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                        logger.info(f"Removed {len(existing_keywords)} keywords: {existing_keywords}")
-                    else:
-                        response = "⚠️ **لا توجد كلمات صحيحة للحذف**"
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                        
-                else:
-                    # Single keyword (original logic)
-                    if keyword and keyword in self.keywords:
-                        self.keywords.remove(keyword)
-                        await self.save_keywords()
-                        response = f"✅ **تم حذف الكلمة المفتاحية:**\n`{keyword}`\n\n📊 **العدد الحالي:** {len(self.keywords)} كلمة"
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                        logger.info(f"Removed keyword: {keyword}")
-                    elif keyword not in self.keywords:
-                        response = f"⚠️ **الكلمة غير موجودة:**\n`{keyword}`"
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                    else:
-                        response = """❌ **خطأ:** يرجى كتابة كلمة صحيحة
+
+    async def cmd_remove_keywords(self, args, message=None):
+        """-كلمة / -كلمة1، كلمة2"""
+        entries = split_entries(args)
+        if not entries:
+            return """❌ **خطأ:** يرجى كتابة كلمة صحيحة
 
 **أمثلة:**
 • `-يساعدني` - حذف كلمة واحدة
 • `-يساعدني، ابي حد، محتاج` - حذف كلمات متعددة"""
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-            
-            # Show all keywords: #عرض
-            elif text.startswith('#'):
-                command = text[1:].strip().lower()
-                if command in ['عرض', 'الكلمات', 'قائمة']:
-                    if self.keywords:
-                        keywords_list = '\n'.join([f"• `{kw}`" for kw in self.keywords])
-                        response = f"""📋 **قائمة الكلمات المفتاحية:**
+        
+        _, removed, _ = await self.apply_keyword_changes(remove=entries)
+        if len(entries) == 1:
+            if not removed:
+                return f"⚠️ **الكلمة غير موجودة:**\n`{entries[0]}`"
+            logger.info(f"Removed keyword: {entries[0]}")
+            return f"✅ **تم حذف الكلمة المفتاحية:**\n`{entries[0]}`\n\n📊 **العدد الحالي:** {len(self.keywords)} كلمة"
+        
+        if not removed:
+            return "⚠️ **لا توجد كلمات صحيحة للحذف**"
+        logger.info(f"Removed {len(removed)} keywords")
+        return f"""✅ **تم حذف {len(removed)} كلمة مفتاحية:**
 
-{keywords_list}
+{self.format_keyword_list(removed)}
+
+📊 **العدد الإجمالي:** {len(self.keywords)} كلمة"""
+
+    @staticmethod
+    def format_keyword_list(keywords, limit: int = 200):
+        """Bullet list of keywords, truncated for very large bulk changes"""
+        keywords = list(keywords)
+        lines = [f"• `{kw}`" for kw in keywords[:limit]]
+        if len(keywords) > limit:
+            lines.append(f"… و {len(keywords) - limit} كلمة أخرى")
+        return '\n'.join(lines)
+
+    async def cmd_show_keywords(self, args, message=None):
+        """#عرض"""
+        if not self.keywords:
+            return "📋 **قائمة الكلمات المفتاحية فارغة**\n\n💡 **لإضافة كلمة:** `+كلمة_جديدة`"
+        tiered = [f"{TIER_LABELS[tier]}: `{kw}`" for kw, tier in self.keyword_tiers.items() if kw in self.keywords]
+        tiers_note = "\n\n⚡ **الأولويات:**\n" + '\n'.join(tiered[:50]) if tiered else ""
+        return f"""📋 **قائمة الكلمات المفتاحية:**
+
+{self.format_keyword_list(self.keywords)}{tiers_note}
 
 📊 **العدد الإجمالي:** {len(self.keywords)} كلمة
 
 💡 **للإضافة:** `+كلمة_جديدة`
 💡 **للحذف:** `-كلمة_موجودة`"""
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                    else:
-                        response = "📋 **قائمة الكلمات المفتاحية فارغة**\n\n💡 **لإضافة كلمة:** `+كلمة_جديدة`"
-                        await asyncio.sleep(0.5)
-                        await self.client.send_message('me', response, parse_mode='markdown')
-                else:
-                    response = "❌ **أمر غير معروف**\n**الأوامر المتاحة:**\n• `#عرض` - عرض الكلمات"
-                    await asyncio.sleep(0.5)
-                    await self.client.send_message('me', response, parse_mode='markdown')
-            
-            # Statistics command: !احصائيات
-            elif text.startswith('!'):
-                command = text[1:].strip().lower()
-                if command in ['احصائيات', 'معلومات', 'حالة']:
-                    # حساب عدد جميع المجموعات
-                    try:
-                        all_dialogs = await self.client.get_dialogs()
-                        total_groups = sum(1 for d in all_dialogs if d.is_group or d.is_channel)
-                    except:
-                        total_groups = "غير متاح"
-                    
-                    response = f"""📊 **إحصائيات البوت:**
+
+    async def cmd_stats(self, args, message=None):
+        """!احصائيات"""
+        # Kept by the membership tracker, no dialog fetch per command
+        total_groups = len(self.monitored_groups)
+        if self.membership.synced_at is None:
+            total_groups = f"{total_groups} (المزامنة جارية)"
+        latency = ' • '.join(
+            f"{TIER_LABELS[tier]} {p99:.1f}s/{target:g}s" + (" ⚠️" if p99 > target else "")
+            for tier, p99, target, samples in self.pipeline.report() if samples) or "لا توجد إشعارات بعد"
+        
+        return f"""📊 **إحصائيات البوت:**
 
 🔑 **الكلمات المفتاحية:** {len(self.keywords)}
 👥 **يراقب:** جميع المجموعات التي أنت عضو فيها
 📈 **إجمالي المجموعات:** {total_groups}
+⚡ **نسبة الرفض السريع:** {prefilter_rejection_rate():.1%}
+⏱️ **زمن التوصيل (p99 / الهدف):** {latency}
+🌊 **مستوى الحمل:** {LEVEL_LABELS[self.overload.level]}
 ☁️ **الحالة:** يعمل على الخادم السحابي
 🆔 **معرف المستخدم:** {self.my_user_id}
 
@@ -712,70 +1125,635 @@ class CloudUserBot:
 • `+كلمة1، كلمة2، كلمة3` - إضافة كلمات متعددة
 • `-كلمة` - حذف كلمة واحدة
 • `-كلمة1، كلمة2، كلمة3` - حذف كلمات متعددة
+• `+re:نمط` - إضافة تعبير نمطي
+• `+~كلمة` - إضافة كلمة بتطابق تقريبي
+• `+عاجل: كلمة` - أولوية الكلمة (عاجل/عادي/منخفض)
 • `#عرض` - عرض جميع الكلمات
-• `!احصائيات` - عرض هذه المعلومات"""
-                    await asyncio.sleep(0.5)
-                    await self.client.send_message('me', response, parse_mode='markdown')
+• `#تصدير` / `#استيراد` - تصدير واستيراد الكلمات كملف
+• `?بحث كلمة` - البحث في المطابقات السابقة
+• `!احصائيات` - عرض هذه المعلومات
+• `!ذاكرة` - استهلاك الذاكرة لكل مجموعة
+• `!قالب مختصر` - شكل الإشعارات (كامل/مختصر/ملخص/أصلي)
+• `!توصيل محفوظة قناة` - وجهات الإشعارات
+• `!حمل` - حالة الضغط ومستوى التخفيف
+• `!حلقة` - تأخر الحلقة والعمليات البطيئة
+• `!تحليل يوم` - الرسائل والمطابقات لكل مجموعة وكلمة (ساعة/يوم/اسبوع)
+• `!دقة` - دقة الكلمات من تقييمك للإشعارات (رد ❌ أو ✅)
+• `!مرسلين` - المرسلون المقيدون والمكتومون
+• `!حظر 123` / `!سماح 123` / `!محايد 123` - قوائم المرسلين
+• `!profile 30` - تشخيص استهلاك المعالج لمدة 30 ثانية"""
+
+    async def cmd_template(self, args, message=None):
+        """!قالب [كامل|مختصر|ملخص]"""
+        names = {'full': 'كامل', 'compact': 'مختصر', 'digest': 'ملخص', 'original': 'أصلي'}
+        if not args:
+            return f"""🖼️ **قالب الإشعارات:** {names[self.renderer.variant]}
+
+• `!قالب كامل` - كل التفاصيل
+• `!قالب مختصر` - سطرين
+• `!قالب ملخص` - سطر واحد لكل مطابقة
+• `!قالب أصلي` - تحويل الرسالة الأصلية مع سطر تعريفي"""
+        try:
+            variant = self.renderer.set_variant(args)
+        except ValueError:
+            return f"❌ **قالب غير معروف:** `{args}`\n💡 المتاح: كامل، مختصر، ملخص، أصلي"
+        await self.save_setting('notification_template', variant)
+        return f"✅ **قالب الإشعارات الآن:** {names[variant]}"
+
+    async def cmd_delivery(self, args, message=None):
+        """!توصيل [رئيسي] [نسخ...] [نسخ|تحويل]"""
+        names = {'me': 'الرسائل المحفوظة', CHANNEL: 'قناة الإشعارات'}
+        modes = {'copy': 'نسخ متزامن', 'forward': 'تحويل من الرئيسي'}
+        if args:
+            targets = []
+            mode = self.delivery.mode
+            for token in args.replace('،', ' ').replace(',', ' ').split():
+                if token in MODE_ALIASES:
+                    mode = MODE_ALIASES[token]
+                    continue
+                target = parse_target(token)
+                if target is None:
+                    return f"❌ **وجهة غير معروفة:** `{token}`\n💡 المتاح: محفوظة، قناة، معرف محادثة أو @اسم"
+                targets.append(target)
+            primary = targets[0] if targets else self.delivery.primary
+            mirrors = targets[1:] if targets else self.delivery.mirrors
+            self.delivery.configure(primary, mirrors, mode)
+            await self.save_setting('delivery', self.delivery.as_config())
+        
+        mirrors = '، '.join(names.get(m, m) for m in self.delivery.mirrors) or 'لا يوجد'
+        return f"""📬 **توصيل الإشعارات:**
+
+🎯 **الرئيسي:** {names.get(self.delivery.primary, self.delivery.primary)}
+🪞 **النسخ:** {mirrors}
+🔁 **الطريقة:** {modes[self.delivery.mode]}
+
+💡 `!توصيل محفوظة قناة` - الأول رئيسي والباقي نسخ
+💡 أضف `تحويل` لتحويل رسالة الرئيسي بدلاً من إرسال نسخة"""
+
+    async def cmd_memory(self, args, message=None):
+        """!ذاكرة"""
+        report = self.monitored_groups.memory_report()
+        spill = ''
+        if self.monitored_groups.max_records:
+            spill = (f"\n💾 **في القرص:** {report['spilled']} "
+                     f"(الحد في الذاكرة {self.monitored_groups.max_records})")
+        return f"""🧠 **ذاكرة حالة المجموعات:**
+
+👥 **المجموعات المتتبعة:** {report['chats']}
+🔢 **المعرفات:** {report['ids_bytes'] / 1024:.1f} KB
+📋 **السجلات في الذاكرة:** {report['records']} ({report['records_bytes'] / 1024:.1f} KB){spill}
+📏 **لكل مجموعة:** {report['bytes_per_chat']:.0f} بايت
+📉 **مقارنة بـ set:** {report['set_bytes'] / 1024:.1f} KB للمعرفات وحدها"""
+
+    async def cmd_load(self, args, message=None):
+        """!حمل"""
+        overload = self.overload
+        lines = [
+            "🌊 **حالة الحمل:**",
+            "",
+            f"📶 **المستوى:** {LEVEL_LABELS[overload.level]} ({LEVELS[overload.level]})",
+            f"⏳ **تأخر الحلقة:** {overload.lag * 1000:.0f}ms (الهدف {overload.lag_target * 1000:.0f}ms)",
+            f"📥 **الطابور:** {overload.last_depth} (الهدف {overload.depth_target})",
+            f"🔻 **المتخطى:** مجموعات منخفضة {OVERLOAD_DROPPED.get('low_group')} • "
+            f"كلمات منخفضة {OVERLOAD_DROPPED.get('low_tier')} • عينات {OVERLOAD_DROPPED.get('sampled')}",
+        ]
+        if overload.history:
+            lines += ["", "🕒 **آخر التغييرات:**"]
+            for stamp, previous, level, pressure in list(overload.history)[-10:]:
+                when = datetime.fromtimestamp(stamp).strftime('%H:%M:%S')
+                lines.append(f"• {when} {LEVELS[previous]} ← {LEVELS[level]} (ضغط {pressure:.1f})")
+        return '\n'.join(lines)
+
+    async def cmd_loop(self, args, message=None):
+        """!حلقة"""
+        return self.loop_report()
+
+    async def cmd_analytics(self, args, message=None):
+        """!تحليل [ساعة|يوم|اسبوع]"""
+        spans = {
+            'ساعة': (MINUTE, 'ساعة (بالدقيقة)'),
+            'يوم': (HOUR, '24 ساعة (بالساعة)'),
+            'اسبوع': (DAY, '7 أيام (باليوم)'),
+            'أسبوع': (DAY, '7 أيام (باليوم)'),
+        }
+        resolution, span = spans.get(args.strip(), spans['يوم'])
+        analytics = self.analytics
+        groups = analytics.totals(analytics.groups, resolution)
+        seen = sum(counts[analytics.SEEN] for counts in groups.values())
+        matched = sum(counts[analytics.MATCHED] for counts in groups.values())
+        trend = analytics.groups.rings[analytics.SEEN][resolution].series()
+        
+        lines = [
+            f"📈 **تحليل آخر {span}:**",
+            "",
+            f"📨 **الرسائل:** {seen} • 🎯 **المطابقات:** {matched}"
+            + (f" ({matched / seen:.2%})" if seen else ""),
+            f"📉 `{sparkline(trend)}`",
+        ]
+        busiest = analytics.top(analytics.groups, resolution, analytics.SEEN)
+        if busiest:
+            lines += ["", "👥 **أكثر المجموعات رسائل:**"]
+            lines += [f"• {self.group_label(key)}: {counts[0]} رسالة، {counts[1]} مطابقة"
+                      for key, counts in busiest]
+        keywords = analytics.top(analytics.keywords, resolution)
+        if keywords:
+            lines += ["", "🔑 **أكثر الكلمات مطابقة:**"]
+            lines += [f"• {key}: {counts[0]}" for key, counts in keywords]
+        # Groups that cost matching work and never produced a notification
+        idle = [(key, counts) for key, counts in
+                analytics.top(analytics.groups, resolution, analytics.SEEN, limit=len(groups))
+                if not counts[analytics.MATCHED]][:5]
+        if idle:
+            lines += ["", "💤 **رسائل كثيرة بلا مطابقات:**"]
+            lines += [f"• {self.group_label(key)}: {counts[0]} رسالة" for key, counts in idle]
+        lines += ["", f"💾 **ذاكرة العدادات:** {analytics.memory_bytes() / 1024 / 1024:.1f} MB "
+                      f"(حتى {analytics.groups.capacity} مجموعة و{analytics.keywords.capacity} كلمة)"]
+        return '\n'.join(lines)
+
+    async def cmd_precision(self, args, message=None):
+        """!دقة [كلمة]"""
+        feedback = self.feedback
+        if args:
+            score = feedback.scores.get(args)
+            if score is None:
+                return f"❌ لا توجد بيانات للكلمة: **{args}**"
+            suggestions = feedback.suggestions(args, limit=5)
+            lines = [
+                f"🎯 **دقة الكلمة:** {args}",
+                "",
+                f"📨 **المطابقات:** {score.matches}",
+                f"👍 **مفيد:** {score.useful} • 👎 **إزعاج:** {score.noise}",
+                f"📐 **الدقة:** {score.precision:.0%}" if score.votes else "📐 **الدقة:** لا تقييمات بعد",
+            ]
+            if suggestions:
+                lines += ["", "💡 **عبارات أدق:** " + "، ".join(f"`{p}`" for p in suggestions)]
+            return '\n'.join(lines)
+        
+        ranking = feedback.ranking(self.keywords)
+        if not ranking:
+            return "📭 **لا توجد مطابقات بعد**\n💡 رد على أي إشعار بـ ❌ (إزعاج) أو ✅ (مفيد)"
+        total = sum(score.matches for _, score in ranking) or 1
+        lines = ["🎯 **فعالية الكلمات:**", ""]
+        for keyword, score in ranking[:15]:
+            rating = f"دقة {score.precision:.0%} ({score.votes} تقييم)" if score.votes else "بلا تقييم"
+            lines.append(f"• {keyword}: {score.matches} مطابقة ({score.matches / total:.0%}) • {rating}")
+        noisy = feedback.noisy(self.keywords)
+        if noisy:
+            lines += ["", "⚠️ **كلمات مزعجة:**"]
+            for keyword, score in noisy[:5]:
+                lines.append(f"• **{keyword}** - دقة {score.precision:.0%} من {score.votes} تقييم")
+                suggestions = feedback.suggestions(keyword)
+                if suggestions:
+                    lines.append("  💡 جرّب: " + "، ".join(f"`{p}`" for p in suggestions))
+        lines += ["", "💡 رد على الإشعار بـ ❌ أو ✅ أو تفاعل بـ 👎 / 👍 لتقييمه"]
+        return '\n'.join(lines)
+
+    async def cmd_senders(self, args, message=None):
+        """!مرسلين"""
+        reputation = self.reputation
+        auto_muted = [sender_id for sender_id in reputation.muted if sender_id not in reputation.blocked]
+        lines = [
+            "🚦 **سمعة المرسلين:**",
+            "",
+            f"🔇 **مكتومون تلقائياً:** {len(auto_muted)} • ⛔ **محظورون:** {len(reputation.blocked)} • "
+            f"✅ **مسموحون:** {len(reputation.allowed)}",
+            f"📏 **الحدود:** تقييد عند {reputation.throttle_score:g} • كتم عند {reputation.mute_score:g} "
+            f"(تنخفض للنصف كل {reputation.half_life / 60:g} دقيقة)",
+        ]
+        top = [(sender_id, score) for sender_id, score in reputation.top() if score >= 1]
+        if top:
+            lines += ["", "📈 **الأكثر مطابقة:**"]
+            for sender_id, score in top:
+                until = reputation.mute_until(sender_id)
+                if until:
+                    state = f"🔇 حتى {datetime.fromtimestamp(until).strftime('%m-%d %H:%M')}"
+                elif score >= reputation.throttle_score:
+                    state = "🐢 مقيد"
                 else:
-                    response = "❌ **أمر غير معروف**\n**الأوامر المتاحة:**\n• `!احصائيات` - عرض المعلومات"
-                    await asyncio.sleep(0.5)
-                    await self.client.send_message('me', response, parse_mode='markdown')
-            
+                    state = ""
+                lines.append(f"• `{sender_id}` درجة {score:.1f} {state}".rstrip())
+        if reputation.blocked:
+            lines += ["", "⛔ **المحظورون:** " + "، ".join(f"`{i}`" for i in sorted(reputation.blocked)[:30])]
+        lines += ["", "💡 `!حظر 123` كتم دائم • `!سماح 123` بلا تقييد • `!محايد 123` إزالة من القوائم"]
+        return '\n'.join(lines)
+
+    async def resolve_sender(self, args):
+        """Sender ID from a number or @username"""
+        token = args.split()[0] if args else ''
+        if token.lstrip('-').isdigit():
+            return int(token)
+        if token.startswith('@'):
+            try:
+                return await self.client.get_peer_id(token)
+            except Exception as e:
+                logger.warning(f"Could not resolve {token}: {e}")
+        return None
+
+    async def cmd_block_sender(self, args, message=None):
+        """!حظر [معرف|@اسم]"""
+        return await self.update_sender_lists(args, block=True)
+
+    async def cmd_allow_sender(self, args, message=None):
+        """!سماح [معرف|@اسم]"""
+        return await self.update_sender_lists(args, block=False)
+
+    async def cmd_reset_sender(self, args, message=None):
+        """!محايد [معرف|@اسم]"""
+        return await self.update_sender_lists(args, block=None)
+
+    async def update_sender_lists(self, args, block):
+        """Move a sender to the block list (True), allow list (False) or neither (None)"""
+        if not args:
+            return await self.cmd_senders(args)
+        sender_id = await self.resolve_sender(args)
+        if sender_id is None:
+            return f"❌ **معرف غير صالح:** `{args}`\n💡 استخدم رقم المعرف أو @اسم_المستخدم"
+        reputation = self.reputation
+        blocked, allowed = set(reputation.blocked), set(reputation.allowed)
+        blocked.discard(sender_id)
+        allowed.discard(sender_id)
+        if block:
+            blocked.add(sender_id)
+        elif block is False:
+            allowed.add(sender_id)
+        reputation.configure(blocked, allowed)
+        if not block:
+            reputation.forget(sender_id)
+        try:
+            await asyncio.to_thread(self._write_config, {'blocked_senders': sorted(reputation.blocked),
+                                                         'allowed_senders': sorted(reputation.allowed)})
         except Exception as e:
-            logger.error(f"Error handling command: {e}")
-            await asyncio.sleep(0.5)
-            await self.client.send_message('me', f"❌ **خطأ في تنفيذ الأمر:** {str(e)}")
+            logger.error(f"Error saving sender lists: {e}")
+        if block:
+            return f"⛔ **تم حظر المرسل:** `{sender_id}`\nرسائله لن تُفحص بعد الآن"
+        if block is False:
+            return f"✅ **المرسل مسموح دائماً:** `{sender_id}`"
+        return f"↩️ **المرسل `{sender_id}` خارج القوائم** ويخضع للتقييد التلقائي"
+
+    def group_label(self, chat_id):
+        if chat_id == OVERFLOW_KEY:
+            return "مجموعات أخرى"
+        title = self.chat_title(None, chat_id)
+        return title if title != 'Unknown' else f"`{chat_id}`"
+
+    def loop_report(self):
+        """Loop lag percentiles and the code sites of recent stalls"""
+        monitor = self.loop_monitor
+        lines = [
+            "🔄 **حلقة الأحداث:**",
+            "",
+            f"⏳ **التأخر:** الآن {monitor.lag * 1000:.0f}ms • p50 {monitor.percentile(0.5) * 1000:.0f}ms • "
+            f"p99 {monitor.percentile(0.99) * 1000:.0f}ms • الأقصى {monitor.max_lag * 1000:.0f}ms",
+            f"🐢 **التوقفات (> {monitor.threshold * 1000:.0f}ms):** {len(monitor.stalls)} مؤخراً",
+        ]
+        sites = monitor.top_sites()
+        if sites:
+            lines += ["", "📍 **أكثر المواضع تعطيلاً:**"]
+            for site, count, total in sites:
+                lines.append(f"• `{site}` × {count} ({total * 1000:.0f}ms)")
+            worst = max(monitor.stalls, key=lambda stall: stall.duration)
+            lines += ["", f"🔍 **أطول توقف ({worst.duration * 1000:.0f}ms):**"]
+            lines += [f"`{frame}`" for frame in worst.stack[:8]]
+        return '\n'.join(lines)
+
+    async def cmd_profile(self, args, message=None):
+        """!profile [ثواني]"""
+        from sampling_profiler import MAX_SECONDS
+        
+        if self.profile_task is not None and not self.profile_task.done():
+            return "⚠️ **التشخيص يعمل بالفعل**، انتظر حتى يصلك الملف"
+        seconds = int(args) if args.isdigit() else 30
+        seconds = max(1, min(seconds, MAX_SECONDS))
+        # Handlers run sequentially: the profile must not hold up updates
+        self.profile_task = asyncio.create_task(self.run_profile(seconds))
+        return f"⏱️ **بدأ التشخيص لمدة {seconds} ثانية**\n📎 سيصلك ملف collapsed stacks عند الانتهاء"
+
+    async def run_profile(self, seconds: int):
+        """Sample all threads for `seconds` and send the collapsed stacks to Saved Messages"""
+        from sampling_profiler import SamplingProfiler
+        
+        try:
+            profiler = await asyncio.to_thread(SamplingProfiler().run, seconds)
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            top = '\n'.join(f"• `{label}` {share:.0%}" for label, share in profiler.top_functions(8))
+            caption = (f"🔥 **تشخيص المعالج:** {profiler.elapsed:.0f} ثانية، {profiler.samples} عينة\n"
+                       f"{top}\n\n💡 افتحه في speedscope.app أو flamegraph.pl")
+            await self.outbound.call(
+                self.client.send_file, 'me', profiler.collapsed(f"profile-{stamp}.folded"),
+                caption=caption[:1024], parse_mode='markdown', force_document=True)
+            logger.info(f"Profile sent: {profiler.samples} samples, {len(profiler.stacks)} stacks")
+        except Exception as e:
+            logger.error(f"Profiling failed: {e}")
+            await self.reply(f"❌ **فشل التشخيص:** {e}", parse_mode=None)
+
+    async def cmd_import_keywords(self, args, message=None):
+        """#استيراد (caption of a .txt/.csv document), #استيراد استبدال to replace"""
+        # Only needed for file commands, so kept out of the startup imports
+        from keyword_io import IMPORT_EXTENSIONS, ImportTooLarge, KeywordImport
+        
+        file = getattr(message, 'file', None)
+        name = (getattr(file, 'name', None) or '').lower()
+        if not getattr(message, 'document', None) or not name.endswith(IMPORT_EXTENSIONS):
+            return """📥 **استيراد الكلمات:**
+أرسل ملف `.txt` (كلمة في كل سطر) أو `.csv` (الكلمة في العمود الأول) في الرسائل المحفوظة مع التعليق:
+• `#استيراد` - إضافة الكلمات للقائمة الحالية
+• `#استيراد استبدال` - استبدال القائمة بالكامل"""
+        
+        replace = 'استبدال' in args
+        started = time.perf_counter()
+        chunks = self.client.iter_download(message.media, request_size=128 * 1024)
+        try:
+            imported = await KeywordImport().feed_stream(chunks, is_csv=name.endswith('.csv'))
+        except ImportTooLarge:
+            return "❌ **الملف كبير جداً** (الحد الأقصى 20MB)"
+        
+        if replace:
+            if not imported.keywords:
+                # Replacing with nothing would wipe every keyword
+                invalid = ''
+                if imported.invalid:
+                    invalid = f"\n❌ **مرفوضة:** {len(imported.invalid)}\n{self.format_keyword_list(imported.invalid, limit=10)}"
+                return f"""⚠️ **لم يتم الاستبدال:** لا توجد كلمات صالحة في `{file.name}`
+
+📄 **الأسطر:** {imported.lines}{invalid}
+📊 **القائمة الحالية بدون تغيير:** {len(self.keywords)} كلمة"""
+            keywords = imported.keywords
+        else:
+            keywords = list(self.keywords) + [kw for kw in imported.keywords if kw not in self.keywords]
+        before = len(self.keywords)
+        await self.swap_keywords(keywords)
+        elapsed = time.perf_counter() - started
+        
+        invalid = ''
+        if imported.invalid:
+            invalid = f"\n❌ **مرفوضة:** {len(imported.invalid)}\n{self.format_keyword_list(imported.invalid, limit=10)}"
+        logger.info(f"Imported {len(imported.entries)} keywords from {name} in {elapsed:.2f}s")
+        return f"""📥 **تم الاستيراد{' (استبدال)' if replace else ''}:** `{file.name}`
+
+📄 **الأسطر:** {imported.lines}
+🔁 **مكررة:** {imported.duplicates}{invalid}
+📊 **العدد:** {before} ← {len(self.keywords)} كلمة
+⏱️ {elapsed:.2f}s"""
+
+    async def cmd_export_keywords(self, args, message=None):
+        """#تصدير"""
+        from keyword_io import export_keywords
+        
+        stamp = datetime.now().strftime('%Y%m%d-%H%M')
+        await self.outbound.call(
+            self.client.send_file, 'me', export_keywords(self.keywords, f"keywords-{stamp}.txt"),
+            caption=f"📤 **تصدير الكلمات المفتاحية:** {len(self.keywords)} كلمة\n💡 أعد إرساله مع `#استيراد استبدال` لاستعادته",
+            parse_mode='markdown', force_document=True)
+        return None
+
+    async def swap_keywords(self, keywords, persist: bool = True):
+        """Replace the whole keyword set at once
+        
+        The new matcher is compiled in a worker thread; the store and the
+        matcher are then swapped together so no message sees a mix.
+        """
+        store = KeywordStore(keywords)
+        matcher = await asyncio.to_thread(KeywordMatcher, list(store))
+        self.keywords, self.matcher = store, matcher
+        if persist:
+            await self.save_keywords()
+
+    async def cmd_search(self, args, message=None):
+        """?بحث كلمة"""
+        if not self.archive:
+            return "⚠️ **أرشيف المطابقات غير مفعل**"
+        return await self.search_archive(args)
+
+    def rebuild_matcher(self):
+        """Recompile the keyword matcher after the keyword list changed"""
+        self.matcher = KeywordMatcher(self.keywords)
+
+    async def search_archive(self, args: str, page_size: int = 10):
+        """Run a ?بحث query against the match archive
+        
+        Options: مجموعة:<اسم أو معرف>  ايام:<عدد>  صفحة:<رقم>
+        """
+        terms = []
+        chat = None
+        since = None
+        page = 1
+        for token in args.split():
+            key, sep, value = token.partition(':')
+            if sep and value and key == 'مجموعة':
+                chat = int(value) if value.lstrip('-').isdigit() else value
+            elif sep and value and key == 'ايام' and value.isdigit():
+                since = time.time() - int(value) * 86400
+            elif sep and value and key == 'صفحة' and value.isdigit():
+                page = max(1, int(value))
+            else:
+                terms.append(token)
+        
+        started = time.perf_counter()
+        total, rows = await asyncio.to_thread(
+            self.archive.search, terms, chat, since, page_size, (page - 1) * page_size)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        if not rows:
+            return f"🔍 **لا توجد نتائج** لـ `{args.strip() or '*'}`"
+        
+        lines = [f"🔍 **نتائج البحث:** `{args.strip() or '*'}`",
+                 f"📄 صفحة {page} • {total if total < 1000 else '+1000'} نتيجة • {elapsed_ms:.0f}ms", ""]
+        for row in rows:
+            when = datetime.fromtimestamp(row['ts']).strftime('%Y-%m-%d %H:%M')
+            snippet = (row['text'] or '').replace('\n', ' ')[:200]
+            lines.append(f"⏰ {when} | 👥 {row['chat_title']} | 👤 {row['sender_name']}")
+            lines.append(f"🔑 {row['keywords']}")
+            lines.append(f"📝 {snippet}")
+            lines.append("")
+        if total > page * page_size:
+            lines.append(f"➡️ للصفحة التالية: `?بحث {args.strip()} صفحة:{page + 1}`")
+        return '\n'.join(lines)
 
     async def save_keywords(self):
-        """Save keywords to environment or file"""
+        """Persist keywords to the config file without blocking the event loop"""
         try:
-            # For now, just log the change
-            logger.info(f"Keywords updated: {self.keywords}")
-            # In a real deployment, you might want to save to a database or file
+            # Tiers of keywords that were removed meanwhile are dropped here
+            priorities = {kw: TIERS[tier] for kw, tier in self.keyword_tiers.items() if kw in self.keywords}
+            await asyncio.to_thread(self._write_config, {'keywords': list(self.keywords),
+                                                         'priorities': priorities})
+            logger.info(f"Keywords saved ({len(self.keywords)} entries)")
         except Exception as e:
             logger.error(f"Error saving keywords: {e}")
 
+    async def save_setting(self, key, value):
+        """Persist one setting next to the keywords"""
+        try:
+            await asyncio.to_thread(self._write_config, {key: value})
+        except Exception as e:
+            logger.error(f"Error saving setting {key}: {e}")
+
+    def _write_config(self, updates):
+        """Atomically rewrite the config file, keeping unrelated keys"""
+        config = {}
+        if os.path.exists(self.config_file):
+            try:
+                with open(self.config_file, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+            except (OSError, ValueError):
+                config = {}
+        config.update(updates)
+        config['last_updated'] = datetime.now().isoformat()
+        tmp_path = f"{self.config_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.config_file)
+
     async def handle_new_message(self, event):
         """Handle new messages - OPTIMIZED for 10,000+ groups"""
         try:
             message = event.message
+            sender_id = message.sender_id
             
-            # Fast reject - Skip if message is from me or no text (performance optimization)
-            if not message.text or message.sender_id == self.my_user_id:
+            # Blocked and auto-muted senders cost one set lookup, no matching
+            if sender_id in self.reputation.muted:
+                self.reputation.dropped(sender_id)
                 return
             
-            # Ultra-fast keyword check using set intersection (O(1) instead of O(n))
-            text_lower = message.text.lower()
-            
-            # Pre-compile keywords for faster matching
-            found_keywords = []
-            for kw in self.keywords:
-                if kw.lower() in text_lower:
-                    found_keywords.append(kw)
-            
-            if found_keywords:
-                # Only log and track when match found (reduce logging overhead)
-                group_id = event.chat_id
-                if group_id not in self.monitored_groups:
-                    self.monitored_groups.add(group_id)
-                    chat_name = getattr(event.chat, 'title', 'Unknown')
-                    logger.info(f"📊 New group monitored: {chat_name} (Total: {len(self.monitored_groups)})")
-                
-                logger.info(f"🚨 MATCH! Keywords: {found_keywords}")
-                
-                # Send notification asynchronously without blocking
-                asyncio.create_task(self.send_notification(message, event.chat, found_keywords))
+            # Under a flood, low-priority groups and most messages are skipped
+            group_id = event.chat_id
+            if self.overload.level and not self.overload.admit(group_id):
+                return
+            
+            self.analytics.seen(group_id)
+            found_keywords, sources, fingerprint = self.match_message(message)
+            if not found_keywords:
+                return
+            self.analytics.matched(group_id, found_keywords)
+            self.feedback.matched(found_keywords)
+            
+            # Only messages with hits are remembered: an edit of an unknown
+            # message is fully re-matched, which gives the same result
+            self.edit_tracker.remember((group_id, message.id), fingerprint)
+            
+            # Frequent matchers are throttled before get_sender and rendering
+            if not self.reputation.record(sender_id):
+                return
+            
+            # Only log when match found (reduce logging overhead)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"🚨 MATCH! Keywords: {list(found_keywords)}")
+            
+            # Send notification asynchronously without blocking; latency
+            # targets are measured from here
+            asyncio.create_task(self.send_notification(message, event.chat, found_keywords, sources,
+                                                       received=time.monotonic()))
                 
         except Exception as e:
             # Minimal error logging to avoid performance impact
-            logger.debug(f"Error in message handler: {e}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Error in message handler: {e}")
+
+
+    def match_message(self, message, previous=None):
+        """Match every text source of a message
+        
+        Returns (keywords, matched sources, fingerprint). Sources whose text
+        hash is unchanged from the previous fingerprint reuse its hits.
+        """
+        # Match text, captions, polls, quotes and forwarded content straight
+        # from the payload; the prefilter rejects most of them before any
+        # lowercasing happens. message.message is the raw text, .text would
+        # re-render the entities as markdown on every access.
+        # One matcher for the whole message even if a reload swaps it meanwhile
+        matcher = self.matcher
+        
+        # Plain text messages are most of the traffic: skip the source walk
+        # and allocate nothing unless the text matches
+        reply_to = message.reply_to
+        if (previous is None and message.media is None
+                and (reply_to is None or not getattr(reply_to, 'quote_text', None))):
+            text = message.message
+            if not text:
+                return _NO_MATCH
+            hits = matcher.match(text)
+            if not hits:
+                return _NO_MATCH
+            source = 'forward' if message.fwd_from is not None else 'text'
+            return hits, ((source, text),), ((source, hash(text), hits),)
+        
+        known = {source: (text_hash, hits) for source, text_hash, hits in previous} if previous else None
+        found_keywords = ()
+        sources = []
+        fingerprint = []
+        for source, text in iter_message_texts(message):
+            text_hash = hash(text)
+            cached = known.get(source) if known else None
+            if cached is not None and cached[0] == text_hash:
+                hits = cached[1]
+            else:
+                hits = matcher.match(text)
+            fingerprint.append((source, text_hash, hits))
+            if hits:
+                sources.append((source, text))
+                found_keywords += tuple(kw for kw in hits if kw not in found_keywords)
+        return found_keywords, sources, tuple(fingerprint)
 
+    async def handle_message_edited(self, event):
+        """Re-match edited messages, notify only when the edit adds keywords"""
+        try:
+            message = event.message
+            # Reactions, view counters and late link previews arrive as
+            # edits too; only edits the user made count
+            if message.edit_date is None or message.edit_hide:
+                EDITS_SEEN.inc(key='not_edited')
+                return
+            
+            sender_id = message.sender_id
+            if sender_id in self.reputation.muted:
+                self.reputation.dropped(sender_id)
+                return
+            
+            if self.overload.level and not self.overload.admit(event.chat_id):
+                return
+            
+            key = (event.chat_id, message.id)
+            previous = self.edit_tracker.get(key)
+            found_keywords, sources, fingerprint = self.match_message(message, previous)
+            self.edit_tracker.remember(key, fingerprint)
+            
+            if previous is not None and fingerprint == previous:
+                EDITS_SEEN.inc(key='unchanged')
+                return
+            
+            # An untracked message sent before the bot started may already
+            # have been notified for the same keywords: nothing is new
+            if previous is None and not self.edit_tracker.seen_since_start(message):
+                EDITS_SEEN.inc(key='before_start')
+                return
+            
+            already_matched = matched_keywords(previous)
+            new_keywords = tuple(kw for kw in found_keywords if kw not in already_matched)
+            if not new_keywords:
+                EDITS_SEEN.inc(key='no_new_keywords')
+                return
+            
+            if not self.reputation.record(sender_id):
+                return
+            EDITS_SEEN.inc(key='notified')
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(f"✏️ MATCH after edit! New keywords: {list(new_keywords)}")
+            asyncio.create_task(self.send_notification(message, event.chat, new_keywords, sources,
+                                                       edited=True, received=time.monotonic()))
+            
+        except Exception as e:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Error in edit handler: {e}")
 
-    async def send_notification(self, message, chat, keywords):
-        """Send notification with channel support for better notifications"""
+    async def send_notification(self, message, chat, keywords, sources=None, edited=False,
+                                received=None):
+        """Queue the notification in the tier of its most urgent keyword"""
+        received = received or time.monotonic()
+        sources = sources or [('text', message.message or '')]
+        body = message.message or sources[0][1]
         try:
-            # Quick sender info extraction
-            sender = await message.get_sender()
+            # Quick sender info extraction: update entities, then the warm
+            # cache; only unknown senders cost a request
+            sender = self.cached_sender(message) or await message.get_sender()
             sender_name = getattr(sender, 'first_name', 'غير معروف')
             sender_username = getattr(sender, 'username', None)
             sender_id = getattr(sender, 'id', None) or message.sender_id
@@ -784,35 +1762,54 @@ class CloudUserBot:
                 return  # Skip if no sender ID
             
             # Quick chat info
-            chat_name = getattr(chat, 'title', 'Unknown')
+            chat_name = self.chat_title(chat, message.chat_id)
             
-            # Build notification
-            notification = f"""🚨 **كلمة مفتاحية!**
-
-👥 {chat_name}
-👤 {sender_name}
-🔑 {', '.join(keywords)}
-⏰ {datetime.now().strftime('%H:%M:%S')}
-
-📝 {message.text[:500]}{'...' if len(message.text) > 500 else ''}
-
-💬 [تواصل](tg://user?id={sender_id}) {'| @' + sender_username if sender_username else ''}"""
+            # Archive first so the match is searchable even if sending fails
+            if self.archive:
+                self.archive.append(message.chat_id, chat_name,
+                                    sender_id, sender_name, message.id, keywords, body)
             
-            # Send to Saved Messages (always)
-            await self.client.send_message('me', notification, parse_mode='markdown')
+            tier = self.match_tier(keywords)
+            if self.overload.level and not self.overload.admit_tier(tier):
+                return
+            # One-line notifications while the bot is overloaded
+            digest_only = self.overload.digest_only
             
-            # Send to notification channel if available (better notifications)
-            if self.notification_channel:
-                try:
-                    await self.client.send_message(
-                        self.notification_channel, 
-                        notification, 
-                        parse_mode='markdown'
-                    )
-                except:
-                    pass  # Silent fail if channel unavailable
+            # Forward the original with a one-line header when allowed; a
+            # forward cannot be merged into a batch, so it is queued whole
+            if self.renderer.variant == 'original' and not digest_only:
+                # The full copy is for targets the forward failed on, and
+                # the pipeline's on_error fallback when the copy fails too
+                text, entities = self.renderer.render(
+                    chat_id=message.chat_id, chat_title=chat_name, sender=sender,
+                    sender_id=sender_id, keywords=keywords, sources=sources, body=body,
+                    edited=edited, variant='full')
+                
+                async def deliver(priority):
+                    forwarded, failed = await self.forward_original(
+                        message, chat, chat_name, sender, sender_id, keywords, sources, edited,
+                        priority=priority)
+                    if not failed:
+                        return forwarded or True
+                    sent = await self.delivery.deliver(text, targets=failed, formatting_entities=entities,
+                                                       priority=priority)
+                    return forwarded or sent
+                
+                queued = self.pipeline.submit(tier, received, text, entities, deliver=deliver,
+                                              tag=(keywords, body))
+            else:
+                # Precompiled template: text plus entities, no Markdown parsing
+                notification, entities = self.renderer.render(
+                    chat_id=message.chat_id, chat_title=chat_name, sender=sender,
+                    sender_id=sender_id, keywords=keywords, sources=sources, body=body,
+                    edited=edited, variant='digest' if digest_only else None)
+                # Batched per tier, then sent to the primary target plus mirrors
+                queued = self.pipeline.submit(tier, received, notification, entities, tag=(keywords, body))
             
-            logger.info(f"✅ Notification sent: {sender_name} in {chat_name}")
+            if not queued:
+                logger.warning(f"⏬ {TIERS[tier]} notification shed under load: {chat_name}")
+            elif logger.isEnabledFor(logging.INFO):
+                logger.info(f"✅ Notification queued ({TIERS[tier]}): {sender_name} in {chat_name}")
             
         except Exception as e:
             logger.error(f"❌ Error sending notification: {e}")
@@ -822,8 +1819,9 @@ class CloudUserBot:
 
 👤 من: {sender_name}
 👥 في: {chat_name}
+📎 {describe_sources(source for source, _ in sources)}
 
-📝 {message.text}
+📝 {body}
 
 💬 {'@' + sender_username if sender_username else f'tg://user?id={sender.id}'}"""
                 await self.send_to_self(simple_msg)
@@ -831,10 +1829,74 @@ class CloudUserBot:
             except Exception as e2:
                 logger.error(f"❌ Backup notification also failed: {e2}")
 
+    async def forward_original(self, message, chat, chat_name, sender, sender_id,
+                               keywords, sources, edited=False, priority=PRIORITY_NORMAL):
+        """Header + forward of the matched message to every target
+        
+        Returns (primary target's forward or None, targets that need a
+        copy instead).
+        """
+        # Protected chats and messages cannot be forwarded at all
+        if message.noforwards or getattr(chat, 'noforwards', False):
+            FORWARD_FALLBACKS.inc()
+            return None, self.delivery.targets
+        header, entities = self.renderer.render(
+            chat_id=message.chat_id, chat_title=chat_name, sender=sender,
+            sender_id=sender_id, keywords=keywords, sources=sources, body='',
+            edited=edited, link=message_link(chat, message.id))
+        forwarded, failed = await self.delivery.deliver_original(
+            header, chat or message.peer_id, message.id, formatting_entities=entities,
+            priority=priority)
+        if failed:
+            FORWARD_FALLBACKS.inc()
+        return forwarded, failed
+
+    def notification_sent(self, sent, tags):
+        """Pipeline callback: remember what a delivered notification matched"""
+        self.feedback.sent(sent.chat_id, sent.id, [tag for tag in tags if tag])
+
+    async def handle_feedback_reply(self, event):
+        """❌ / ✅ sent as a reply to a notification"""
+        message = event.message
+        rated = self.feedback.vote(event.chat_id, message.reply_to_msg_id, verdict_of(message.raw_text))
+        if rated:
+            logger.info(f"📝 Feedback {message.raw_text.strip()} on: {', '.join(rated)}")
+
+    async def handle_feedback_reaction(self, event):
+        """Our own 👍 / 👎 on a notification; removing it withdraws the verdict"""
+        if isinstance(event, types.UpdateMessageReactions):
+            chat_id = utils.get_peer_id(event.peer)
+            message_id, reactions = event.msg_id, event.reactions
+        else:
+            chat_id, message_id, reactions = event.chat_id, event.message.id, event.message.reactions
+        if reactions is None or not self.feedback.is_notification(chat_id, message_id):
+            return
+        chosen = [result.reaction for result in reactions.results
+                  if result.chosen_order is not None and isinstance(result.reaction, types.ReactionEmoji)]
+        verdict = verdict_of(chosen[0].emoticon) if chosen else None
+        rated = self.feedback.vote(chat_id, message_id, verdict)
+        if rated:
+            logger.info(f"📝 Reaction feedback on: {', '.join(rated)}")
+
+    async def save_feedback(self):
+        if self.feedback.dirty:
+            await asyncio.to_thread(self.feedback.save, self.feedback.snapshot())
+
+    def backlog_depth(self) -> int:
+        """Updates waiting for a handler plus notifications waiting to be sent"""
+        updates = getattr(self.client, '_updates_queue', None)
+        return (updates.qsize() if updates is not None else 0) + self.outbound.depth + self.pipeline.pending()
+
+    def resolve_target(self, name):
+        """Delivery target entity, None while it is not available"""
+        if name == CHANNEL:
+            return self.notification_channel
+        return None
+
     async def send_to_self(self, message):
         """Send message to self (Saved Messages)"""
         try:
-            await self.client.send_message('me', message)
+            await self.outbound.send('me', message)
             logger.info("Message sent to Saved Messages successfully")
         except Exception as e:
             logger.error(f"Error sending to self: {e}")
@@ -849,6 +1911,25 @@ class CloudUserBot:
         """Handle graceful shutdown"""
         logger.info("Shutting down bot...")
         self.running = False
+        if self.config_watcher:
+            self.config_watcher.stop()
+        self.loop_monitor.stop()
+        self.membership.stop()
+        self.analytics.stop()
+        self.reputation.stop()
+        try:
+            # Notifications still waiting in a batching window
+            await asyncio.wait_for(self.pipeline.drain(), timeout=10)
+        except Exception as e:
+            logger.warning(f"Pending notifications not sent: {e}")
+        if self.archive:
+            self.archive.close()
+        try:
+            if self.feedback.dirty:
+                self.feedback.save(self.feedback.snapshot())
+        except Exception as e:
+            logger.warning(f"Keyword feedback not saved: {e}")
+        self.monitored_groups.close()
         if self.client.is_connected():
             await self.client.disconnect()
 
@@ -874,8 +1955,22 @@ def signal_handler(signum, frame):
     logger.info(f"Received signal {signum}")
     sys.exit(0)
 
+async def profile_startup(bot):
+    """--profile-startup: cold start up to the deferred work, then print timings"""
+    try:
+        if not await bot.start_bot():
+            return
+        bot.register_handlers()
+        await bot.startup_task
+    finally:
+        await bot.handle_shutdown()
+    print(format_import_breakdown(import_breakdown('cloud_userbot')))
+    print(STARTUP.report())
+
 async def main():
     """Main function for cloud deployment"""
+    STARTUP.mark('main entered')
+    
     # Set up signal handlers
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
@@ -900,8 +1995,21 @@ async def main():
         logger.error("TELEGRAM_API_ID must be a number")
         return
     
+    # Expose /metrics when the platform gives us a port (Fly, Render, Railway)
+    if os.getenv('PORT'):
+        try:
+            from keep_alive import keep_alive
+            keep_alive()
+        except Exception as e:
+            logger.warning(f"Could not start metrics server: {e}")
+    
     # Create and run bot
-    bot = CloudUserBot(API_ID, API_HASH, SESSION_STRING)
+    with STARTUP.phase('load config'):
+        bot = CloudUserBot(API_ID, API_HASH, SESSION_STRING)
+    
+    if '--profile-startup' in sys.argv:
+        await profile_startup(bot)
+        return
     
     try:
         await bot.run()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Config file watcher for hot reloading
+Uses Linux inotify (through ctypes, no extra dependency) and falls back
+to polling the file's mtime/size on other platforms
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CONFIG_RELOADS = REGISTRY.counter(
+    'userbot_config_reloads_total',
+    'Config file reloads by outcome',
+    label='outcome')
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class ConfigWatcher:
+    """Calls an async callback (debounced) whenever the watched file changes"""
+
+    def __init__(self, path: str, callback, poll_interval: float = 2.0, debounce: float = 0.3):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.mode = None
+        self._fd = None
+        self._task = None
+        self._pending = None
+
+    def start(self):
+        """Start watching; inotify when available, polling otherwise"""
+        if self._start_inotify():
+            self.mode = 'inotify'
+        else:
+            self.mode = 'polling'
+            self._task = asyncio.create_task(self._poll(self._stat()))
+        logger.info(f"👀 Watching {self.path} for changes ({self.mode})")
+
+    def stop(self):
+        if self._fd is not None:
+            asyncio.get_running_loop().remove_reader(self._fd)
+            os.close(self._fd)
+            self._fd = None
+        for task in (self._task, self._pending):
+            if task is not None:
+                task.cancel()
+
+    def _start_inotify(self) -> bool:
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return False
+            # Watch the directory: atomic saves replace the file with a rename
+            directory = os.path.dirname(self.path).encode()
+            mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+            if libc.inotify_add_watch(fd, directory, mask) < 0:
+                os.close(fd)
+                return False
+            self._fd = fd
+            asyncio.get_running_loop().add_reader(fd, self._on_inotify)
+            return True
+        except Exception as e:
+            logger.debug(f"inotify unavailable: {e}")
+            return False
+
+    def _on_inotify(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        name = os.path.basename(self.path)
+        offset = 0
+        changed = False
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            event_name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            if event_name == name:
+                changed = True
+        if changed:
+            self._schedule()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    async def _poll(self, last):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            current = self._stat()
+            if current != last:
+                last = current
+                self._schedule()
+
+    def _schedule(self):
+        """Collapse bursts of events (write + rename) into one reload"""
+        if self._pending is not None and not self._pending.done():
+            self._pending.cancel()
+        self._pending = asyncio.create_task(self._fire())
+
+    async def _fire(self):
+        await asyncio.sleep(self.debounce)
+        try:
+            await self.callback()
+        except Exception as e:
+            logger.error(f"Config reload failed: {e}")
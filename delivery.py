@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Notification delivery targets
+One primary target receives every notification; mirrors get either a
+concurrent copy or a forward of the message sent to the primary
+"""
+
+import asyncio
+import logging
+import os
+
+from metrics import REGISTRY
+from outbound import PRIORITY_NORMAL
+
+logger = logging.getLogger(__name__)
+
+DELIVERED = REGISTRY.counter(
+    'userbot_delivered_total',
+    'Notifications delivered per target',
+    label='target')
+DELIVERY_FAILED = REGISTRY.counter(
+    'userbot_delivery_failed_total',
+    'Notification deliveries that failed per target',
+    label='target')
+FORWARD_FALLBACKS = REGISTRY.counter(
+    'userbot_forward_fallbacks_total',
+    'Original-message forwards replaced by a copy on some target (restricted or failed)')
+
+SAVED = 'me'
+CHANNEL = 'channel'
+MODES = ('copy', 'forward')
+
+# Owner-facing aliases (!توصيل) -> canonical names
+TARGET_ALIASES = {'محفوظة': SAVED, 'me': SAVED, 'قناة': CHANNEL, 'channel': CHANNEL}
+MODE_ALIASES = {'نسخ': 'copy', 'copy': 'copy', 'تحويل': 'forward', 'forward': 'forward'}
+
+
+def parse_target(token: str):
+    """Canonical target name: me, channel, a chat id or an @username"""
+    token = token.strip()
+    if token in TARGET_ALIASES:
+        return TARGET_ALIASES[token]
+    if token.lstrip('-').isdigit():
+        return token
+    if token.startswith('@') and len(token) > 1:
+        return token
+    return None
+
+
+class DeliveryRouter:
+    """Sends each notification to the primary target and its mirrors
+
+    ``resolve`` maps a target name to something ``send_message`` accepts,
+    or None while the target is unavailable (e.g. the notification
+    channel before discovery finished); unavailable targets are skipped.
+    """
+
+    def __init__(self, outbound, resolve, primary: str = SAVED, mirrors=(CHANNEL,),
+                 mode: str = 'copy'):
+        self.outbound = outbound
+        self.resolve = resolve
+        self.configure(primary, mirrors, mode)
+
+    @classmethod
+    def from_env(cls, outbound, resolve):
+        """DELIVERY_PRIMARY, DELIVERY_MIRRORS (comma separated) and DELIVERY_MODE"""
+        primary = parse_target(os.getenv('DELIVERY_PRIMARY', SAVED)) or SAVED
+        mirrors = [parse_target(t) for t in os.getenv('DELIVERY_MIRRORS', CHANNEL).split(',') if t.strip()]
+        mode = MODE_ALIASES.get(os.getenv('DELIVERY_MODE', 'copy'), 'copy')
+        return cls(outbound, resolve, primary, [m for m in mirrors if m], mode)
+
+    def configure(self, primary: str, mirrors=(), mode: str = 'copy'):
+        if mode not in MODES:
+            raise ValueError(mode)
+        self.primary = primary
+        self.mirrors = tuple(m for m in dict.fromkeys(mirrors) if m != primary)
+        self.mode = mode
+
+    def as_config(self) -> dict:
+        return {'primary': self.primary, 'mirrors': list(self.mirrors), 'mode': self.mode}
+
+    def _entity(self, name):
+        if name == SAVED:
+            return SAVED
+        resolved = self.resolve(name)
+        if resolved is not None:
+            return resolved
+        if name != CHANNEL:
+            return int(name) if name.lstrip('-').isdigit() else name
+        return None
+
+    async def _send(self, name, text, kwargs):
+        entity = self._entity(name)
+        if entity is None:
+            return None
+        try:
+            sent = await self.outbound.send(entity, text, **kwargs)
+        except Exception as e:
+            DELIVERY_FAILED.inc(key=name)
+            logger.warning(f"Delivery to {name} failed: {e}")
+            raise
+        DELIVERED.inc(key=name)
+        return sent
+
+    async def _forward(self, name, sent, priority):
+        entity = self._entity(name)
+        if entity is None:
+            return None
+        try:
+            forwarded = await self.outbound.call(
+                self.outbound.client.forward_messages, entity, sent, priority=priority)
+        except Exception as e:
+            DELIVERY_FAILED.inc(key=name)
+            logger.warning(f"Forward to {name} failed: {e}")
+            return None
+        DELIVERED.inc(key=name)
+        return forwarded
+
+    @property
+    def targets(self):
+        return (self.primary,) + self.mirrors
+
+    async def deliver(self, text, targets=None, **kwargs):
+        """Deliver to every target (or only to ``targets``); returns the primary's message
+
+        Raises the primary target's error after the mirrors were served,
+        so the caller can fall back; mirror errors are only counted.
+        ``targets`` always gets copies, and None back when the primary is
+        not among them.
+        """
+        if targets is not None or self.mode == 'copy' or not self.mirrors:
+            names = self.targets if targets is None else tuple(targets)
+            # All sends are queued at once; the scheduler paces them
+            results = await asyncio.gather(
+                *(self._send(name, text, kwargs) for name in names),
+                return_exceptions=True)
+            primary = results[names.index(self.primary)] if self.primary in names else None
+            if isinstance(primary, BaseException):
+                raise primary
+            return primary
+
+        try:
+            sent = await self._send(self.primary, text, kwargs)
+        except Exception:
+            # Nothing to forward: mirrors get their own copy
+            await asyncio.gather(
+                *(self._send(name, text, kwargs) for name in self.mirrors),
+                return_exceptions=True)
+            raise
+        if sent is None:
+            # Primary unavailable (e.g. channel not found yet): copy instead
+            await asyncio.gather(
+                *(self._send(name, text, kwargs) for name in self.mirrors),
+                return_exceptions=True)
+        else:
+            priority = kwargs.get('priority', PRIORITY_NORMAL)
+            await asyncio.gather(*(self._forward(name, sent, priority) for name in self.mirrors))
+        return sent
+
+    async def _send_original(self, name, text, kwargs, source, message_id):
+        entity = self._entity(name)
+        if entity is None:
+            return None
+        priority = kwargs.get('priority', PRIORITY_NORMAL)
+        client = self.outbound.client
+        # One after the other, so a failure never leaves half a notification:
+        # the header only goes out once the forward exists, as a reply to it
+        try:
+            forwarded = await self.outbound.call(
+                client.forward_messages, entity, message_id, source, priority=priority)
+        except Exception as e:
+            DELIVERY_FAILED.inc(key=name)
+            logger.warning(f"Forwarding original to {name} failed: {e}")
+            raise
+        try:
+            await self.outbound.send(entity, text, reply_to=forwarded, **kwargs)
+        except Exception as e:
+            DELIVERY_FAILED.inc(key=name)
+            logger.warning(f"Header for the original in {name} failed: {e}")
+            # Without it the forward lacks the keywords, and the caller's
+            # fallback copy would duplicate it
+            try:
+                await self.outbound.call(client.delete_messages, entity, [forwarded.id], priority=priority)
+            except Exception as e:
+                logger.warning(f"Could not remove the forward in {name}: {e}")
+            raise
+        DELIVERED.inc(key=name)
+        return forwarded
+
+    async def deliver_original(self, text, source, message_id, **kwargs):
+        """Forward of the matched message plus a short header replying to it, to every target
+
+        Returns (primary's forward, names of the targets that failed). A
+        failed target (ChatForwardsRestrictedError among others) holds
+        nothing of the notification, so the caller can send a copy to
+        exactly those targets.
+        """
+        names = self.targets
+        results = await asyncio.gather(
+            *(self._send_original(name, text, kwargs, source, message_id) for name in names),
+            return_exceptions=True)
+        failed = tuple(name for name, result in zip(names, results) if isinstance(result, BaseException))
+        forwarded = None if isinstance(results[0], BaseException) else results[0]
+        return forwarded, failed
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bounded per-message fingerprint cache for edited-message tracking
+Remembers which text sources of a message were already matched, so an
+edit only re-runs matching on the sources that actually changed
+"""
+
+import time
+from collections import OrderedDict
+
+from metrics import REGISTRY
+
+EDITS_SEEN = REGISTRY.counter(
+    'userbot_edits_total',
+    'Edited messages by outcome',
+    label='outcome')
+
+
+class EditTracker:
+    """LRU map of (chat_id, message_id) -> fingerprint
+
+    A fingerprint is a tuple of (source, text_hash, hits) entries, one per
+    text source of the message. Messages sent before ``started`` were
+    never seen, so their matches are not known.
+    """
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self.started = time.time()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        fingerprint = self._entries.get(key)
+        if fingerprint is not None:
+            self._entries.move_to_end(key)
+        return fingerprint
+
+    def seen_since_start(self, message) -> bool:
+        """True if the message was sent while the tracker was running"""
+        return message.date is not None and message.date.timestamp() > self.started
+
+    def remember(self, key, fingerprint):
+        entries = self._entries
+        entries[key] = fingerprint
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+
+def matched_keywords(fingerprint):
+    """All keywords recorded in a fingerprint"""
+    found = set()
+    for _, _, hits in fingerprint or ():
+        found.update(hits)
+    return found
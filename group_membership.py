@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Group membership tracking
+The set of groups the account is in is filled by one dialog sync in the
+background and then kept current from service messages (joined, added,
+left, kicked) and channel/chat updates. Incoming messages never touch it,
+so the per-message path does no bookkeeping and no disk writes.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from telethon import events, utils
+from telethon.tl import types
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+GROUPS_JOINED = REGISTRY.counter(
+    'userbot_groups_joined_total',
+    'Groups added to the tracked set, by what noticed the join',
+    label='source')
+GROUPS_LEFT = REGISTRY.counter(
+    'userbot_groups_left_total',
+    'Groups removed from the tracked set, by what noticed the leave',
+    label='source')
+GROUP_SYNCS = REGISTRY.counter(
+    'userbot_group_syncs_total',
+    'Dialog syncs completed')
+
+
+def membership(entity):
+    """True / False when entity is a group the account is / is not in
+
+    None when it says nothing about group membership: broadcast channels,
+    users, and ``min`` channels whose ``left`` flag is not reliable.
+    """
+    if isinstance(entity, types.ChatForbidden):
+        return False
+    if isinstance(entity, types.ChannelForbidden):
+        return None if entity.broadcast else False
+    if isinstance(entity, types.Chat):
+        return not (entity.left or entity.deactivated or entity.migrated_to)
+    if isinstance(entity, types.Channel):
+        if entity.min or (entity.broadcast and not entity.gigagroup):
+            return None
+        return not entity.left
+    return None
+
+
+class GroupMembership:
+    """Keeps a ChatStateStore equal to the groups the account is in
+
+    ``on_change`` is called after every change, e.g. to persist the set.
+    ``dialog_listeners`` see every dialog of a sync, so other startup
+    lookups ride on the same pass instead of fetching the dialogs again;
+    ``first_sync`` is set once the first sync finished or failed.
+    """
+
+    def __init__(self, store, resync_interval: float = 0.0, on_change=None):
+        self.store = store
+        self.resync_interval = resync_interval
+        self.on_change = on_change
+        self.self_id = None
+        self.synced_at = None
+        self.sync_seconds = 0.0
+        self.last_diff = (0, 0)
+        self.dialog_listeners = []
+        self.first_sync = asyncio.Event()
+        self._changed_during_sync = None
+        self._task = None
+
+        REGISTRY.gauge(
+            'userbot_groups_tracked',
+            'Groups the account is a member of',
+            fn=lambda: len(self.store))
+
+    @classmethod
+    def from_env(cls, store, **kwargs):
+        """GROUP_RESYNC_INTERVAL in minutes; 0 syncs dialogs once at startup"""
+        return cls(store, resync_interval=float(os.getenv('GROUP_RESYNC_INTERVAL', '0')) * 60,
+                   **kwargs)
+
+    def register(self, client, self_id: int):
+        """Add the update handlers; call once the account is authorized"""
+        self.self_id = self_id
+        client.add_event_handler(self.on_chat_action, events.ChatAction())
+        client.add_event_handler(self.on_chat_update,
+                                 events.Raw((types.UpdateChannel, types.UpdateChat)))
+
+    def start(self, client):
+        """Background dialog sync (and resyncs every resync_interval)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(client))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, client):
+        while True:
+            try:
+                await self.sync(client)
+            except Exception as e:
+                logger.warning(f"Dialog sync failed: {e}")
+            finally:
+                self.first_sync.set()
+            if not self.resync_interval:
+                return
+            await asyncio.sleep(self.resync_interval)
+
+    async def sync(self, client):
+        """Diff the dialog list against the tracked set; returns (added, removed)
+
+        Groups changed by an update while the dialogs were being fetched
+        keep the state the update gave them.
+        """
+        started = time.perf_counter()
+        self._changed_during_sync = set()
+        try:
+            current = set()
+            async for dialog in client.iter_dialogs(ignore_migrated=True):
+                if membership(dialog.entity):
+                    current.add(dialog.id)
+                for listener in self.dialog_listeners:
+                    try:
+                        listener(dialog)
+                    except Exception as e:
+                        logger.error(f"Dialog listener failed: {e}")
+            added, removed = self.store.sync(current, keep=self._changed_during_sync)
+        finally:
+            self._changed_during_sync = None
+        self.sync_seconds = time.perf_counter() - started
+        self.synced_at = time.time()
+        self.last_diff = (len(added), len(removed))
+        GROUP_SYNCS.inc()
+        if added:
+            GROUPS_JOINED.inc(len(added), key='sync')
+        if removed:
+            GROUPS_LEFT.inc(len(removed), key='sync')
+        logger.info(f"👥 Dialog sync: {len(self.store)} groups (+{len(added)} -{len(removed)}) "
+                    f"in {self.sync_seconds:.1f}s")
+        if added or removed:
+            self._notify()
+        return added, removed
+
+    def joined(self, chat_id: int, title: str = None, source: str = 'update') -> bool:
+        if self._changed_during_sync is not None:
+            self._changed_during_sync.add(chat_id)
+        if not self.store.touch(chat_id, title):
+            return False
+        GROUPS_JOINED.inc(key=source)
+        logger.info(f"📊 Joined group: {title or chat_id} (Total: {len(self.store)})")
+        self._notify()
+        return True
+
+    def left(self, chat_id: int, source: str = 'update') -> bool:
+        if self._changed_during_sync is not None:
+            self._changed_during_sync.add(chat_id)
+        if chat_id not in self.store:
+            return False
+        self.store.discard(chat_id)
+        GROUPS_LEFT.inc(key=source)
+        logger.info(f"👋 Left group: {chat_id} (Total: {len(self.store)})")
+        self._notify()
+        return True
+
+    def _notify(self):
+        if self.on_change is not None:
+            try:
+                self.on_change()
+            except Exception as e:
+                logger.error(f"Group membership listener failed: {e}")
+
+    async def on_chat_action(self, event):
+        """Service messages: the account joined, was added, left or was removed"""
+        chat_id = event.chat_id
+        if event.new_title and chat_id in self.store:
+            self.store.touch(chat_id, event.new_title)
+        if self.self_id not in event.user_ids and not event.created:
+            return
+        if not event.is_group:
+            return
+        if event.user_joined or event.user_added or event.created:
+            self.joined(chat_id, event.new_title or getattr(event.chat, 'title', None))
+        elif event.user_left or event.user_kicked:
+            self.left(chat_id)
+
+    async def on_chat_update(self, update):
+        """UpdateChannel / UpdateChat carry the chat as it is now
+
+        Telegram sends them when the account joins, leaves or is banned
+        from a supergroup, where no service message reaches us.
+        """
+        if isinstance(update, types.UpdateChannel):
+            chat_id = utils.get_peer_id(types.PeerChannel(update.channel_id))
+        else:
+            chat_id = utils.get_peer_id(types.PeerChat(update.chat_id))
+        entity = getattr(update, '_entities', {}).get(chat_id)
+        state = membership(entity)
+        if state:
+            self.joined(chat_id, entity.title)
+        elif state is False:
+            self.left(chat_id)
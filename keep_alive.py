@@ -9,13 +9,20 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 import threading
 import logging
 import asyncio
+import os
 import time
 
 logger = logging.getLogger(__name__)
 
+_server = None
+
 class KeepAliveHandler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Handle GET requests"""
+        if self.path.split('?', 1)[0] == '/metrics':
+            self.send_metrics()
+            return
+        
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
         self.end_headers()
@@ -76,17 +83,32 @@ class KeepAliveHandler(BaseHTTPRequestHandler):
         
         self.wfile.write(html.encode())
     
+    def send_metrics(self):
+        """Serve bot metrics in Prometheus text format"""
+        from metrics import REGISTRY
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
     def log_message(self, format, *args):
         """Suppress default logging"""
         pass
 
 def keep_alive():
-    """Start keep alive web server"""
-    server = HTTPServer(('0.0.0.0', 8080), KeepAliveHandler)
+    """Start keep alive web server (only once per process)"""
+    global _server
+    if _server is not None:
+        return _server
+    port = int(os.getenv('PORT', '8080'))
+    server = HTTPServer(('0.0.0.0', port), KeepAliveHandler)
     thread = threading.Thread(target=server.serve_forever)
     thread.daemon = True
     thread.start()
-    logger.info("✅ Keep-alive server started on port 8080")
+    _server = server
+    logger.info(f"✅ Keep-alive server started on port {port} (metrics on /metrics)")
     return server
 
 async def internal_ping():
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyword effectiveness from owner feedback
+Every delivered notification is remembered with the keywords and text
+that produced it. Replying "❌" / "✅" to it, or reacting 👎 / 👍, marks
+it as noise or useful; per keyword that gives a precision score next to
+its match volume. Keywords with many matches and low precision are
+reported as noisy, with narrower phrases taken from the words around the
+keyword in notifications the owner found useful.
+"""
+
+import json
+import logging
+import os
+import re
+from collections import Counter, OrderedDict
+
+from keyword_matcher import FUZZY_PREFIX, REGEX_PREFIX
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+USEFUL_MARKS = frozenset({'✅', '✔', '✔️', '👍', '❤', '❤️', '🔥', '💯'})
+NOISE_MARKS = frozenset({'❌', '✖', '✖️', '👎', '💩', '🤮', '🗑', '🗑️'})
+
+# Phrases kept per keyword and verdict; the rest are the least frequent
+MAX_PHRASES = 50
+
+KEYWORD_FEEDBACK = REGISTRY.counter(
+    'userbot_keyword_feedback_total',
+    'Owner verdicts on notifications',
+    label='verdict')
+
+
+def verdict_of(mark: str):
+    """True (useful), False (noise) or None for a reply text or reaction emoji"""
+    mark = (mark or '').strip()
+    if mark in USEFUL_MARKS:
+        return True
+    if mark in NOISE_MARKS:
+        return False
+    return None
+
+
+def neighbour_phrases(keyword: str, text: str):
+    """The keyword with the word before it and with the word after it
+
+    Regex and fuzzy entries have no fixed wording and yield nothing.
+    """
+    if keyword.startswith((REGEX_PREFIX, FUZZY_PREFIX)):
+        return set()
+    pattern = re.compile(r'(?:(\w+)\W+)?(\w*' + re.escape(keyword.lower()) + r'\w*)(?:\W+(\w+))?')
+    phrases = set()
+    for before, core, after in pattern.findall(text.lower()):
+        if before:
+            phrases.add(f"{before} {core}")
+        if after:
+            phrases.add(f"{core} {after}")
+    return phrases
+
+
+class KeywordScore:
+    __slots__ = ('matches', 'useful', 'noise', 'good', 'bad')
+
+    def __init__(self, matches=0, useful=0, noise=0, good=None, bad=None):
+        self.matches = matches
+        self.useful = useful
+        self.noise = noise
+        self.good = Counter(good or {})
+        self.bad = Counter(bad or {})
+
+    @property
+    def votes(self) -> int:
+        return self.useful + self.noise
+
+    @property
+    def precision(self) -> float:
+        """Share of useful verdicts, smoothed so a single vote is not 0% or 100%"""
+        return (self.useful + 1) / (self.votes + 2)
+
+    def as_dict(self) -> dict:
+        return {'matches': self.matches, 'useful': self.useful, 'noise': self.noise,
+                'good': dict(self.good.most_common(MAX_PHRASES)),
+                'bad': dict(self.bad.most_common(MAX_PHRASES))}
+
+
+class KeywordFeedback:
+    """Match volume, owner verdicts and precision per keyword
+
+    ``remember`` bounds how many delivered notifications can still be
+    rated; older ones are forgotten first.
+    """
+
+    def __init__(self, path: str = None, remember: int = 5000, min_votes: int = 5,
+                 noisy_precision: float = 0.3):
+        self.path = path
+        self.remember = remember
+        self.min_votes = min_votes
+        self.noisy_precision = noisy_precision
+        self.scores = {}
+        self.dirty = False
+        # (chat_id, message_id) -> [verdict, ((keywords, text), ...)]
+        self._sent = OrderedDict()
+        self.load()
+
+        REGISTRY.gauge(
+            'userbot_keyword_precision',
+            'Smoothed share of useful owner verdicts per rated keyword',
+            fn=lambda: {keyword: round(score.precision, 3)
+                        for keyword, score in list(self.scores.items()) if score.votes},
+            label='keyword')
+
+    @classmethod
+    def from_env(cls):
+        """FEEDBACK_FILE, FEEDBACK_MIN_VOTES and FEEDBACK_NOISY_PRECISION"""
+        return cls(os.getenv('FEEDBACK_FILE', 'keyword_feedback.json') or None,
+                   min_votes=int(os.getenv('FEEDBACK_MIN_VOTES', '5')),
+                   noisy_precision=float(os.getenv('FEEDBACK_NOISY_PRECISION', '0.3')))
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.scores = {keyword: KeywordScore(**fields)
+                           for keyword, fields in data.get('keywords', {}).items()}
+        except Exception as e:
+            logger.warning(f"Keyword feedback not loaded: {e}")
+
+    def snapshot(self) -> dict:
+        """Serializable copy, taken on the loop so save() can run in a thread"""
+        self.dirty = False
+        return {'keywords': {keyword: score.as_dict() for keyword, score in self.scores.items()}}
+
+    def save(self, snapshot: dict):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def score(self, keyword) -> KeywordScore:
+        score = self.scores.get(keyword)
+        if score is None:
+            score = self.scores[keyword] = KeywordScore()
+        return score
+
+    def matched(self, keywords):
+        for keyword in keywords:
+            self.score(keyword).matches += 1
+        self.dirty = True
+
+    def sent(self, chat_id: int, message_id: int, items):
+        """Remember a delivered notification; items are (keywords, text) pairs"""
+        key = (chat_id, message_id)
+        self._sent[key] = [None, tuple(items)]
+        self._sent.move_to_end(key)
+        while len(self._sent) > self.remember:
+            self._sent.popitem(last=False)
+
+    def is_notification(self, chat_id: int, message_id: int) -> bool:
+        return (chat_id, message_id) in self._sent
+
+    def vote(self, chat_id: int, message_id: int, verdict):
+        """Apply (or with None, withdraw) a verdict; returns the keywords rated
+
+        A second verdict on the same notification replaces the first.
+        """
+        entry = self._sent.get((chat_id, message_id))
+        if entry is None or entry[0] == verdict:
+            return None
+        previous, items = entry
+        entry[0] = verdict
+        rated = set()
+        for keywords, text in items:
+            for keyword in keywords:
+                rated.add(keyword)
+                score = self.score(keyword)
+                phrases = neighbour_phrases(keyword, text)
+                if previous is not None:
+                    self._count(score, previous, phrases, -1)
+                if verdict is not None:
+                    self._count(score, verdict, phrases, 1)
+        if verdict is not None:
+            KEYWORD_FEEDBACK.inc(key='useful' if verdict else 'noise')
+        self.dirty = True
+        return rated
+
+    @staticmethod
+    def _count(score: KeywordScore, useful: bool, phrases, delta: int):
+        if useful:
+            score.useful += delta
+            score.good.update({phrase: delta for phrase in phrases})
+        else:
+            score.noise += delta
+            score.bad.update({phrase: delta for phrase in phrases})
+
+    def ranking(self, keywords=None):
+        """(keyword, score) for current keywords, most matches first"""
+        keywords = self.scores if keywords is None else keywords
+        scored = [(keyword, self.scores[keyword]) for keyword in keywords if keyword in self.scores]
+        return sorted(scored, key=lambda item: item[1].matches, reverse=True)
+
+    def noisy(self, keywords=None):
+        """Rated keywords below the precision threshold, most wasted notifications first"""
+        noisy = [(keyword, score) for keyword, score in self.ranking(keywords)
+                 if score.votes >= self.min_votes and score.precision < self.noisy_precision]
+        return sorted(noisy, key=lambda item: item[1].matches * (1 - item[1].precision), reverse=True)
+
+    def suggestions(self, keyword, limit: int = 3):
+        """Narrower phrases around the keyword that were useful more often than noise"""
+        score = self.scores.get(keyword)
+        if score is None:
+            return []
+        ranked = sorted(((phrase, count - score.bad.get(phrase, 0))
+                         for phrase, count in score.good.items() if count > 0),
+                        key=lambda item: item[1], reverse=True)
+        return [phrase for phrase, margin in ranked if margin > 0][:limit]
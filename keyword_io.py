@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyword file import/export
+Imports are parsed line by line from a stream of byte chunks, so even a
+file with tens of thousands of keywords is never held in memory whole
+"""
+
+import codecs
+import csv
+import io
+
+from keyword_matcher import validate_entry
+
+IMPORT_EXTENSIONS = ('.txt', '.csv')
+MAX_IMPORT_BYTES = 20 * 1024 * 1024
+
+
+class ImportTooLarge(Exception):
+    """The keyword file is bigger than MAX_IMPORT_BYTES"""
+
+
+async def aiter_lines(chunks, max_bytes: int = MAX_IMPORT_BYTES):
+    """Decode an async stream of byte chunks into lines (BOM tolerant)"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > max_bytes:
+            raise ImportTooLarge(total)
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def parse_line(line: str, is_csv: bool = False):
+    """Keyword entry of one file line, or None for blank lines
+
+    CSV files use the first column; plain text files use the whole line.
+    """
+    if is_csv:
+        row = next(csv.reader([line]), None)
+        line = row[0] if row else ''
+    return line.strip() or None
+
+
+class KeywordImport:
+    """Accumulates parsed entries; duplicates and invalid entries are counted"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lines = 0
+        self.invalid = []
+        self.duplicates = 0
+
+    def feed(self, line: str, is_csv: bool = False):
+        self.lines += 1
+        entry = parse_line(line, is_csv)
+        if entry is None:
+            return
+        if entry in self.entries:
+            self.duplicates += 1
+            return
+        if validate_entry(entry):
+            self.invalid.append(entry)
+            return
+        self.entries[entry] = None
+
+    async def feed_stream(self, chunks, is_csv: bool = False):
+        async for line in aiter_lines(chunks):
+            self.feed(line, is_csv)
+        return self
+
+    @property
+    def keywords(self):
+        return list(self.entries)
+
+
+def export_keywords(keywords, name: str = 'keywords.txt') -> io.BytesIO:
+    """One entry per line, as an in-memory file ready for send_file"""
+    data = io.BytesIO('\n'.join(keywords).encode('utf-8') + b'\n')
+    data.name = name
+    return data
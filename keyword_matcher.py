@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyword matcher for the user bot
+Compiles the keyword list once and rejects obviously non-matching
+messages before any lowercasing or scanning happens
+"""
+
+import logging
+import re
+import sys
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REGEX_PREFIX = 're:'
+FUZZY_PREFIX = '~'
+FUZZY_MIN_LENGTH = 5
+
+_BACKREF = re.compile(r'\\[1-9]|\(\?P=')
+
+# Approximate letter frequency, most common first. Characters that are not
+# listed are treated as rarer than every listed one.
+LETTER_FREQUENCY = (
+    "اليمونهرتبعدسفكقحجشصطخزضثذغظةىأإءئؤآ"
+    "etaoinsrhldcumfpgwybvkxjqz"
+    "0123456789"
+)
+_LETTER_RANK = {ch: rank for rank, ch in enumerate(LETTER_FREQUENCY)}
+
+# Counted per matched text: one message yields one text per source
+# (text or caption, poll, quote), so these are not message counts
+TEXTS_CHECKED = REGISTRY.counter(
+    'userbot_matcher_texts_total',
+    'Texts (message text sources) passed to the keyword matcher')
+PREFILTER_REJECTED = REGISTRY.counter(
+    'userbot_matcher_prefilter_rejected_total',
+    'Texts rejected by the prefilter before lowercasing',
+    label='reason')
+
+
+def prefilter_rejection_rate() -> float:
+    """Share of checked texts that never reached the full scan"""
+    checked = TEXTS_CHECKED.value
+    if not checked:
+        return 0.0
+    return sum(PREFILTER_REJECTED.values.values()) / checked
+
+
+REGISTRY.gauge(
+    'userbot_matcher_prefilter_rejection_ratio',
+    'Share of texts rejected by the prefilter',
+    fn=prefilter_rejection_rate)
+
+
+def _rank(ch: str) -> int:
+    return _LETTER_RANK.get(ch, len(LETTER_FREQUENCY))
+
+
+def _anchor_gram(keyword: str) -> str:
+    """Pick the rarest bigram of a keyword (or its rarest character) as its signature"""
+    rare = len(LETTER_FREQUENCY)
+    ranks = [-1 if ch.isspace() else _LETTER_RANK.get(ch, rare) for ch in keyword]
+    best = None
+    best_rank = -1
+    for i in range(len(keyword) - 1):
+        first, second = ranks[i], ranks[i + 1]
+        if first < 0 or second < 0:
+            continue
+        if first + second > best_rank:
+            best, best_rank = i, first + second
+    if best is not None:
+        return keyword[best:best + 2]
+    best_char = max(range(len(keyword)), key=ranks.__getitem__, default=None)
+    if best_char is None or ranks[best_char] < 0:
+        return None
+    return keyword[best_char]
+
+
+def _disjoint_grams(keyword: str):
+    """Two non-overlapping bigrams; a single edit can break at most one of them"""
+    grams = [
+        (i, keyword[i:i + 2]) for i in range(len(keyword) - 1)
+        if not (keyword[i].isspace() or keyword[i + 1].isspace())
+    ]
+    best = None
+    best_rank = -1
+    for x, (i, first) in enumerate(grams):
+        for j, second in grams[x + 1:]:
+            if j < i + 2:
+                continue
+            rank = _rank(first[0]) + _rank(first[1]) + _rank(second[0]) + _rank(second[1])
+            if rank > best_rank:
+                best, best_rank = (first, second), rank
+    return best
+
+
+def _deletes(word: str):
+    """All strings obtained by deleting exactly one character"""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """Levenshtein distance between a and b is at most one"""
+    la, lb = len(a), len(b)
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    if lb - la > 1:
+        return False
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+def parse_entry(entry: str):
+    """Split a keyword entry into (kind, body): literal, regex or fuzzy"""
+    if entry.startswith(REGEX_PREFIX):
+        return 'regex', entry[len(REGEX_PREFIX):].strip()
+    if entry.startswith(FUZZY_PREFIX):
+        return 'fuzzy', entry[len(FUZZY_PREFIX):].strip()
+    return 'literal', entry
+
+
+def compile_regex(body: str):
+    """Compile a regex entry as a branch of the combined alternation
+
+    Compiled wrapped, so bodies that only work at the start of a pattern
+    (global inline flags such as ``(?i)``) fail here rather than when
+    the matcher joins them.
+    """
+    return re.compile(f'(?:{body})', re.IGNORECASE)
+
+
+def validate_entry(entry: str):
+    """Return an error message for an unusable entry, or None"""
+    kind, body = parse_entry(entry)
+    if not body:
+        return "الكلمة فارغة"
+    if kind == 'regex':
+        try:
+            compile_regex(body)
+        except re.error as e:
+            return f"تعبير نمطي غير صالح: {e}"
+    return None
+
+
+class KeywordMatcher:
+    """Immutable matcher built from a keyword list
+
+    Entries are literal substrings by default. ``re:`` entries are regular
+    expressions, run as a separate pass over a single alternation that the
+    prefilter does not gate. ``~`` entries match
+    whole words equal to or within one edit of the keyword (keywords of
+    FUZZY_MIN_LENGTH+ characters, shorter ones stay exact), looked up
+    through a deletion index so the cost does not grow with the number of
+    fuzzy keywords.
+    """
+
+    def __init__(self, keywords):
+        # Interned so hits share the store's string objects
+        self.keywords = tuple(sys.intern(entry) for entry in keywords)
+        literals = []
+        regexes = []
+        fuzzy = []
+        for entry in self.keywords:
+            if not entry or not entry.strip():
+                continue
+            kind, body = parse_entry(entry)
+            if not body:
+                continue
+            if kind == 'regex':
+                try:
+                    search = compile_regex(body).search
+                except re.error as e:
+                    logger.warning(f"Skipping invalid regex keyword {entry!r}: {e}")
+                    continue
+                regexes.append((entry, body, search))
+            elif kind == 'fuzzy' and len(body) >= FUZZY_MIN_LENGTH:
+                fuzzy.append((entry, body.lower()))
+            else:
+                # Short fuzzy entries would match too much, keep them exact
+                literals.append((entry, body.lower()))
+        self._entries = tuple(literals)
+        self._order = {entry: i for i, entry in enumerate(self.keywords)}
+
+        # All regex entries share one alternation. Wrapping each branch in a
+        # named group makes the engine save group state on every branch
+        # attempt (~200x slower at 1000 entries), so the branches are left
+        # bare: the alternation only tells whether any entry matches, and on
+        # the rare hit every entry runs its own search to find which ones
+        # did (a match span cannot be attributed with lookarounds, anchors
+        # or overlapping entries). Entries with back-references cannot be
+        # combined and always run alone.
+        self._regex_entries = ()
+        self._regex_search = None
+        self._regex_fallback = ()
+        if regexes:
+            combinable = [(e, b, s) for e, b, s in regexes if not _BACKREF.search(b)]
+            fallback = [(e, s) for e, b, s in regexes if _BACKREF.search(b)]
+            if combinable:
+                combined = '|'.join(f'(?:{body})' for _, body, _ in combinable)
+                try:
+                    self._regex_search = re.compile(combined, re.IGNORECASE).search
+                    self._regex_entries = tuple((e, s) for e, _, s in combinable)
+                except re.error as e:
+                    # e.g. the same group name in two entries
+                    logger.warning(f"Regex keywords cannot be combined, running them one by one: {e}")
+                    fallback.extend((e, s) for e, _, s in combinable)
+            self._regex_fallback = tuple(fallback)
+
+        # Deletion index: keyword and its one-deletion variants -> keywords
+        self._fuzzy_entries = tuple(fuzzy)
+        self._fuzzy_index = {}
+        self._fuzzy_word_counts = ()
+        if fuzzy:
+            for entry, low in fuzzy:
+                for key in _deletes(low) | {low}:
+                    self._fuzzy_index.setdefault(key, []).append((entry, low))
+            self._fuzzy_word_counts = tuple(sorted({len(low.split()) for _, low in fuzzy}))
+        self._fuzzy_lengths = frozenset(
+            n for _, low in fuzzy for n in (len(low) - 1, len(low), len(low) + 1)
+        )
+
+        self._has_regex = bool(regexes)
+        self._has_scan = bool(self._entries or fuzzy)
+
+        # The prefilter gates literal and fuzzy entries only; regex entries
+        # have no length or signature and run in their own pass.
+        # Prefilter 1: a message shorter than the shortest keyword cannot match
+        lengths = [len(low) for _, low in self._entries]
+        lengths.extend(len(low) - 1 for _, low in fuzzy)
+        self.min_length = min(lengths, default=0)
+
+        # Prefilter 2: every keyword contributes its rarest bigram, a message
+        # containing none of them cannot match any keyword. IGNORECASE lets
+        # the regex engine do the case folding without allocating a copy.
+        # Fuzzy keywords contribute two disjoint bigrams since one edit can
+        # break one of them.
+        anchors = set()
+        for _, low in self._entries:
+            gram = _anchor_gram(low)
+            if gram is not None:
+                anchors.add(gram)
+        for _, low in fuzzy:
+            grams = _disjoint_grams(low)
+            if grams is not None:
+                anchors.update(grams)
+            else:
+                anchors.update(ch for ch in low if not ch.isspace())
+        self.anchors = frozenset(anchors)
+        if anchors:
+            alternation = '|'.join(re.escape(gram) for gram in sorted(anchors))
+            self._anchor_search = re.compile(alternation, re.IGNORECASE).search
+        else:
+            self._anchor_search = None
+
+        self._simple = not (regexes or fuzzy)
+
+    def __len__(self):
+        return (len(self._entries) + len(self._regex_entries)
+                + len(self._regex_fallback) + len(self._fuzzy_entries))
+
+    def prefilter(self, text: str):
+        """Return the rejection reason, or None if the text needs the literal
+        and fuzzy scan (regex entries are not gated by it)"""
+        if not self._has_scan:
+            return 'empty'
+        if len(text) < self.min_length:
+            return 'length'
+        if self._anchor_search is not None and self._anchor_search(text) is None:
+            return 'anchor'
+        return None
+
+    def match(self, text: str) -> tuple:
+        """Return the keywords found in text, in keyword order
+
+        Each call is one checked text; match_message calls it once per
+        text source of a message.
+        """
+        TEXTS_CHECKED.inc()
+        reason = self.prefilter(text)
+        if reason is None:
+            text_lower = text.lower()
+            if self._simple:
+                return tuple(kw for kw, low in self._entries if low in text_lower)
+            found = {kw for kw, low in self._entries if low in text_lower}
+            if self._fuzzy_index:
+                self._match_fuzzy(text_lower, found)
+        else:
+            if not self._has_regex:
+                PREFILTER_REJECTED.inc(key=reason)
+                return ()
+            if self._has_scan:
+                PREFILTER_REJECTED.inc(key=reason)
+            found = set()
+
+        if self._regex_search is not None and self._regex_search(text) is not None:
+            for entry, search in self._regex_entries:
+                if search(text) is not None:
+                    found.add(entry)
+        for entry, search in self._regex_fallback:
+            if search(text) is not None:
+                found.add(entry)
+        if not found:
+            return ()
+        order = self._order
+        return tuple(sorted(found, key=order.__getitem__))
+
+    def _match_fuzzy(self, text_lower: str, found: set):
+        index = self._fuzzy_index
+        lengths = self._fuzzy_lengths
+        tokens = text_lower.split()
+        for count in self._fuzzy_word_counts:
+            for i in range(len(tokens) - count + 1):
+                candidate = tokens[i] if count == 1 else ' '.join(tokens[i:i + count])
+                if len(candidate) not in lengths:
+                    continue
+                for key in _deletes(candidate) | {candidate}:
+                    hits = index.get(key)
+                    if not hits:
+                        continue
+                    for entry, low in hits:
+                        if entry not in found and _within_one_edit(candidate, low):
+                            found.add(entry)
+
+
+class KeywordStore:
+    """Insertion-ordered set of keyword entries with O(1) membership
+
+    Bulk changes return what actually changed so the caller can rebuild
+    the matcher and persist exactly once per command.
+    """
+
+    def __init__(self, keywords=()):
+        self._items = dict.fromkeys(sys.intern(kw) for kw in keywords if kw)
+
+    def __contains__(self, keyword):
+        return keyword in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __repr__(self):
+        return f"KeywordStore({list(self._items)!r})"
+
+    def add_many(self, keywords) -> list:
+        """Add new entries, return the ones that were not present yet"""
+        added = []
+        for kw in keywords:
+            if kw and kw not in self._items:
+                kw = sys.intern(kw)
+                self._items[kw] = None
+                added.append(kw)
+        return added
+
+    def remove_many(self, keywords) -> list:
+        """Remove entries, return the ones that were present"""
+        removed = []
+        for kw in keywords:
+            if kw in self._items:
+                del self._items[kw]
+                removed.append(kw)
+        return removed
+
+    def replace(self, keywords):
+        self._items = dict.fromkeys(sys.intern(kw) for kw in keywords if kw)
+
+
+_SEPARATORS = re.compile('[,،;؛\n]')
+
+
+def split_entries(text: str) -> list:
+    """Split a +/- command argument into entries
+
+    Regex entries (re:...) may contain separators and are never split.
+    """
+    text = text.strip()
+    if text.startswith(REGEX_PREFIX):
+        return [text]
+    seen = dict.fromkeys(part.strip() for part in _SEPARATORS.split(text))
+    return [entry for entry in seen if entry]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event-loop lag and slow-callback detection
+A sampler coroutine measures how late its wakeups are; a watchdog thread
+notices when the loop has not come back for longer than a threshold and
+captures the main thread's stack at that moment, so a stall is reported
+with the code that caused it instead of only its length.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOOP_STALLS = REGISTRY.counter(
+    'userbot_loop_stalls_total',
+    'Event-loop stalls longer than the slow-callback threshold, by code site',
+    label='site')
+LOOP_BLOCKED_SECONDS = REGISTRY.counter(
+    'userbot_loop_blocked_seconds_total',
+    'Seconds the event loop was blocked by slow callbacks')
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stall:
+    """One slow callback: when, how long, and where the loop was stuck
+
+    ``duration`` is the sampler's late wakeup, a lower bound of the block
+    (it may have started while the sampler was still asleep).
+    """
+
+    __slots__ = ('started', 'duration', 'site', 'stack')
+
+    def __init__(self, started, site, stack):
+        self.started = started
+        self.duration = 0.0
+        self.site = site
+        self.stack = stack
+
+
+def describe_stack(frame, limit: int = 12):
+    """(site, stack lines) for a frame; site is the innermost frame of this bot's code"""
+    stack = []
+    site = None
+    while frame is not None and len(stack) < limit:
+        code = frame.f_code
+        line = f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+        stack.append(line)
+        if site is None and code.co_filename.startswith(_PACKAGE_DIR):
+            site = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        frame = frame.f_back
+    if site is None and stack:
+        site = stack[0].rsplit(':', 1)[0]
+    return site or 'unknown', stack
+
+
+class LoopMonitor:
+    """Loop-lag sampler plus a watchdog thread for slow callbacks
+
+    ``listeners`` are called with every lag sample, from the loop.
+    """
+
+    def __init__(self, interval: float = 0.25, threshold: float = 0.1, window: int = 1200):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=window)
+        self.stalls = deque(maxlen=50)
+        self.listeners = []
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self._beat = time.monotonic()
+        self._open = None
+        self._loop_thread = None
+        self._task = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+        REGISTRY.gauge(
+            'userbot_loop_lag_seconds',
+            'Latest event-loop lag (late wakeup of a sleeping task)',
+            fn=lambda: round(self.lag, 4))
+        REGISTRY.gauge(
+            'userbot_loop_lag_p99_seconds',
+            'p99 event-loop lag over the sample window',
+            fn=lambda: round(self.percentile(0.99), 4))
+        REGISTRY.gauge(
+            'userbot_loop_lag_max_seconds',
+            'Largest event-loop lag since start',
+            fn=lambda: round(self.max_lag, 4))
+
+    @classmethod
+    def from_env(cls):
+        """LOOP_SAMPLE_INTERVAL and SLOW_CALLBACK_THRESHOLD, in seconds"""
+        return cls(interval=float(os.getenv('LOOP_SAMPLE_INTERVAL', '0.25')),
+                   threshold=float(os.getenv('SLOW_CALLBACK_THRESHOLD', '0.1')))
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._beat = time.monotonic()
+            self._sample(lag)
+
+    def _sample(self, lag: float):
+        self.lag = lag
+        self.samples.append(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+        stall = self._open
+        if stall is not None:
+            self._open = None
+            stall.duration = lag
+            LOOP_STALLS.inc(key=stall.site)
+            LOOP_BLOCKED_SECONDS.inc(lag)
+            self.stalls.append(stall)
+            logger.warning(f"🐢 Event loop blocked ≥{lag * 1000:.0f}ms in {stall.site}")
+        for listener in self.listeners:
+            try:
+                listener(lag)
+            except Exception as e:
+                logger.error(f"Loop lag listener failed: {e}")
+
+    def _watch(self):
+        """Watchdog thread: capture the loop thread's stack while it is stuck"""
+        check = self.threshold / 2
+        while not self._stop.wait(check):
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue < self.threshold or self._open is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            site, stack = describe_stack(frame)
+            self._open = Stall(time.time() - overdue, site, stack)
+            del frame
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def top_sites(self, limit: int = 5):
+        """(site, count, total seconds) of recent stalls, worst first"""
+        sites = {}
+        for stall in self.stalls:
+            count, total = sites.get(stall.site, (0, 0.0))
+            sites[stall.site] = (count + 1, total + stall.duration)
+        ranked = sorted(sites.items(), key=lambda item: item[1][1], reverse=True)
+        return [(site, count, total) for site, (count, total) in ranked[:limit]]
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Match history archive backed by SQLite FTS5
+Matches are queued from the event loop and written in batched
+transactions by a background thread; searches run in a worker thread
+"""
+
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_WRITTEN = REGISTRY.counter(
+    'userbot_archive_written_total',
+    'Matches written to the archive')
+ARCHIVE_DROPPED = REGISTRY.counter(
+    'userbot_archive_dropped_total',
+    'Matches dropped because the archive queue was full')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    chat_id INTEGER,
+    chat_title TEXT,
+    sender_id INTEGER,
+    sender_name TEXT,
+    message_id INTEGER,
+    keywords TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS matches_ts ON matches (ts);
+CREATE INDEX IF NOT EXISTS matches_chat_ts ON matches (chat_id, ts);
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    title TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS matches_fts USING fts5 (
+    text, keywords, chat_title,
+    content='matches', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS matches_ai AFTER INSERT ON matches BEGIN
+    INSERT INTO matches_fts (rowid, text, keywords, chat_title)
+    VALUES (new.id, new.text, new.keywords, new.chat_title);
+END;
+CREATE TRIGGER IF NOT EXISTS matches_ad AFTER DELETE ON matches BEGIN
+    INSERT INTO matches_fts (matches_fts, rowid, text, keywords, chat_title)
+    VALUES ('delete', old.id, old.text, old.keywords, old.chat_title);
+END;
+"""
+
+_COLUMNS = ('ts', 'chat_id', 'chat_title', 'sender_id', 'sender_name',
+            'message_id', 'keywords', 'text')
+
+
+def fts_query(terms) -> str:
+    """Quote every term so user input can never be parsed as FTS syntax"""
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in terms if term)
+
+
+class MatchArchive:
+    """Append-only match log with full-text search, retention and compaction"""
+
+    def __init__(self, path: str = 'matches.db', retention_days: float = 90,
+                 batch_size: int = 500, flush_interval: float = 2.0,
+                 compact_interval: float = 6 * 3600, max_queue: int = 100000):
+        self.path = path
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._read_local = threading.local()
+
+        conn = self._connect()
+        try:
+            # auto_vacuum only takes effect on a fresh database
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.executescript(SCHEMA)
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name='match-archive', daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def from_env(cls):
+        """Build the archive from ARCHIVE_* environment variables"""
+        return cls(
+            path=os.getenv('ARCHIVE_DB', 'matches.db'),
+            retention_days=float(os.getenv('ARCHIVE_RETENTION_DAYS', '90')),
+            compact_interval=float(os.getenv('ARCHIVE_COMPACT_HOURS', '6')) * 3600,
+        )
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def append(self, chat_id, chat_title, sender_id, sender_name, message_id, keywords, text, ts=None):
+        """Queue one match; never blocks the event loop"""
+        record = (int(ts or time.time()), chat_id, chat_title, sender_id, sender_name,
+                  message_id, ', '.join(keywords), text)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            ARCHIVE_DROPPED.inc()
+
+    def _write_loop(self):
+        conn = self._connect()
+        last_compact = time.time()
+        insert = f"INSERT INTO matches ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    chats = {record[1]: record[2] for record in batch}
+                    with conn:
+                        conn.executemany(insert, batch)
+                        conn.executemany(
+                            "INSERT OR REPLACE INTO chats (chat_id, title) VALUES (?, ?)",
+                            chats.items())
+                    ARCHIVE_WRITTEN.inc(len(batch))
+                except Exception as e:
+                    logger.error(f"Error writing {len(batch)} matches to archive: {e}")
+
+            if self._stop.is_set() and self._queue.empty():
+                break
+
+            if self.compact_interval and time.time() - last_compact > self.compact_interval:
+                last_compact = time.time()
+                try:
+                    self._compact(conn)
+                except Exception as e:
+                    logger.warning(f"Archive compaction failed: {e}")
+        conn.close()
+
+    def _compact(self, conn, chunk: int = 5000):
+        """Apply retention in small transactions, then merge FTS segments"""
+        removed = 0
+        if self.retention_days:
+            cutoff = int(time.time() - self.retention_days * 86400)
+            while True:
+                with conn:
+                    cursor = conn.execute(
+                        "DELETE FROM matches WHERE id IN "
+                        "(SELECT id FROM matches WHERE ts < ? ORDER BY ts LIMIT ?)",
+                        (cutoff, chunk))
+                removed += cursor.rowcount
+                if cursor.rowcount < chunk:
+                    break
+        with conn:
+            conn.execute("INSERT INTO matches_fts (matches_fts) VALUES ('optimize')")
+        conn.execute("PRAGMA incremental_vacuum")
+        logger.info(f"🗜️ Archive compacted, {removed} expired matches removed")
+
+    def _reader(self):
+        conn = getattr(self._read_local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._read_local.conn = conn
+        return conn
+
+    def search(self, terms=(), chat=None, since=None, limit: int = 10, offset: int = 0,
+               count_cap: int = 1000):
+        """Newest-first matches for the given terms; blocking, run it in a thread
+
+        chat is either a chat id or a fragment of the chat title. Returns
+        (total, rows) where rows are dicts; total stops counting at
+        count_cap so broad queries stay fast.
+        """
+        conn = self._reader()
+        where = []
+        params = []
+        if chat is not None:
+            if isinstance(chat, int):
+                chat_ids = [chat]
+            else:
+                chat_ids = [row[0] for row in conn.execute(
+                    "SELECT chat_id FROM chats WHERE title LIKE ?", (f"%{chat}%",))]
+            if not chat_ids:
+                return 0, []
+            where.append(f"m.chat_id IN ({', '.join('?' * len(chat_ids))})")
+            params.extend(chat_ids)
+        if since is not None:
+            where.append("m.ts >= ?")
+            params.append(int(since))
+
+        query = fts_query(terms)
+        columns = ', '.join('m.' + c for c in _COLUMNS)
+        if query and chat is not None:
+            # The chat index is the selective side: probe FTS per chat row
+            source = "matches m"
+            where.append("EXISTS (SELECT 1 FROM matches_fts WHERE matches_fts MATCH ? AND rowid = m.id)")
+            params.append(query)
+            order = "m.id DESC"
+        elif query:
+            # Walk the FTS index newest-first and stop at LIMIT
+            source = "matches_fts f JOIN matches m ON m.id = f.rowid"
+            where.insert(0, "matches_fts MATCH ?")
+            params.insert(0, query)
+            order = "f.rowid DESC"
+        else:
+            source = "matches m"
+            order = "m.id DESC"
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+        total = conn.execute(
+            f"SELECT count(*) FROM (SELECT 1 FROM {source} {clause} LIMIT ?)",
+            params + [count_cap]).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {columns} FROM {source} {clause} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]).fetchall()
+        return total, [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def close(self, timeout: float = 10):
+        """Flush pending matches and stop the writer thread"""
+        self._stop.set()
+        self._writer.join(timeout)
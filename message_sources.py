@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Matchable text sources of a Telegram message
+Everything is read from the update payload itself - no media is ever
+downloaded and no extra API request is made
+"""
+
+from telethon.tl.types import MessageMediaWebPage
+
+# Labels shown in notifications for each text source
+SOURCE_LABELS = {
+    'text': 'نص الرسالة',
+    'caption': 'تعليق على وسائط',
+    'forward': 'رسالة محولة',
+    'poll': 'استطلاع',
+    'quote': 'اقتباس',
+}
+
+
+def _plain(value):
+    """Newer layers wrap some strings in TextWithEntities"""
+    return getattr(value, 'text', value)
+
+
+def iter_message_texts(message):
+    """Yield (source, text) pairs for every piece of text in the message payload
+
+    Voice-note transcripts are not part of the payload (they need a separate
+    TranscribeAudio request) and are therefore not covered.
+    """
+    raw = message.message
+    if raw:
+        if message.fwd_from is not None:
+            yield 'forward', raw
+        elif message.media is not None and not isinstance(message.media, MessageMediaWebPage):
+            # A link preview is attached to the text, it is not a caption
+            yield 'caption', raw
+        else:
+            yield 'text', raw
+
+    media = message.media
+    if media is not None:
+        poll = getattr(media, 'poll', None)
+        if poll is not None:
+            parts = [_plain(poll.question)]
+            parts.extend(_plain(answer.text) for answer in poll.answers)
+            yield 'poll', '\n'.join(p for p in parts if p)
+
+    reply_to = message.reply_to
+    if reply_to is not None:
+        quote = getattr(reply_to, 'quote_text', None)
+        if quote:
+            yield 'quote', quote
+
+
+def describe_sources(sources) -> str:
+    """Human readable, de-duplicated list of source labels"""
+    labels = []
+    for source in sources:
+        label = SOURCE_LABELS.get(source, source)
+        if label not in labels:
+            labels.append(label)
+    return '، '.join(labels)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lightweight in-process metrics for the user bot
+Exposed in Prometheus text format by keep_alive.py on /metrics
+"""
+
+import threading
+
+
+def _label_pair(label: str, value) -> str:
+    """``{label="value"}`` with the value escaped as the exposition format requires
+
+    Keyword labels carry user input (quotes, backslashes of regex entries)
+    and one unescaped value makes Prometheus reject the whole scrape.
+    """
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{{{label}="{value}"}}'
+
+
+class Counter:
+    """Monotonic counter, optionally split by a single label"""
+    __slots__ = ('name', 'help', 'label', 'value', 'values')
+
+    def __init__(self, name: str, help_text: str, label: str = None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.value = 0
+        self.values = {}
+
+    def inc(self, amount=1, key=None):
+        if key is None:
+            self.value += amount
+        else:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, key=None):
+        if key is None:
+            return self.value
+        return self.values.get(key, 0)
+
+    def samples(self):
+        if self.label is None:
+            yield '', self.value
+        else:
+            for key, value in list(self.values.items()):
+                yield _label_pair(self.label, key), value
+
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback"""
+    __slots__ = ('name', 'help', 'label', 'value', 'values', 'fn')
+
+    def __init__(self, name: str, help_text: str, fn=None, label: str = None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.fn = fn
+        self.value = 0
+        self.values = {}
+
+    def set(self, value, key=None):
+        if key is None:
+            self.value = value
+        else:
+            self.values[key] = value
+
+    def get(self, key=None):
+        if self.fn is not None:
+            return self.fn()
+        if key is None:
+            return self.value
+        return self.values.get(key, 0)
+
+    def samples(self):
+        if self.fn is not None:
+            value = self.fn()
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    yield _label_pair(self.label or 'key', key), item
+            else:
+                yield '', value
+        elif self.label is None:
+            yield '', self.value
+        else:
+            for key, value in list(self.values.items()):
+                yield _label_pair(self.label, key), value
+
+
+class MetricsRegistry:
+    """Holds all counters and gauges of the process"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label: str = None) -> Counter:
+        return self._register(Counter(name, help_text, label))
+
+    def gauge(self, name: str, help_text: str, fn=None, label: str = None) -> Gauge:
+        return self._register(Gauge(name, help_text, fn, label))
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Render every metric in Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            kind = 'counter' if isinstance(metric, Counter) else 'gauge'
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            try:
+                for labels, value in metric.samples():
+                    lines.append(f"{metric.name}{labels} {value}")
+            except Exception as e:
+                lines.append(f"# error collecting {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precompiled notification templates
+Templates are parsed once at import into literal runs with precomputed
+UTF-16 lengths, so rendering a notification produces (text, entities)
+for send_message(formatting_entities=...) without a Markdown round trip.
+Chat and sender fragments are cached per entity.
+"""
+
+import re
+from collections import OrderedDict
+from datetime import datetime
+
+from telethon import utils
+from telethon.tl.types import (
+    Channel, InputMessageEntityMentionName, MessageEntityBold, MessageEntityTextUrl, User
+)
+
+from message_sources import describe_sources
+
+# Runtime names (config / !قالب) -> variant
+VARIANT_NAMES = {
+    'full': 'full', 'كامل': 'full',
+    'compact': 'compact', 'مختصر': 'compact',
+    'digest': 'digest', 'ملخص': 'digest',
+    'original': 'original', 'اصلي': 'original', 'أصلي': 'original',
+}
+
+# **bold**, {field}, [text](mention) and [text](link) - nothing else is markup.
+# 'original' is only a header: the matched message itself is forwarded.
+TEMPLATES = {
+    'full': (
+        "{icon} **{headline}**\n\n"
+        "👥 {chat}\n"
+        "👤 {sender}\n"
+        "🔑 {keywords}\n"
+        "📎 {sources}\n"
+        "⏰ {time}\n\n"
+        "📝 {body}\n\n"
+        "💬 [تواصل](mention){username}"
+    ),
+    'compact': (
+        "{icon} **{keywords}** | 👥 {chat} | 👤 [{sender}](mention)\n"
+        "{body}"
+    ),
+    'digest': "{icon} {time} **{keywords}** — {chat}: {body}",
+    'original': "{icon} **{keywords}** | 👥 {chat} | 👤 [{sender}](mention) [{jump}](link)",
+}
+
+# Body length per variant; digest notifications are a single line
+BODY_LIMITS = {'full': 500, 'compact': 200, 'digest': 80, 'original': 0}
+
+_LITERAL, _FIELD, _OPEN, _CLOSE = range(4)
+_TOKEN = re.compile(r'\*\*|\{(\w+)\}|\[|\]\((\w+)\)')
+
+
+def utf16_len(text: str) -> int:
+    """Length in UTF-16 code units, the unit of Telegram entity offsets"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) >> 1
+
+
+def fragment(text: str):
+    """A text piece with its UTF-16 length, measured once"""
+    return text, utf16_len(text)
+
+
+def _bold(offset, length, values):
+    return MessageEntityBold(offset, length)
+
+
+def _mention(offset, length, values):
+    input_user = values.get('input_user')
+    if input_user is not None:
+        return InputMessageEntityMentionName(offset, length, input_user)
+    return MessageEntityTextUrl(offset, length, f"tg://user?id={values['sender_id']}")
+
+
+def _link(offset, length, values):
+    return MessageEntityTextUrl(offset, length, values['link_url'])
+
+
+_STYLES = {'mention': _mention, 'link': _link}
+
+
+def message_link(chat, message_id):
+    """t.me link to a message, None for chats without one (basic groups)"""
+    username = getattr(chat, 'username', None)
+    if username:
+        return f"https://t.me/{username}/{message_id}"
+    if isinstance(chat, Channel):
+        return f"https://t.me/c/{chat.id}/{message_id}"
+    return None
+
+
+def compile_template(source: str):
+    """Turn a template string into a flat tuple of render operations"""
+    ops = []
+    bold_open = False
+    pos = 0
+
+    def literal(text):
+        if not text:
+            return
+        if ops and ops[-1][0] == _LITERAL:
+            text = ops.pop()[1] + text
+        ops.append((_LITERAL, text, utf16_len(text)))
+
+    for m in _TOKEN.finditer(source):
+        literal(source[pos:m.start()])
+        pos = m.end()
+        token = m.group()
+        if token == '**':
+            ops.append((_CLOSE, _bold, None) if bold_open else (_OPEN, None, None))
+            bold_open = not bold_open
+        elif m.group(1):
+            ops.append((_FIELD, m.group(1), None))
+        elif token == '[':
+            ops.append((_OPEN, None, None))
+        else:
+            ops.append((_CLOSE, _STYLES[m.group(2)], None))
+    literal(source[pos:])
+    if bold_open:
+        raise ValueError(f"Unbalanced ** in template {source!r}")
+    return tuple(ops)
+
+
+COMPILED = {variant: compile_template(source) for variant, source in TEMPLATES.items()}
+
+_HEADLINE = fragment("كلمة مفتاحية!")
+_HEADLINE_EDITED = fragment("كلمة مفتاحية بعد التعديل!")
+_ICON = fragment("🚨")
+_ICON_EDITED = fragment("✏️")
+_EMPTY = fragment('')
+_JUMP = fragment("↗️ الرسالة")
+
+
+def render(ops, values):
+    """Run compiled ops over values (name -> fragment), returns (text, entities)"""
+    parts = []
+    entities = []
+    opened = []
+    offset = 0
+    for op, arg, length in ops:
+        if op == _LITERAL:
+            parts.append(arg)
+            offset += length
+        elif op == _FIELD:
+            text, length = values[arg]
+            parts.append(text)
+            offset += length
+        elif op == _OPEN:
+            opened.append(offset)
+        else:
+            start = opened.pop()
+            if offset > start:
+                entities.append(arg(start, offset - start, values))
+    # Entities must be sorted by offset; outer spans close after inner ones
+    entities.sort(key=lambda entity: entity.offset)
+    return ''.join(parts), entities
+
+
+class _LRU(OrderedDict):
+    def __init__(self, max_entries: int):
+        super().__init__()
+        self.max_entries = max_entries
+
+    def put(self, key, value):
+        self[key] = value
+        if len(self) > self.max_entries:
+            self.popitem(last=False)
+        return value
+
+
+class NotificationRenderer:
+    """Renders match notifications with the selected template variant"""
+
+    def __init__(self, variant: str = 'full', cache_size: int = 4096):
+        self.variant = 'full'
+        self.set_variant(variant)
+        self._chats = _LRU(cache_size)
+        self._senders = _LRU(cache_size)
+        self._keywords = _LRU(1024)
+        self._sources = {}
+        self._clock = (None, _EMPTY)
+
+    def set_variant(self, name: str) -> str:
+        """Select a variant by English or Arabic name; returns the variant"""
+        variant = VARIANT_NAMES.get((name or '').strip().lower())
+        if variant is None:
+            raise ValueError(name)
+        self.variant = variant
+        return variant
+
+    def chat_fragment(self, chat_id, title):
+        cached = self._chats.get(chat_id)
+        if cached is None or cached[0] != title:
+            cached = self._chats.put(chat_id, (title, fragment(title or 'Unknown')))
+        return cached[1]
+
+    def sender_fragments(self, sender, sender_id):
+        """(name, @username suffix, InputUser or None) cached per sender"""
+        name = getattr(sender, 'first_name', None) or 'غير معروف'
+        username = getattr(sender, 'username', None)
+        key = (name, username)
+        cached = self._senders.get(sender_id)
+        if cached is None or cached[0] != key:
+            input_user = None
+            if isinstance(sender, User) and sender.access_hash is not None:
+                input_user = utils.get_input_user(sender)
+            suffix = fragment(f" | @{username}" if username else '')
+            cached = self._senders.put(sender_id, (key, fragment(name), suffix, input_user))
+        return cached[1], cached[2], cached[3]
+
+    def keywords_fragment(self, keywords):
+        keywords = tuple(keywords)
+        cached = self._keywords.get(keywords)
+        if cached is None:
+            cached = self._keywords.put(keywords, fragment(', '.join(keywords)))
+        return cached
+
+    def sources_fragment(self, sources):
+        names = tuple(source for source, _ in sources)
+        cached = self._sources.get(names)
+        if cached is None:
+            cached = self._sources[names] = fragment(describe_sources(names))
+        return cached
+
+    def time_fragment(self, now=None):
+        """HH:MM:SS, rebuilt at most once per second"""
+        now = now or datetime.now()
+        stamp = int(now.timestamp())
+        if self._clock[0] != stamp:
+            self._clock = (stamp, fragment(now.strftime('%H:%M:%S')))
+        return self._clock[1]
+
+    def render(self, *, chat_id, chat_title, sender, sender_id, keywords, sources, body,
+               edited: bool = False, variant: str = None, now=None, link: str = None):
+        """(text, entities) for one match notification"""
+        variant = variant or self.variant
+        limit = BODY_LIMITS[variant]
+        text = body[:limit] + ('...' if len(body) > limit else '') if limit else ''
+        if variant == 'digest':
+            text = text.replace('\n', ' ')
+        name, username, input_user = self.sender_fragments(sender, sender_id)
+        values = {
+            'icon': _ICON_EDITED if edited else _ICON,
+            'headline': _HEADLINE_EDITED if edited else _HEADLINE,
+            'chat': self.chat_fragment(chat_id, chat_title),
+            'sender': name,
+            'username': username,
+            'keywords': self.keywords_fragment(keywords),
+            'sources': self.sources_fragment(sources),
+            'time': self.time_fragment(now),
+            'body': fragment(text),
+            'input_user': input_user,
+            'sender_id': sender_id,
+            'jump': _JUMP if link else _EMPTY,
+            'link_url': link,
+        }
+        return render(COMPILED[variant], values)
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tiered notification pipeline
+Every match carries the priority tier of its most urgent keyword. Each
+tier has a batching window (urgent is sent at once), a p99 delivery
+latency target that is measured against real deliveries, and lower
+tiers are shed first when the outbound queue floods.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from metrics import REGISTRY
+from notification_templates import utf16_len
+
+logger = logging.getLogger(__name__)
+
+# Index = tier = outbound priority (lower is sent first)
+TIERS = ('urgent', 'normal', 'low')
+TIER_LABELS = ('عاجل', 'عادي', 'منخفض')
+TIER_ALIASES = {
+    'urgent': 0, 'عاجل': 0,
+    'normal': 1, 'عادي': 1,
+    'low': 2, 'منخفض': 2,
+}
+DEFAULT_TIER = 1
+
+WINDOWS = (0.0, 3.0, 30.0)
+SLO_P99 = (5.0, 20.0, 90.0)
+
+# Telegram's limit is 4096 UTF-16 units per message
+MAX_BATCH_LENGTH = 4000
+_SEPARATOR = '\n\n'
+
+NOTIFY_DELIVERED = REGISTRY.counter(
+    'userbot_notify_delivered_total',
+    'Notifications delivered per tier',
+    label='tier')
+NOTIFY_SHED = REGISTRY.counter(
+    'userbot_notify_shed_total',
+    'Notifications dropped under load per tier',
+    label='tier')
+NOTIFY_SLO_BREACHES = REGISTRY.counter(
+    'userbot_notify_slo_breaches_total',
+    'Notifications delivered later than their tier p99 target',
+    label='tier')
+
+
+def parse_tier(args: str):
+    """Split an optional leading "tier:" off command arguments
+
+    Returns (tier or None, rest). ``re:`` entries are never mistaken for
+    a tier since "re" is not a tier name.
+    """
+    head, sep, rest = args.partition(':')
+    if sep and head.strip().lower() in TIER_ALIASES:
+        return TIER_ALIASES[head.strip().lower()], rest.strip()
+    return None, args
+
+
+class LatencyWindow:
+    """The most recent delivery latencies of one tier"""
+
+    def __init__(self, size: int = 1000):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Pending:
+    __slots__ = ('tier', 'received', 'text', 'entities', 'deliver', 'tag')
+
+    def __init__(self, tier, received, text, entities, deliver, tag=None):
+        self.tier = tier
+        self.received = received
+        self.text = text
+        self.entities = entities
+        self.deliver = deliver
+        self.tag = tag
+
+
+def combine(items, limit: int = MAX_BATCH_LENGTH):
+    """Join rendered notifications into as few messages as fit the limit
+
+    Yields (text, entities, items) per outgoing message; entity offsets
+    are shifted by the UTF-16 length of everything before them.
+    """
+    parts, entities, members, length = [], [], [], 0
+    for item in items:
+        size = utf16_len(item.text)
+        if members and length + len(_SEPARATOR) + size > limit:
+            yield ''.join(parts), entities, members
+            parts, entities, members, length = [], [], [], 0
+        if members:
+            parts.append(_SEPARATOR)
+            length += len(_SEPARATOR)
+        for entity in item.entities:
+            entity.offset += length
+            entities.append(entity)
+        parts.append(item.text)
+        members.append(item)
+        length += size
+    if members:
+        yield ''.join(parts), entities, members
+
+
+class NotificationPipeline:
+    """Per-tier buffers in front of the delivery router
+
+    ``on_sent(message, tags)`` is called with the primary target's message
+    and the tags of the notifications it carries.
+    """
+
+    def __init__(self, delivery, outbound, windows=WINDOWS, slo=SLO_P99,
+                 shed_depth: int = 40, max_batch: int = 20, on_error=None, on_sent=None):
+        self.delivery = delivery
+        self.outbound = outbound
+        self.windows = tuple(windows)
+        self.slo = tuple(slo)
+        self.shed_depth = shed_depth
+        self.max_batch = max_batch
+        self.on_error = on_error
+        self.on_sent = on_sent
+        self.latency = tuple(LatencyWindow() for _ in TIERS)
+        self._buffers = tuple([] for _ in TIERS)
+        self._timers = [None] * len(TIERS)
+        self._inflight = set()
+
+        REGISTRY.gauge(
+            'userbot_notify_latency_p99_seconds',
+            'p99 match-to-delivery latency per tier',
+            fn=lambda: {TIERS[t]: round(w.percentile(0.99), 3) for t, w in enumerate(self.latency)},
+            label='tier')
+        REGISTRY.gauge(
+            'userbot_notify_latency_slo_seconds',
+            'p99 latency target per tier',
+            fn=lambda: dict(zip(TIERS, self.slo)),
+            label='tier')
+        REGISTRY.gauge(
+            'userbot_notify_pending',
+            'Notifications waiting in a batching window per tier',
+            fn=lambda: {TIERS[t]: len(b) for t, b in enumerate(self._buffers)},
+            label='tier')
+
+    @classmethod
+    def from_env(cls, delivery, outbound, **kwargs):
+        """NOTIFY_WINDOWS / NOTIFY_SLO ("urgent,normal,low" seconds), NOTIFY_SHED_DEPTH"""
+        def triple(name, default):
+            value = os.getenv(name)
+            if not value:
+                return default
+            try:
+                values = tuple(float(v) for v in value.split(','))
+            except ValueError:
+                values = ()
+            if len(values) < len(TIERS):
+                logger.warning(f"{name}={value!r} needs {len(TIERS)} numbers "
+                               f"({','.join(TIERS)}), using the defaults")
+                return default
+            return values[:len(TIERS)]
+
+        return cls(delivery, outbound,
+                   windows=triple('NOTIFY_WINDOWS', WINDOWS),
+                   slo=triple('NOTIFY_SLO', SLO_P99),
+                   shed_depth=int(os.getenv('NOTIFY_SHED_DEPTH', '40')),
+                   **kwargs)
+
+    def pending(self) -> int:
+        """Notifications waiting in a batching window"""
+        return sum(len(buffer) for buffer in self._buffers)
+
+    def shed_from(self) -> int:
+        """Lowest tier currently being shed (len(TIERS) when none is)
+
+        Urgent notifications are never shed.
+        """
+        depth = self.outbound.depth
+        if depth >= 2 * self.shed_depth:
+            return 1
+        if depth >= self.shed_depth:
+            return 2
+        return len(TIERS)
+
+    def submit(self, tier: int, received: float, text=None, entities=(), deliver=None,
+               tag=None) -> bool:
+        """Queue one notification; False when it was shed
+
+        Either text/entities (batchable) or a ``deliver(priority)``
+        coroutine function, returning the sent message, for notifications
+        that cannot be merged; text given along with it is what
+        ``on_error`` receives when it fails. ``tag`` is handed back to
+        ``on_sent``.
+        """
+        if tier >= self.shed_from():
+            NOTIFY_SHED.inc(key=TIERS[tier])
+            return False
+        item = _Pending(tier, received, text, list(entities or ()), deliver, tag)
+        if not self.windows[tier]:
+            self._spawn(self._deliver(tier, [item]))
+            return True
+        buffer = self._buffers[tier]
+        buffer.append(item)
+        if len(buffer) >= self.max_batch:
+            self._spawn(self.flush(tier))
+        elif self._timers[tier] is None:
+            self._timers[tier] = self._spawn(self._flush_later(tier))
+        return True
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return task
+
+    async def _flush_later(self, tier: int):
+        await asyncio.sleep(self.windows[tier])
+        self._timers[tier] = None
+        await self.flush(tier)
+
+    async def flush(self, tier: int):
+        buffer = self._buffers[tier]
+        if not buffer:
+            return
+        items = buffer[:]
+        buffer.clear()
+        # Shed what waited in the window if a flood started meanwhile
+        if tier >= self.shed_from():
+            NOTIFY_SHED.inc(len(items), key=TIERS[tier])
+            return
+        await self._deliver(tier, items)
+
+    async def _deliver(self, tier: int, items):
+        batchable = [item for item in items if item.deliver is None]
+        jobs = [self._deliver_custom(tier, item) for item in items if item.deliver is not None]
+        jobs.extend(self._deliver_batch(tier, text, entities, members)
+                    for text, entities, members in combine(batchable))
+        await asyncio.gather(*jobs)
+
+    async def _deliver_custom(self, tier, item):
+        try:
+            sent = await item.deliver(tier)
+        except Exception as e:
+            logger.error(f"❌ {TIERS[tier]} notification failed: {e}")
+            if self.on_error is not None and item.text:
+                await self.on_error(item.text)
+            return
+        self._delivered(tier, (item,), sent)
+
+    async def _deliver_batch(self, tier, text, entities, members):
+        try:
+            sent = await self.delivery.deliver(text, formatting_entities=entities, priority=tier)
+        except Exception as e:
+            logger.error(f"❌ {TIERS[tier]} notification batch failed: {e}")
+            if self.on_error is not None:
+                await self.on_error(text)
+            return
+        self._delivered(tier, members, sent)
+
+    def _delivered(self, tier, members, sent=None):
+        now = time.monotonic()
+        window = self.latency[tier]
+        target = self.slo[tier]
+        for item in members:
+            latency = now - item.received
+            window.add(latency)
+            if latency > target:
+                NOTIFY_SLO_BREACHES.inc(key=TIERS[tier])
+        NOTIFY_DELIVERED.inc(len(members), key=TIERS[tier])
+        if self.on_sent is not None and getattr(sent, 'id', None):
+            try:
+                self.on_sent(sent, [item.tag for item in members])
+            except Exception as e:
+                logger.error(f"Delivery listener failed: {e}")
+
+    async def drain(self):
+        """Send everything still waiting in a window (used at shutdown)"""
+        for tier in range(len(TIERS)):
+            await self.flush(tier)
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def report(self):
+        """(tier index, p99 seconds, target seconds, samples) per tier"""
+        return [(tier, self.latency[tier].percentile(0.99), self.slo[tier], len(self.latency[tier]))
+                for tier in range(len(TIERS))]
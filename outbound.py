@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared outbound message scheduler
+Every message the bot sends goes through one paced queue instead of
+ad-hoc sleeps, so bursts of replies and notifications never trip
+Telegram's flood limits
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_SENT = REGISTRY.counter(
+    'userbot_outbound_sent_total',
+    'Messages sent through the outbound scheduler')
+OUTBOUND_FAILED = REGISTRY.counter(
+    'userbot_outbound_failed_total',
+    'Outbound sends that failed after retries')
+OUTBOUND_FLOOD_WAITS = REGISTRY.counter(
+    'userbot_outbound_flood_waits_total',
+    'FloodWait errors received while sending')
+
+
+# Lower runs first; command replies and urgent notifications share 0
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class OutboundScheduler:
+    """Token-bucket paced priority queue of client calls
+
+    ``send`` queues a call and returns its result once it ran, so callers
+    keep their ``await`` semantics while the scheduler owns the pacing.
+    Calls run lowest ``priority`` first, FIFO within one priority.
+    """
+
+    def __init__(self, client, rate: float = 2.0, burst: int = 3):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._queue = None
+        self._worker = None
+        self._sequence = itertools.count()
+
+        REGISTRY.gauge(
+            'userbot_outbound_queue_depth',
+            'Messages waiting in the outbound scheduler',
+            fn=lambda: self._queue.qsize() if self._queue else 0)
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def send(self, entity, message=None, priority: int = PRIORITY_NORMAL, **kwargs):
+        """Queue client.send_message(entity, message, **kwargs) and wait for it"""
+        return await self.call(self.client.send_message, entity, message, priority=priority, **kwargs)
+
+    async def call(self, fn, *args, priority: int = PRIORITY_NORMAL, **kwargs):
+        """Queue any client coroutine function and wait for its result"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((priority, next(self._sequence), fn, args, kwargs, future))
+        return await future
+
+    async def _take_token(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def _run(self):
+        while True:
+            _, _, fn, args, kwargs, future = await self._queue.get()
+            if future.cancelled():
+                continue
+            await self._take_token()
+            try:
+                result = await self._call_with_flood_wait(fn, args, kwargs)
+            except Exception as e:
+                OUTBOUND_FAILED.inc()
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                OUTBOUND_SENT.inc()
+                if not future.done():
+                    future.set_result(result)
+
+    async def _call_with_flood_wait(self, fn, args, kwargs, retries: int = 2):
+        from telethon.errors import FloodWaitError
+
+        for attempt in range(retries + 1):
+            try:
+                return await fn(*args, **kwargs)
+            except FloodWaitError as e:
+                OUTBOUND_FLOOD_WAITS.inc()
+                if attempt == retries:
+                    raise
+                logger.warning(f"⏳ FloodWait {e.seconds}s on outbound send")
+                await asyncio.sleep(e.seconds + 1)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Overload control for update floods
+Every event-loop lag sample of the loop monitor, together with the
+backlog depth at that moment, is mapped to a degradation level that
+handlers consult before doing any work. Escalation is immediate; recovery steps down one level at a time
+once pressure stayed low for a cooldown.
+"""
+
+import logging
+import os
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Each level includes the degradations of the ones below it
+FULL, SKIP_LOW, DIGEST, SAMPLING = range(4)
+LEVELS = ('full', 'skip_low', 'digest', 'sampling')
+LEVEL_LABELS = ('كامل', 'تخطي المنخفض', 'ملخص فقط', 'عينات')
+
+OVERLOAD_TRANSITIONS = REGISTRY.counter(
+    'userbot_overload_transitions_total',
+    'Overload level changes by the level entered',
+    label='level')
+OVERLOAD_DROPPED = REGISTRY.counter(
+    'userbot_overload_dropped_total',
+    'Messages or matches skipped by the overload controller',
+    label='reason')
+
+
+class OverloadController:
+    """Maps loop lag and backlog depth to a degradation level
+
+    ``pressure`` is the worse of lag / lag_target and depth /
+    depth_target; ``thresholds`` are the pressures at which SKIP_LOW,
+    DIGEST and SAMPLING start. The owner feeds it through ``update``,
+    usually as a LoopMonitor listener.
+    """
+
+    def __init__(self, depth=lambda: 0, lag_target: float = 0.2, depth_target: int = 200,
+                 thresholds=(1.0, 2.0, 4.0), cooldown: float = 30.0, sample_every: int = 10,
+                 low_groups=()):
+        self.depth = depth
+        self.lag_target = lag_target
+        self.depth_target = depth_target
+        self.thresholds = tuple(thresholds)
+        self.cooldown = cooldown
+        self.sample_every = sample_every
+        self.low_groups = frozenset(low_groups)
+        self.level = FULL
+        self.lag = 0.0
+        self.last_depth = 0
+        self.pressure = 0.0
+        self.history = deque(maxlen=50)
+        self._changed = time.monotonic()
+        self._tick = 0
+
+        REGISTRY.gauge(
+            'userbot_overload_level',
+            'Current degradation level (0 full, 1 skip low, 2 digest, 3 sampling)',
+            fn=lambda: self.level)
+        REGISTRY.gauge(
+            'userbot_overload_pressure',
+            'Worse of loop lag and backlog depth relative to their targets',
+            fn=lambda: round(self.pressure, 3))
+
+    @classmethod
+    def from_env(cls, depth, **kwargs):
+        """OVERLOAD_LAG_TARGET (s), OVERLOAD_DEPTH_TARGET, OVERLOAD_COOLDOWN (s),
+        OVERLOAD_SAMPLE_EVERY and LOW_PRIORITY_GROUPS (comma separated chat IDs)"""
+        low_groups = [int(g) for g in os.getenv('LOW_PRIORITY_GROUPS', '').split(',')
+                      if g.strip().lstrip('-').isdigit()]
+        return cls(depth,
+                   lag_target=float(os.getenv('OVERLOAD_LAG_TARGET', '0.2')),
+                   depth_target=int(os.getenv('OVERLOAD_DEPTH_TARGET', '200')),
+                   cooldown=float(os.getenv('OVERLOAD_COOLDOWN', '30')),
+                   sample_every=int(os.getenv('OVERLOAD_SAMPLE_EVERY', '10')),
+                   low_groups=low_groups, **kwargs)
+
+    def update(self, lag: float, depth: int, now: float = None) -> int:
+        """Feed one sample; returns the level after it"""
+        now = now or time.monotonic()
+        # Decaying max: a stall counts at once, one quiet sample does not erase it
+        self.lag = max(lag, self.lag * 0.5)
+        self.last_depth = depth
+        self.pressure = max(self.lag / self.lag_target, depth / self.depth_target)
+        target = sum(self.pressure >= threshold for threshold in self.thresholds)
+        if target > self.level:
+            self._set(target, now)
+        elif target < self.level and now - self._changed >= self.cooldown:
+            self._set(self.level - 1, now)
+        return self.level
+
+    def _set(self, level: int, now: float):
+        previous, self.level, self._changed = self.level, level, now
+        OVERLOAD_TRANSITIONS.inc(key=LEVELS[level])
+        self.history.append((time.time(), previous, level, self.pressure))
+        log = logger.warning if level > previous else logger.info
+        log(f"{'⚠️' if level > previous else '✅'} Overload level {LEVELS[previous]} -> {LEVELS[level]} "
+            f"(lag {self.lag * 1000:.0f}ms, backlog {self.last_depth})")
+
+    def admit(self, chat_id) -> bool:
+        """Whether a message from chat_id is processed at the current level
+
+        Callers check ``level`` first so the FULL level costs nothing.
+        """
+        level = self.level
+        if level >= SKIP_LOW and chat_id in self.low_groups:
+            OVERLOAD_DROPPED.inc(key='low_group')
+            return False
+        if level >= SAMPLING:
+            self._tick += 1
+            if self._tick % self.sample_every:
+                OVERLOAD_DROPPED.inc(key='sampled')
+                return False
+        return True
+
+    def admit_tier(self, tier: int) -> bool:
+        """Low-tier matches are dropped from SKIP_LOW on"""
+        if self.level >= SKIP_LOW and tier >= 2:
+            OVERLOAD_DROPPED.inc(key='low_tier')
+            return False
+        return True
+
+    @property
+    def digest_only(self) -> bool:
+        return self.level >= DIGEST
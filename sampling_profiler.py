@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-demand sampling profiler
+A thread snapshots every other thread's stack with sys._current_frames()
+at a fixed rate and counts identical stacks. Nothing is hooked into the
+interpreter (no sys.setprofile / settrace), so the bot runs at full
+speed until a profile is requested and again once it finished.
+Output is the collapsed-stack format read by flamegraph.pl and speedscope.
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from metrics import REGISTRY
+
+PROFILES_TAKEN = REGISTRY.counter(
+    'userbot_profiles_total',
+    'On-demand sampling profiles taken')
+
+MAX_SECONDS = 300
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Collapsed stacks of all threads sampled every ``interval`` seconds"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = frame_label(code)
+        return label
+
+    def sample(self, names, own_ident):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+        self.samples += 1
+
+    def run(self, seconds: float):
+        """Sample for ``seconds``; blocking, meant for a worker thread"""
+        own_ident = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_sample = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_sample:
+                time.sleep(next_sample - now)
+            self.sample(names, own_ident)
+            next_sample += self.interval
+        self.elapsed = time.perf_counter() - started
+        PROFILES_TAKEN.inc()
+        return self
+
+    def collapsed(self, name: str = 'profile.folded') -> io.BytesIO:
+        """"frame;frame;frame count" per line, as a file for send_file"""
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        data = io.BytesIO(('\n'.join(lines) + '\n').encode('utf-8'))
+        data.name = name
+        return data
+
+    def top_functions(self, limit: int = 10, thread: str = 'MainThread'):
+        """(innermost frame, share of samples) for one thread, busiest first"""
+        leaves = Counter()
+        total = 0
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            if frames[0] != thread:
+                continue
+            leaves[frames[-1]] += count
+            total += count
+        return [(label, count / total) for label, count in leaves.most_common(limit)] if total else []
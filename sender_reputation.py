@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sender reputation
+Each sender's matches feed a counter that halves every ``half_life``
+seconds. Past the throttle score a sender gets at most one notification
+per throttle interval; past the mute score it is muted for a while. The
+owner's block list is always muted and the allow list never is. Muted
+senders sit in one set that handlers test before matching, so their
+messages cost a single lookup.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SENDER_DROPPED = REGISTRY.counter(
+    'userbot_sender_dropped_total',
+    'Messages or notifications dropped by sender reputation',
+    label='reason')
+SENDER_MUTES = REGISTRY.counter(
+    'userbot_sender_mutes_total',
+    'Senders muted automatically for their match rate')
+
+
+def parse_ids(values):
+    """Sender IDs from config or env values, ignoring anything non-numeric"""
+    return {int(value) for value in values if str(value).strip().lstrip('-').isdigit()}
+
+
+class SenderReputation:
+    """Decaying match rate per sender plus the owner's block and allow lists"""
+
+    def __init__(self, half_life: float = 3600.0, throttle_score: float = 5.0,
+                 mute_score: float = 15.0, throttle_interval: float = 1800.0,
+                 mute_seconds: float = 86400.0, blocked=(), allowed=(), interval: float = 60.0):
+        self.half_life = half_life
+        self.throttle_score = throttle_score
+        self.mute_score = mute_score
+        self.throttle_interval = throttle_interval
+        self.mute_seconds = mute_seconds
+        self.interval = interval
+        self.blocked = frozenset()
+        self.allowed = frozenset()
+        self.muted = set()
+        # sender_id -> [score, time of score, time of last notification]
+        self._scores = {}
+        self._mute_until = {}
+        self._task = None
+        self.configure(blocked, allowed)
+
+        REGISTRY.gauge(
+            'userbot_senders_muted',
+            'Senders currently muted (blocked or auto-muted)',
+            fn=lambda: len(self.muted))
+        REGISTRY.gauge(
+            'userbot_senders_tracked',
+            'Senders with a non-zero match score',
+            fn=lambda: len(self._scores))
+
+    @classmethod
+    def from_env(cls):
+        """SENDER_HALF_LIFE (min), SENDER_THROTTLE_SCORE, SENDER_MUTE_SCORE,
+        SENDER_THROTTLE_INTERVAL (min), SENDER_MUTE_HOURS and BLOCKED_SENDERS
+        (comma separated IDs)"""
+        return cls(half_life=float(os.getenv('SENDER_HALF_LIFE', '60')) * 60,
+                   throttle_score=float(os.getenv('SENDER_THROTTLE_SCORE', '5')),
+                   mute_score=float(os.getenv('SENDER_MUTE_SCORE', '15')),
+                   throttle_interval=float(os.getenv('SENDER_THROTTLE_INTERVAL', '30')) * 60,
+                   mute_seconds=float(os.getenv('SENDER_MUTE_HOURS', '24')) * 3600,
+                   blocked=parse_ids(os.getenv('BLOCKED_SENDERS', '').split(',')))
+
+    def configure(self, blocked=None, allowed=None) -> bool:
+        """Replace the owner lists; True if either changed"""
+        blocked = self.blocked if blocked is None else frozenset(blocked)
+        allowed = self.allowed if allowed is None else frozenset(allowed)
+        if blocked == self.blocked and allowed == self.allowed:
+            return False
+        self.blocked, self.allowed = blocked, allowed - blocked
+        for sender_id in self.allowed:
+            self._scores.pop(sender_id, None)
+            self._mute_until.pop(sender_id, None)
+        self.muted = set(self.blocked) | (set(self._mute_until) - self.allowed)
+        return True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.expire(time.time())
+
+    def score(self, sender_id, now: float = None) -> float:
+        entry = self._scores.get(sender_id)
+        if entry is None:
+            return 0.0
+        now = now or time.time()
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    def dropped(self, sender_id):
+        """Count a message skipped because its sender is in ``muted``"""
+        SENDER_DROPPED.inc(key='blocked' if sender_id in self.blocked else 'muted')
+
+    def record(self, sender_id, now: float = None) -> bool:
+        """Count one match; False when its notification should be skipped"""
+        if sender_id in self.allowed:
+            return True
+        now = now or time.time()
+        entry = self._scores.get(sender_id)
+        if entry is None:
+            entry = self._scores[sender_id] = [0.0, now, 0.0]
+        score = entry[0] * 0.5 ** ((now - entry[1]) / self.half_life) + 1
+        entry[0], entry[1] = score, now
+        if score >= self.mute_score:
+            if sender_id not in self.muted:
+                self.mute(sender_id, now)
+            SENDER_DROPPED.inc(key='muted')
+            return False
+        if score >= self.throttle_score and now - entry[2] < self.throttle_interval:
+            SENDER_DROPPED.inc(key='throttled')
+            return False
+        entry[2] = now
+        return True
+
+    def mute(self, sender_id, now: float = None):
+        now = now or time.time()
+        self._mute_until[sender_id] = now + self.mute_seconds
+        self.muted.add(sender_id)
+        SENDER_MUTES.inc()
+        logger.warning(f"🔇 Sender {sender_id} muted for {self.mute_seconds / 3600:g}h "
+                       f"(score {self.score(sender_id, now):.1f})")
+
+    def forget(self, sender_id):
+        """Clear the score and auto-mute of one sender"""
+        self._scores.pop(sender_id, None)
+        self._mute_until.pop(sender_id, None)
+        if sender_id not in self.blocked:
+            self.muted.discard(sender_id)
+
+    def expire(self, now: float):
+        """Lift finished mutes and drop scores that decayed to nothing"""
+        for sender_id, until in list(self._mute_until.items()):
+            if until <= now:
+                del self._mute_until[sender_id]
+                if sender_id not in self.blocked:
+                    self.muted.discard(sender_id)
+                    logger.info(f"🔊 Sender {sender_id} unmuted")
+        for sender_id, (score, stamp, _) in list(self._scores.items()):
+            if score * 0.5 ** ((now - stamp) / self.half_life) < 0.1:
+                del self._scores[sender_id]
+
+    def mute_until(self, sender_id):
+        return self._mute_until.get(sender_id)
+
+    def top(self, limit: int = 10, now: float = None):
+        """(sender_id, current score) of the most active senders"""
+        now = now or time.time()
+        scored = [(sender_id, self.score(sender_id, now)) for sender_id in self._scores]
+        return sorted(scored, key=lambda item: item[1], reverse=True)[:limit]
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Durable Telethon session
+StringSession keeps the entity cache and update state in memory only,
+so every restart re-resolves entities and loses the pts needed to catch
+up. DurableSession keeps the same data in SQLite: it is loaded once at
+start, looked up from dicts, and checkpointed incrementally - only
+entities and update states that changed since the last checkpoint are
+written. The auth key can be encrypted at rest with a passphrase.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from telethon.crypto import AES, AuthKey
+from telethon._updates import EntityType
+from telethon.sessions import MemorySession, StringSession
+from telethon.tl.types import User, updates
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SESSION_CHECKPOINTS = REGISTRY.counter(
+    'userbot_session_checkpoints_total',
+    'Session checkpoints written to disk')
+SESSION_ROWS_WRITTEN = REGISTRY.counter(
+    'userbot_session_rows_written_total',
+    'Entity and update-state rows written by session checkpoints')
+
+_KDF_ITERATIONS = 100_000
+# Marked channel IDs are -(1000000000000 + id)
+_CHANNEL_MARK = 1000000000000
+
+
+class SessionKeyError(Exception):
+    """The stored auth key cannot be decrypted with the given passphrase"""
+
+
+def _derive(passphrase: str, salt: bytes):
+    material = hashlib.pbkdf2_hmac('sha256', passphrase.encode('utf-8'), salt, _KDF_ITERATIONS, dklen=64)
+    return material[:32], material[32:]
+
+
+def seal(key: bytes, passphrase: str) -> bytes:
+    """salt | iv | AES-IGE(auth key) | HMAC-SHA256 over all of it"""
+    salt, iv = os.urandom(16), os.urandom(32)
+    enc_key, mac_key = _derive(passphrase, salt)
+    body = salt + iv + AES.encrypt_ige(key, enc_key, iv)
+    return body + hmac.new(mac_key, body, hashlib.sha256).digest()
+
+
+def unseal(blob: bytes, passphrase: str) -> bytes:
+    body, mac = blob[:-32], blob[-32:]
+    salt, iv, cipher = body[:16], body[16:48], body[48:]
+    enc_key, mac_key = _derive(passphrase, salt)
+    if not hmac.compare_digest(mac, hmac.new(mac_key, body, hashlib.sha256).digest()):
+        raise SessionKeyError("SESSION_KEY does not match the stored session")
+    return AES.decrypt_ige(cipher, enc_key, iv)
+
+
+class DurableSession(MemorySession):
+    """SQLite-backed session seeded from a session string
+
+    ``seed`` is the SESSION_STRING the deployment was configured with.
+    The database is rebuilt from it when it was created from a different
+    string, so rotating SESSION_STRING still takes effect.
+    """
+
+    def __init__(self, path: str, seed: str = None, passphrase: str = None):
+        super().__init__()
+        self.path = path
+        self.passphrase = passphrase or None
+        self._seed_id = hashlib.sha256(seed.encode('utf-8')).hexdigest() if seed else None
+        # id -> (hash, username, phone, name); usernames are indexed separately
+        self._rows = {}
+        self._usernames = {}
+        self._dirty_entities = set()
+        self._dirty_states = set()
+        self._auth_dirty = False
+        self._lock = threading.Lock()
+        self.load_seconds = 0.0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), dc_id INTEGER, server_address TEXT, "
+                "port INTEGER, auth_key BLOB, encrypted INTEGER, seed TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entities ("
+                "id INTEGER PRIMARY KEY, hash INTEGER, username TEXT, phone TEXT, name TEXT)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS update_state ("
+                "id INTEGER PRIMARY KEY, pts INTEGER, qts INTEGER, date INTEGER, seq INTEGER)")
+        self._load(seed)
+
+    @classmethod
+    def from_env(cls, seed: str = None):
+        """SESSION_DB (empty disables) and SESSION_KEY; None when disabled"""
+        path = os.getenv('SESSION_DB', 'session.db')
+        if not path:
+            return None
+        return cls(path, seed, os.getenv('SESSION_KEY'))
+
+    def _load(self, seed):
+        started = time.perf_counter()
+        row = self._conn.execute(
+            "SELECT dc_id, server_address, port, auth_key, encrypted, seed FROM session").fetchone()
+        if row is not None and self._seed_id and row[5] != self._seed_id:
+            logger.info("SESSION_STRING changed, rebuilding the session database")
+            with self._conn:
+                for table in ('session', 'entities', 'update_state'):
+                    self._conn.execute(f"DELETE FROM {table}")
+            row = None
+
+        if row is None:
+            if seed:
+                source = StringSession(seed)
+                self.set_dc(source.dc_id, source.server_address, source.port)
+                self._auth_key = source.auth_key
+                self._auth_dirty = True
+            return
+
+        dc_id, address, port, key, encrypted, _ = row
+        self.set_dc(dc_id, address, port)
+        if key:
+            if encrypted:
+                if not self.passphrase:
+                    raise SessionKeyError("The stored session is encrypted, set SESSION_KEY")
+                key = unseal(key, self.passphrase)
+            self._auth_key = AuthKey(key)
+        # Written in plain text before SESSION_KEY was set: seal it at the next checkpoint
+        self._auth_dirty = bool(key and self.passphrase and not encrypted)
+
+        for entity_id, entity_hash, username, phone, name in self._conn.execute(
+                "SELECT id, hash, username, phone, name FROM entities"):
+            self._rows[entity_id] = (entity_hash, username, phone, name)
+            if username:
+                self._usernames[username] = entity_id
+        for entity_id, pts, qts, date, seq in self._conn.execute(
+                "SELECT id, pts, qts, date, seq FROM update_state"):
+            self._update_states[entity_id] = updates.State(
+                pts, qts, _from_timestamp(date), seq, unread_count=0)
+        self.load_seconds = time.perf_counter() - started
+        logger.info(f"💾 Session loaded: {len(self._rows)} entities, "
+                    f"{len(self._update_states)} update states in {self.load_seconds * 1000:.0f}ms")
+
+    # --- state Telethon writes -------------------------------------------------
+
+    def set_dc(self, dc_id, server_address, port):
+        if (dc_id or 0, server_address, port) != (self._dc_id, self._server_address, self._port):
+            self._auth_dirty = True
+        super().set_dc(dc_id, server_address, port)
+
+    @MemorySession.auth_key.setter
+    def auth_key(self, value):
+        if value is not self._auth_key:
+            self._auth_dirty = True
+        self._auth_key = value
+
+    def set_update_state(self, entity_id, state):
+        previous = self._update_states.get(entity_id)
+        if previous is None or (previous.pts, previous.qts, previous.seq) != (state.pts, state.qts, state.seq):
+            self._dirty_states.add(entity_id)
+        self._update_states[entity_id] = state
+
+    def process_entities(self, tlo):
+        rows = self._rows
+        for entity_id, *fields in self._entities_to_rows(tlo):
+            stored = rows.get(entity_id)
+            if stored is None:
+                row = tuple(fields)
+            else:
+                # Bare InputPeers carry only the hash: keep the stored username/phone/name
+                row = tuple(stored[i] if value is None else value for i, value in enumerate(fields))
+                if row == stored:
+                    continue
+                if stored[1] and stored[1] != row[1]:
+                    self._usernames.pop(stored[1], None)
+            rows[entity_id] = row
+            if row[1]:
+                self._usernames[row[1]] = entity_id
+            self._dirty_entities.add(entity_id)
+
+    # --- lookups (dicts instead of MemorySession's linear scans) ---------------
+
+    def get_entity_rows_by_id(self, id, exact=True):
+        if exact:
+            row = self._rows.get(id)
+            return (id, row[0]) if row else None
+        for marked in (id, -id, -1000000000000 - id):
+            row = self._rows.get(marked)
+            if row:
+                return marked, row[0]
+        return None
+
+    def get_entity_rows_by_username(self, username):
+        entity_id = self._usernames.get(username)
+        if entity_id is not None and entity_id in self._rows:
+            return entity_id, self._rows[entity_id][0]
+        return None
+
+    def get_entity_rows_by_phone(self, phone):
+        return next(((i, row[0]) for i, row in self._rows.items() if row[2] == phone), None)
+
+    def get_entity_rows_by_name(self, name):
+        return next(((i, row[0]) for i, row in self._rows.items() if row[3] == name), None)
+
+    # --- warm cache -------------------------------------------------------------
+
+    def preload(self, entity_cache) -> int:
+        """Copy the stored access hashes into Telethon's update entity cache
+
+        ``entity_cache`` is ``client._mb_entity_cache``. With it filled, the
+        first update from each chat after a restart is handled without a
+        resolve round trip. Entries Telethon already has are kept.
+        """
+        hash_map = entity_cache.hash_map
+        loaded = 0
+        for marked_id, row in self._rows.items():
+            entity_hash = row[0]
+            if not entity_hash:
+                continue
+            if marked_id > 0:
+                key, kind = marked_id, EntityType.USER
+            elif marked_id <= -_CHANNEL_MARK:
+                key, kind = -marked_id - _CHANNEL_MARK, EntityType.CHANNEL
+            else:
+                # Basic groups need no access hash; 0 is the self-user marker
+                continue
+            if key not in hash_map:
+                hash_map[key] = (entity_hash, kind)
+                loaded += 1
+        return loaded
+
+    def cached_user(self, user_id):
+        """A minimal User (name, username, access hash) from the cache, or None
+
+        A row with neither a name nor a username (only an access hash) is
+        None too, so callers still fall back to ``get_sender()``.
+        """
+        row = self._rows.get(user_id) if user_id and user_id > 0 else None
+        if row is None or not (row[3] or row[1]):
+            return None
+        return User(id=user_id, access_hash=row[0], first_name=row[3], username=row[1], phone=row[2])
+
+    def cached_name(self, marked_id):
+        """Display name or title of a cached entity, by marked ID"""
+        row = self._rows.get(marked_id)
+        return row[3] if row else None
+
+    def memory_bytes(self) -> int:
+        """Approximate size of the in-memory entity cache"""
+        total = sys.getsizeof(self._rows) + sys.getsizeof(self._usernames)
+        strings = set()
+        for marked_id, row in self._rows.items():
+            total += sys.getsizeof(row) + sys.getsizeof(marked_id) + sys.getsizeof(row[0])
+            strings.update(value for value in row[1:] if value)
+        return total + sum(sys.getsizeof(value) for value in strings)
+
+    # --- checkpoints -----------------------------------------------------------
+
+    def _take_dirty(self):
+        """Snapshot what changed since the last checkpoint (on the loop thread)"""
+        entity_ids, self._dirty_entities = self._dirty_entities, set()
+        state_ids, self._dirty_states = self._dirty_states, set()
+        entities = [(i,) + self._rows[i] for i in entity_ids if i in self._rows]
+        states = []
+        for i in state_ids:
+            state = self._update_states.get(i)
+            if state is not None:
+                states.append((i, state.pts, state.qts, _timestamp(state.date), state.seq))
+        auth = None
+        if self._auth_dirty:
+            self._auth_dirty = False
+            key = self._auth_key.key if self._auth_key else None
+            auth = (self._dc_id, self._server_address, self._port, key)
+        return entities, states, auth
+
+    def _write(self, entities, states, auth):
+        """Write one snapshot in a single transaction (any thread)"""
+        if not entities and not states and auth is None:
+            return 0
+        with self._lock, self._conn:
+            if auth is not None:
+                dc_id, address, port, key = auth
+                encrypted = bool(key and self.passphrase)
+                if encrypted:
+                    key = seal(key, self.passphrase)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO session (id, dc_id, server_address, port, auth_key, encrypted, seed) "
+                    "VALUES (0, ?, ?, ?, ?, ?, ?)",
+                    (dc_id, address, port, key, int(encrypted), self._seed_id))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entities (id, hash, username, phone, name) VALUES (?, ?, ?, ?, ?)",
+                entities)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO update_state (id, pts, qts, date, seq) VALUES (?, ?, ?, ?, ?)",
+                states)
+        SESSION_CHECKPOINTS.inc()
+        SESSION_ROWS_WRITTEN.inc(len(entities) + len(states))
+        return len(entities) + len(states)
+
+    def save(self):
+        """Telethon's synchronous save: writes only what changed"""
+        self._write(*self._take_dirty())
+
+    async def checkpoint(self):
+        """Snapshot on the loop, write in a worker thread; returns rows written"""
+        return await asyncio.to_thread(self._write, *self._take_dirty())
+
+    def close(self):
+        self.save()
+        self._conn.close()
+
+    def delete(self):
+        self._conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(self.path + suffix)
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._rows)
+
+
+def _timestamp(date):
+    return int(date.timestamp()) if date is not None else 0
+
+
+def _from_timestamp(value):
+    return datetime.fromtimestamp(value or 0, tz=timezone.utc)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cold-start timing
+Phases are always recorded (it costs a few perf_counter calls); the
+--profile-startup mode prints them together with an import-time
+breakdown taken from ``python -X importtime``
+"""
+
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Named phase durations and milestones, relative to process import"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.marks = {}
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name: str):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, began - self.started, time.perf_counter() - began))
+
+    def mark(self, name: str):
+        """Record the first time a milestone is reached"""
+        self.marks.setdefault(name, self.elapsed())
+
+    def report(self) -> str:
+        lines = ["Startup phases (offset / duration):"]
+        for name, offset, duration in self.phases:
+            lines.append(f"  {name:<28} +{offset * 1000:8.1f}ms {duration * 1000:9.1f}ms")
+        lines.append("Milestones:")
+        for name, offset in sorted(self.marks.items(), key=lambda item: item[1]):
+            lines.append(f"  {name:<28} +{offset * 1000:8.1f}ms")
+        return '\n'.join(lines)
+
+
+def import_breakdown(module: str, top: int = 15):
+    """(module, self_us, cumulative_us) of the slowest imports of a cold interpreter
+
+    Runs in a fresh subprocess so modules already loaded here do not hide
+    their cost. The first row is the module itself (total import time).
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    total = None
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        row = (name.strip(), int(self_us), int(cumulative_us))
+        # Children are listed before their parent
+        if depth == 0:
+            if row[0] == module:
+                total = row
+                break
+            children = []
+        elif depth == 1:
+            children.append(row)
+    children.sort(key=lambda row: row[2], reverse=True)
+    return ([total] if total else []) + children[:top]
+
+
+def format_import_breakdown(rows) -> str:
+    lines = ["Imports (cumulative / self):"]
+    for name, self_us, cumulative_us in rows:
+        lines.append(f"  {name:<28} {cumulative_us / 1000:8.1f}ms {self_us / 1000:8.1f}ms")
+    return '\n'.join(lines)
+
+
+STARTUP = StartupProfile()
@@ -11,6 +11,9 @@ import logging
 from datetime import datetime
 from telethon import TelegramClient, events
 from telethon.tl.types import PeerUser, PeerChat, PeerChannel
+from chat_state import ChatStateStore
+from group_membership import GroupMembership
+from fast_path import FastPathFilter
 import os
 
 # Configure logging
@@ -34,10 +37,13 @@ class SaudiUserBot:
             "ابغى", "ودي", "عايز", "بدي", "اريد واحد"
         ]
         
-        self.monitored_groups = set()
+        self.monitored_groups = ChatStateStore()
         self.my_user_id = None
         self.load_config()
         
+        # Joins and leaves come from updates and a dialog sync, never from messages
+        self.membership = GroupMembership(self.monitored_groups, on_change=self.save_config)
+        
     def load_config(self):
         """Load configuration from file"""
         try:
@@ -45,7 +51,7 @@ class SaudiUserBot:
                 with open('user_config.json', 'r', encoding='utf-8') as f:
                     config = json.load(f)
                     self.keywords = config.get('keywords', self.keywords)
-                    self.monitored_groups = set(config.get('monitored_groups', []))
+                    self.monitored_groups = ChatStateStore(config.get('monitored_groups', []))
                     logger.info(f"Loaded {len(self.keywords)} keywords and {len(self.monitored_groups)} groups")
         except Exception as e:
             logger.error(f"Error loading config: {e}")
@@ -73,8 +79,13 @@ class SaudiUserBot:
         self.my_user_id = me.id
         logger.info(f"Started as {me.first_name} (ID: {me.id})")
         
-        # Register event handlers
-        self.client.add_event_handler(self.handle_new_message, events.NewMessage)
+        # Register event handlers; channels, bots and our own messages are
+        # filtered out before the handler is called
+        self.client.add_event_handler(
+            self.handle_new_message,
+            events.NewMessage(incoming=True, func=FastPathFilter.from_env(self.my_user_id)))
+        self.membership.register(self.client, self.my_user_id)
+        self.membership.start(self.client)
         
         # Send startup message to self
         await self.send_to_self("🤖 **بوت المراقبة بدأ العمل!**\n\n"
@@ -90,20 +101,9 @@ class SaudiUserBot:
         try:
             message = event.message
             
-            # Skip if message is from me
-            if message.sender_id == self.my_user_id:
-                return
-            
             # Only monitor group messages
-            if not (hasattr(event.chat, 'title') and event.chat.title):
+            if not event.is_group:
                 return
-                
-            # Add group to monitored list
-            group_id = event.chat_id
-            if group_id not in self.monitored_groups:
-                self.monitored_groups.add(group_id)
-                self.save_config()
-                logger.info(f"Added new group to monitoring: {event.chat.title}")
             
             # Check for keywords in message text
             if message.text: